@@ -1,15 +1,63 @@
-from src.state_manager import StateManager
-from src.data_logger import DataLogger
-from src.window_monitor import WindowMonitor
-from src.gui import SimpleGUI
+import sys
+from src.cli import build_parser
 
-def main():
-    state_manager = StateManager()
-    data_logger = DataLogger()
-    window_monitor = WindowMonitor()
+def run_gui(args):
+    # Imported here so CLI commands don't need the GUI or window backend dependencies
+    from src.state_manager import StateManager
+    from src.data_logger import DataLogger
+    from src.window_monitor import WindowMonitor
+    from src.gui import SimpleGUI
+    from src.live_stats import LiveStats
+    from src.event_bus import EventBus
+    from src.profiling import Profiler, ProfilerControlServer, install_signal_handler, count_widgets
+
+    # Tracking events for consumers beyond the log, each on its own bounded queue
+    event_bus = EventBus()
+    state_manager = StateManager(event_bus=event_bus)
+    data_logger = DataLogger(retention_days=args.retention_days)
+    if args.monitor_process:
+        # Sample windows in a child process so GUI load can't delay or freeze sampling
+        from src.process_monitor import ProcessWindowMonitor
+        window_monitor = ProcessWindowMonitor(event_bus=event_bus)
+    else:
+        window_monitor = WindowMonitor(event_bus=event_bus)
+    live_stats = LiveStats()
+    live_stats.seed_from_log(data_logger.log_file, data_logger.sessions_file)
+    window_monitor.add_segment_listener(live_stats)
+    trace_recorder = None
+    if args.record_trace:
+        from src.trace_replay import TraceRecorder
+        trace_recorder = TraceRecorder(args.record_trace)
+        trace_recorder.attach(state_manager, window_monitor)
     
-    app = SimpleGUI(state_manager, data_logger, window_monitor)
+    # Profiling can be switched on at any time; until then it costs a comparison per second
+    profiler = Profiler()
+    window_monitor.profiler = profiler
+    signal_name = install_signal_handler(profiler)
+    control_server = ProfilerControlServer(profiler, args.profile_port) if args.profile_port else None
+    if args.profile:
+        profiler.request("start")
+    if signal_name:
+        print(f"Send {signal_name} to start or stop profiling")
+
+    app = SimpleGUI(state_manager, data_logger, window_monitor, live_stats, profiler)
+    profiler.add_gauge("unique window titles", lambda: len(data_logger.unique_window_titles))
+    profiler.add_gauge("Tk widgets", lambda: count_widgets(app))
+    profiler.add_gauge("live stats titles", lambda: len(live_stats.title_seconds))
+    profiler.add_gauge("queued events", lambda: sum(metrics["depth"] for metrics in event_bus.metrics()))
     app.mainloop()
+    if control_server:
+        control_server.close()
+    event_bus.close()
+    if trace_recorder:
+        trace_recorder.close()
+
+def main():
+    args = build_parser().parse_args()
+    if args.command:
+        return args.handler(args)
+    run_gui(args)
+    return 0
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
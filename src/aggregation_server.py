@@ -0,0 +1,269 @@
+"""Optional central ingestion server that collects window logs from many trackers.
+
+Each tracker's DataLogger uploads gzip-compressed JSON batches to POST /ingest.
+Rows are appended to per-client, per-day CSV partitions and folded into in-memory
+(client, day, tag, executable) totals, so GET /aggregate answers across all users
+without rescanning rows.
+
+Run it with:  python -m src.aggregation_server --port 8765 --storage server_data
+"""
+import argparse
+import csv
+import gzip
+import json
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from .constants import DENORMALIZED_LOG_COLUMNS
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_STORAGE_DIR = "server_data"
+
+_CLIENT_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+# Identifies a client's spool; batch sequence numbers restart with every new spool (epoch)
+_EPOCH_PATTERN = re.compile(r"^[A-Za-z0-9]{0,64}$")
+# Rows are partitioned by the day their datetime_start begins with
+_DAY_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}")
+GROUP_BY_FIELDS = ("client", "day", "tag", "exe_name")
+
+
+def parse_batch(batch):
+    """Return (client_id, epoch, batch_seq, rows) of a decoded batch, or raise ValueError describing what is wrong.
+
+    Everything the store relies on is checked up front, so a bad batch is rejected
+    as a whole before any of it is written.
+    """
+    if not isinstance(batch, dict):
+        raise ValueError("batch must be an object")
+    client_id = batch.get("client_id")
+    if not isinstance(client_id, str) or not _CLIENT_ID_PATTERN.match(client_id):
+        raise ValueError("invalid client_id")
+    epoch = batch.get("epoch", "")  # Batches of uploaders from before epochs have none
+    if not isinstance(epoch, str) or not _EPOCH_PATTERN.match(epoch):
+        raise ValueError("invalid epoch")
+    try:
+        batch_seq = int(batch.get("batch_seq"))
+    except (TypeError, ValueError):
+        raise ValueError("invalid batch_seq")
+    rows = batch.get("rows")
+    if not isinstance(rows, list):
+        raise ValueError("rows must be a list")
+    for i, row in enumerate(rows):
+        if not isinstance(row, dict):
+            raise ValueError(f"row {i} must be an object")
+        if not isinstance(row.get("datetime_start"), str) or not _DAY_PATTERN.match(row["datetime_start"]):
+            raise ValueError(f"row {i}: invalid datetime_start")
+        if not isinstance(row.get("tag"), str):
+            raise ValueError(f"row {i}: invalid tag")
+        try:
+            float(row.get("duration_seconds") or 0)
+        except (TypeError, ValueError):
+            raise ValueError(f"row {i}: invalid duration_seconds")
+    return client_id, epoch, batch_seq, rows
+
+
+def _upgrade_partition(path):
+    """Rewrite a partition written with fewer columns (e.g. before window metadata was uploaded)
+    with the current header, so appended rows line up with it"""
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        if next(csv.reader(f), None) == DENORMALIZED_LOG_COLUMNS:
+            return
+        f.seek(0)
+        rows = list(csv.DictReader(f))
+    with open(path + ".tmp", 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=DENORMALIZED_LOG_COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(path + ".tmp", path)
+
+
+class AggregationStore:
+    """Per-client partitioned row storage plus running (client, day, tag, exe_name) totals"""
+
+    def __init__(self, storage_dir):
+        self.storage_dir = storage_dir
+        os.makedirs(self.storage_dir, exist_ok=True)
+        self._client_locks = {}
+        self._client_locks_lock = threading.Lock()
+        self._totals_lock = threading.Lock()
+        self.totals = {}  # (client, day, tag, exe_name) -> [seconds, rows]
+        self.last_seq = {}  # client -> {epoch: last stored batch_seq}
+        self._load()
+
+    def _client_dir(self, client_id):
+        return os.path.join(self.storage_dir, client_id)
+
+    def _client_lock(self, client_id):
+        with self._client_locks_lock:
+            return self._client_locks.setdefault(client_id, threading.Lock())
+
+    def _load(self):
+        """Rebuild sequence numbers and totals from the partitions on disk (once, at startup)"""
+        for client_id in os.listdir(self.storage_dir):
+            client_dir = self._client_dir(client_id)
+            if not os.path.isdir(client_dir):
+                continue
+            seq_path = os.path.join(client_dir, "last_seq.json")
+            legacy_seq_path = os.path.join(client_dir, "last_seq")
+            if os.path.exists(seq_path):
+                with open(seq_path, 'r') as f:
+                    self.last_seq[client_id] = json.load(f)
+            elif os.path.exists(legacy_seq_path):
+                with open(legacy_seq_path, 'r') as f:
+                    self.last_seq[client_id] = {"": int(f.read().strip() or 0)}
+            for name in sorted(os.listdir(client_dir)):
+                if not name.endswith(".csv"):
+                    continue
+                with open(os.path.join(client_dir, name), 'r', newline='', encoding='utf-8') as f:
+                    self._add_totals(client_id, csv.DictReader(f))
+        print(f"Aggregation store loaded {len(self.last_seq)} clients from {self.storage_dir}")
+
+    def _add_totals(self, client_id, rows):
+        with self._totals_lock:
+            for row in rows:
+                # Rows from trackers (or partitions) without window metadata have no executable
+                key = (client_id, row["datetime_start"][:10], row["tag"], row.get("exe_name") or "")
+                entry = self.totals.setdefault(key, [0.0, 0])
+                entry[0] += float(row["duration_seconds"] or 0)
+                entry[1] += 1
+
+    def ingest(self, client_id, epoch, batch_seq, rows):
+        """Append a batch and return (accepted, last stored sequence number of the epoch).
+
+        Sequence numbers count per epoch, so a client that lost its spool starts a new
+        epoch rather than having its batches taken for duplicates. A batch at or below
+        the epoch's last sequence number was stored before and is ignored.
+        """
+        with self._client_lock(client_id):
+            seqs = self.last_seq.get(client_id, {})
+            if batch_seq <= seqs.get(epoch, 0):
+                return False, seqs[epoch]
+            client_dir = self._client_dir(client_id)
+            os.makedirs(client_dir, exist_ok=True)
+
+            by_day = {}
+            for row in rows:
+                by_day.setdefault(row["datetime_start"][:10], []).append(row)
+            for day, day_rows in by_day.items():
+                path = os.path.join(client_dir, f"{day}.csv")
+                is_new = not os.path.exists(path)
+                if not is_new:
+                    _upgrade_partition(path)
+                with open(path, 'a', newline='', encoding='utf-8') as f:
+                    writer = csv.DictWriter(f, fieldnames=DENORMALIZED_LOG_COLUMNS, extrasaction='ignore')
+                    if is_new:
+                        writer.writeheader()
+                    writer.writerows(day_rows)
+
+            # Record the sequence number only after the rows are on disk
+            seqs = {**seqs, epoch: batch_seq}
+            seq_path = os.path.join(client_dir, "last_seq.json")
+            with open(seq_path + ".tmp", 'w') as f:
+                json.dump(seqs, f)
+            os.replace(seq_path + ".tmp", seq_path)
+            self.last_seq[client_id] = seqs
+        self._add_totals(client_id, rows)
+        return True, batch_seq
+
+    def aggregate(self, group_by=("tag",), since=None, until=None, clients=None):
+        """Sum seconds and rows over (client, day, tag, exe_name) totals, grouped by the given fields"""
+        indexes = [GROUP_BY_FIELDS.index(field) for field in group_by]
+        groups = {}
+        with self._totals_lock:
+            for key, (seconds, rows) in self.totals.items():
+                client_id, day = key[:2]
+                if (since and day < since) or (until and day > until) or (clients and client_id not in clients):
+                    continue
+                group_key = tuple(key[i] for i in indexes)
+                entry = groups.setdefault(group_key, [0.0, 0])
+                entry[0] += seconds
+                entry[1] += rows
+        result = []
+        for group_key, (seconds, rows) in sorted(groups.items()):
+            item = dict(zip(group_by, group_key))
+            item["seconds"] = round(seconds)
+            item["rows"] = rows
+            result.append(item)
+        return result
+
+
+class IngestionRequestHandler(BaseHTTPRequestHandler):
+    # Set by make_server
+    store = None
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/ingest":
+            return self._send_json(404, {"error": "not found"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length)
+            if self.headers.get("Content-Encoding") == "gzip":
+                body = gzip.decompress(body)
+            client_id, epoch, batch_seq, rows = parse_batch(json.loads(body))
+        except (ValueError, OSError, EOFError) as e:
+            # Rejected rather than dropped, so the uploader doesn't retry it as a network error
+            return self._send_json(400, {"error": f"invalid batch: {e}"})
+
+        accepted, last_seq = self.store.ingest(client_id, epoch, batch_seq, rows)
+        # Not accepted means stored before (e.g. the response to an earlier attempt got lost)
+        self._send_json(200, {"batch_seq": batch_seq, "accepted": accepted, "duplicate": not accepted,
+                              "last_seq": last_seq, "rows": len(rows) if accepted else 0})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != "/aggregate":
+            return self._send_json(404, {"error": "not found"})
+        query = parse_qs(url.query)
+        group_by = tuple(query.get("group_by", ["tag"])[0].split(","))
+        if not all(field in GROUP_BY_FIELDS for field in group_by):
+            return self._send_json(400, {"error": f"group_by must be a subset of {', '.join(GROUP_BY_FIELDS)}"})
+        clients = set(query["client"][0].split(",")) if "client" in query else None
+        groups = self.store.aggregate(
+            group_by,
+            since=query.get("since", [None])[0],
+            until=query.get("until", [None])[0],
+            clients=clients,
+        )
+        self._send_json(200, {"groups": groups})
+
+    def log_message(self, format, *args):
+        # Keep the console quiet; one line per request would dominate at high batch rates
+        pass
+
+
+def make_server(host=DEFAULT_HOST, port=DEFAULT_PORT, storage_dir=DEFAULT_STORAGE_DIR):
+    """Create (but don't start) a threaded server; port 0 picks a free port, useful for tests"""
+    handler = type("BoundIngestionRequestHandler", (IngestionRequestHandler,), {"store": AggregationStore(storage_dir)})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Aggregation server for window logs from many trackers")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--storage", default=DEFAULT_STORAGE_DIR, help="Directory for per-client partitions")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.storage)
+    print(f"Aggregation server listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
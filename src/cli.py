@@ -0,0 +1,175 @@
+import argparse
+import os
+from .constants import (
+    LOG_FILE, UNIQUE_WINDOWS_FILE, SESSIONS_FILE, SEARCH_INDEX_FILE,
+    RETENTION_DAYS, RETENTION_DEFAULT_DAYS, RETENTION_RESOLUTION, RETENTION_HOURLY, RETENTION_DAILY, PROFILE_CONTROL_PORT
+)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Window Monitor time tracker. Without a command, the GUI is started.")
+    parser.add_argument("--monitor-process", action="store_true",
+                        help="Sample the active window in a separate process (GUI only)")
+    parser.add_argument("--record-trace", metavar="TRACE_FILE",
+                        help="Append state changes and window switches to a trace for 'replay' (GUI only)")
+    parser.add_argument("--retention-days", type=int, default=RETENTION_DAYS,
+                        help="Summarize log rows older than this many days in the background "
+                             "(GUI only, default: keep every row)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile the GUI and monitor threads from startup; a report is written on exit (GUI only)")
+    parser.add_argument("--profile-port", type=int, metavar="PORT",
+                        help="Accept 'profile' commands on this localhost port (GUI only)")
+    subparsers = parser.add_subparsers(dest="command")
+
+    search_parser = subparsers.add_parser("search", help="Search window titles, notes and break reasons in the log")
+    search_parser.add_argument("query", help="Text to look for (case-insensitive substring)")
+    search_parser.add_argument("--fuzzy", action="store_true", help="Also match approximate spellings")
+    search_parser.add_argument("--limit", type=int, default=50, help="Maximum number of segments to show")
+    search_parser.add_argument("--log-file", default=LOG_FILE)
+    search_parser.add_argument("--sessions-file", default=SESSIONS_FILE)
+    search_parser.add_argument("--index-file", default=SEARCH_INDEX_FILE)
+    search_parser.set_defaults(handler=run_search)
+
+    compact_parser = subparsers.add_parser("compact", help="Merge adjacent log rows with the same title, tag, note and status")
+    compact_parser.add_argument("--tolerance", type=float, default=None,
+                                help="Maximum gap in seconds between rows that are merged (default: 5)")
+    compact_parser.add_argument("--log-file", default=LOG_FILE)
+    compact_parser.add_argument("--sessions-file", default=SESSIONS_FILE)
+    compact_parser.add_argument("--unique-windows-file", default=UNIQUE_WINDOWS_FILE)
+    compact_parser.set_defaults(handler=run_compact)
+
+    retention_parser = subparsers.add_parser(
+        "retention", help="Roll log rows older than a number of days up into hourly or daily summaries")
+    retention_parser.add_argument("--days", type=int, default=RETENTION_DEFAULT_DAYS,
+                                  help=f"Keep rows of the last DAYS days (default: {RETENTION_DEFAULT_DAYS})")
+    retention_parser.add_argument("--resolution", choices=[RETENTION_HOURLY, RETENTION_DAILY],
+                                  default=RETENTION_RESOLUTION, help="Period covered by each summary")
+    retention_parser.add_argument("--delete", action="store_true",
+                                  help="Delete the summarized rows instead of archiving them")
+    retention_parser.add_argument("--log-file", default=LOG_FILE)
+    retention_parser.add_argument("--sessions-file", default=SESSIONS_FILE)
+    retention_parser.set_defaults(handler=run_retention)
+
+    export_parser = subparsers.add_parser("export", help="Export the log as JSON Lines, iCalendar events or an HTML report")
+    export_parser.add_argument("format", choices=["jsonl", "ics", "html"])
+    export_parser.add_argument("output", help="Output file; exporting again to it only adds rows logged since")
+    export_parser.add_argument("--since", help="First day to include (YYYY-MM-DD)")
+    export_parser.add_argument("--until", help="Last day to include (YYYY-MM-DD)")
+    export_parser.add_argument("--tag", action="append", dest="tags",
+                               help="Only include this tag and its sub-tags (can be repeated)")
+    export_parser.add_argument("--full", action="store_true", help="Rewrite the output instead of appending")
+    export_parser.add_argument("--log-file", default=LOG_FILE)
+    export_parser.add_argument("--sessions-file", default=SESSIONS_FILE)
+    export_parser.set_defaults(handler=run_export)
+
+    replay_parser = subparsers.add_parser("replay", help="Replay a recorded trace into fresh log files with a virtual clock")
+    replay_parser.add_argument("trace", help="Trace file written with --record-trace")
+    replay_parser.add_argument("--output-dir", default="replay_output")
+    replay_parser.add_argument("--compare", metavar="DIR",
+                               help="Compare the replayed files byte for byte with a previous replay's output")
+    replay_parser.add_argument("--verbose", action="store_true", help="Show the usual logging output while replaying")
+    replay_parser.set_defaults(handler=run_replay)
+
+    profile_parser = subparsers.add_parser("profile", help="Control profiling of a tracker started with --profile-port")
+    profile_parser.add_argument("action", choices=["start", "stop", "toggle", "snapshot", "dump", "status"],
+                                help="stop and dump write a report; snapshot records memory use and gauges")
+    profile_parser.add_argument("report", nargs="?", help="Report file for stop and dump (default: profiles/)")
+    profile_parser.add_argument("--port", type=int, default=PROFILE_CONTROL_PORT)
+    profile_parser.set_defaults(handler=run_profile)
+
+    return parser
+
+
+def run_search(args):
+    from .search_index import SearchIndex
+    from .sessions import ensure_session_log
+
+    ensure_session_log(args.log_file, args.sessions_file)
+    index = SearchIndex(args.index_file)
+    try:
+        index.catch_up(args.log_file, args.sessions_file)
+        results = index.search(args.query, fuzzy=args.fuzzy, limit=args.limit)
+    finally:
+        index.close()
+
+    if not results:
+        print(f"No matches for '{args.query}'")
+        return 1
+    for result in results:
+        print(f"{result['start']} - {result['end'][11:]}  [{result['tag']}]  {result['title']}")
+        if "note" in result["matched"]:
+            print(f"    note: {result['note']}")
+        if "break_reason" in result["matched"]:
+            print(f"    break reason: {result['break_reason']}")
+    return 0
+
+
+def run_compact(args):
+    from .compactor import compact_log, DEFAULT_TOLERANCE_SECONDS
+    from .sessions import ensure_session_log
+
+    ensure_session_log(args.log_file, args.sessions_file)
+    tolerance = DEFAULT_TOLERANCE_SECONDS if args.tolerance is None else args.tolerance
+    stats = compact_log(args.log_file, args.unique_windows_file, tolerance)
+    print(f"Compacted {args.log_file}: {stats['rows_before']} -> {stats['rows_after']} rows, "
+          f"{stats['seconds_after']} of {stats['seconds_before']} seconds preserved")
+    return 0
+
+
+def run_retention(args):
+    from .retention import downsample_log, archive_file_for
+    from .log_reader import summary_file_for
+    from .sessions import ensure_session_log
+
+    ensure_session_log(args.log_file, args.sessions_file)
+    stats = downsample_log(args.log_file, args.sessions_file, args.days, args.resolution, archive=not args.delete)
+    if not stats["rows"]:
+        print(f"No rows from before {stats['cutoff']} to summarize")
+        return 0
+    print(f"Summarized {stats['rows']} rows ({stats['seconds']} seconds) from before {stats['cutoff']} "
+          f"into {stats['summaries']} summaries in {summary_file_for(args.log_file)}")
+    if not args.delete:
+        print(f"Summarized rows archived to {archive_file_for(args.log_file)}")
+    return 0
+
+
+def run_export(args):
+    from .exporters import EXPORTERS, ExportFilter
+    from .sessions import ensure_session_log
+    from .tag_tree import normalize_tag_path
+
+    ensure_session_log(args.log_file, args.sessions_file)
+    tags = [normalize_tag_path(tag) for tag in args.tags or []]
+    exporter = EXPORTERS[args.format](args.output, args.log_file, args.sessions_file,
+                                      ExportFilter(args.since, args.until, tags))
+    written = exporter.run(full=args.full)
+    print(f"Exported {written} new {'events' if args.format == 'ics' else 'rows'} to {args.output}")
+    return 0
+
+
+def run_replay(args):
+    from .trace_replay import TraceReplayer, compare_outputs
+
+    stats = TraceReplayer(args.trace, args.output_dir).run(quiet=not args.verbose)
+    speedup = stats["virtual_seconds"] / stats["wall_seconds"] if stats["wall_seconds"] else 0
+    print(f"Replayed {stats['events']} events covering {stats['virtual_seconds'] / 3600:.1f} h "
+          f"in {stats['wall_seconds']:.2f} s ({speedup:.0f}x real time) into {args.output_dir}")
+    if args.compare:
+        differences = compare_outputs(args.output_dir, args.compare)
+        for difference in differences:
+            print(f"  {difference}")
+        print(f"Output {'differs from' if differences else 'is identical to'} {args.compare}")
+        return 1 if differences else 0
+    return 0
+
+
+def run_profile(args):
+    from .profiling import send_command
+
+    report = os.path.abspath(args.report) if args.report else None
+    try:
+        print(send_command(args.action, report, args.port))
+    except OSError as e:
+        print(f"Could not reach a tracker on port {args.port} (started with --profile-port?): {e}")
+        return 1
+    return 0
@@ -0,0 +1,42 @@
+import datetime
+import time
+
+
+class SystemClock:
+    """Wall clock used during normal operation"""
+
+    def now(self):
+        return datetime.datetime.now()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def wait(self, event, seconds):
+        """Sleep until `event` is set or `seconds` pass; True if the event was set"""
+        return event.wait(seconds)
+
+
+class VirtualClock:
+    """Clock that only moves when told to, so recorded days can be replayed in seconds"""
+
+    def __init__(self, start=None):
+        self.current = start or datetime.datetime(2000, 1, 1)
+
+    def now(self):
+        return self.current
+
+    def sleep(self, seconds):
+        self.current += datetime.timedelta(seconds=seconds)
+
+    def wait(self, event, seconds):
+        if not event.is_set():
+            self.sleep(seconds)
+        return event.is_set()
+
+    def set(self, moment):
+        # Never move backwards; segment durations must not become negative
+        if moment > self.current:
+            self.current = moment
+
+
+SYSTEM_CLOCK = SystemClock()
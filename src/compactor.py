@@ -0,0 +1,139 @@
+import csv
+import io
+import os
+from .constants import LOG_FILE, UNIQUE_WINDOWS_FILE, LOG_COLUMNS
+from .log_reader import parse_log_datetime
+from .file_lock import append_lock_for, rewrite_lock_for
+
+# Rows separated by at most this many seconds are considered contiguous
+DEFAULT_TOLERANCE_SECONDS = 5
+
+# Titles DataLogger never adds to the unique windows file
+_UNTRACKED_TITLES = ("Unknown Window", "Error getting active window.")
+
+
+class _BoundedReader(io.RawIOBase):
+    """Raw reader that stops at a fixed byte offset, so rows appended during compaction aren't read twice"""
+
+    def __init__(self, raw, limit):
+        self.raw = raw
+        self.remaining = limit
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self.remaining <= 0:
+            return 0
+        data = self.raw.read(min(len(buffer), self.remaining))
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+
+def _merge_key(row):
+    # Everything after start, end and duration: window title, session id and window metadata in
+    # the current format, (window_title, tag, note, work_status, break_reason) in the legacy one
+    return tuple(row[3:])
+
+
+def compact_rows(rows, tolerance_seconds=DEFAULT_TOLERANCE_SECONDS, width=len(LOG_COLUMNS)):
+    """Merge consecutive rows with identical title, session and application (or tag, note and status in
+    legacy logs) that are at most tolerance_seconds apart. Durations are summed rather than
+    recomputed from the merged range, so the total logged time is preserved exactly.
+    """
+    pending = None
+    pending_end = None
+    for row in rows:
+        row = (row + [""] * width)[:width]
+        start = parse_log_datetime(row[0])
+        end = parse_log_datetime(row[1])
+        if start is None or end is None:
+            # Keep malformed rows untouched rather than dropping data
+            if pending:
+                yield pending
+                pending = None
+            yield row
+            continue
+
+        if pending and _merge_key(pending) == _merge_key(row) and \
+                abs((start - pending_end).total_seconds()) <= tolerance_seconds:
+            pending[1] = row[1]
+            pending[2] = str(int(pending[2] or 0) + int(row[2] or 0))
+            pending_end = end
+            continue
+
+        if pending:
+            yield pending
+        pending = list(row)
+        pending_end = end
+    if pending:
+        yield pending
+
+
+def compact_log(log_file=LOG_FILE, unique_windows_file=UNIQUE_WINDOWS_FILE,
+                tolerance_seconds=DEFAULT_TOLERANCE_SECONDS, file_lock=None):
+    """Stream the log through compact_rows into a temporary file and atomically swap it in.
+
+    unique_windows_file is rebuilt from the compacted rows. Returns a dict with row
+    counts and total seconds before and after (which are always equal).
+
+    A running tracker may keep appending: rows appended meanwhile are copied and the
+    files swapped under the log's append lock (file_lock, or the lock file next to
+    the log), and a retention run in progress is waited for.
+    """
+    with rewrite_lock_for(log_file):
+        return _compact_log(log_file, unique_windows_file, tolerance_seconds, file_lock or append_lock_for(log_file))
+
+
+def _compact_log(log_file, unique_windows_file, tolerance_seconds, file_lock):
+    size = os.path.getsize(log_file)
+    tmp_path = log_file + ".compact.tmp"
+    stats = {"rows_before": 0, "rows_after": 0, "seconds_before": 0, "seconds_after": 0}
+    titles = set()
+
+    def counted(reader):
+        for row in reader:
+            stats["rows_before"] += 1
+            stats["seconds_before"] += int(row[2]) if len(row) > 2 and row[2].isdigit() else 0
+            yield row
+
+    with open(log_file, 'rb') as raw, open(tmp_path, 'w', newline='', encoding='utf-8') as out:
+        text = io.TextIOWrapper(io.BufferedReader(_BoundedReader(raw, size)), encoding='utf-8', newline='')
+        reader = csv.reader(text)
+        writer = csv.writer(out)
+        header = next(reader, None) or LOG_COLUMNS
+        writer.writerow(header)
+
+        for row in compact_rows(counted(reader), tolerance_seconds, len(header)):
+            writer.writerow(row)
+            stats["rows_after"] += 1
+            stats["seconds_after"] += int(row[2]) if row[2].isdigit() else 0
+            # row[4] is the session id (or the tag in legacy logs), as checked by DataLogger
+            title, session = row[3], row[4]
+            if session and title and title not in _UNTRACKED_TITLES:
+                titles.add(title)
+
+        out.flush()
+
+        with file_lock:
+            # Rows appended by a running tracker while we were compacting are copied verbatim
+            raw.seek(size)
+            tail = raw.read()
+            if tail:
+                out.buffer.write(tail)
+                for row in csv.reader(io.StringIO(tail.decode('utf-8', errors='replace'), newline='')):
+                    if len(row) > 4 and row[4] and row[3] and row[3] not in _UNTRACKED_TITLES:
+                        titles.add(row[3])
+            out.flush()
+            os.fsync(out.fileno())
+            out.close()
+            os.replace(tmp_path, log_file)
+
+            # Titles are appended under the same lock, so none of them is lost either
+            tmp_titles = unique_windows_file + ".compact.tmp"
+            with open(tmp_titles, 'w', encoding='utf-8') as f:
+                for title in sorted(titles):
+                    f.write(title + '\n')
+            os.replace(tmp_titles, unique_windows_file)
+    return stats
@@ -2,6 +2,60 @@
 LOG_FILE = "window_logs.csv"
 UNIQUE_WINDOWS_FILE = "unique_windows.txt"
 DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+SEARCH_INDEX_FILE = "search_index.db"
+SESSIONS_FILE = "sessions.csv"
+# Window segments only reference their session; note, tag and status live in the session record.
+# pid, exe_name and window_class identify the application owning the window (empty if unknown).
+LOG_COLUMNS = ["datetime_start", "datetime_end", "duration_seconds", "window_title", "session_id",
+               "pid", "exe_name", "window_class"]
+# Session log format before window metadata was recorded
+SESSION_LOG_COLUMNS_V1 = LOG_COLUMNS[:5]
+SESSION_COLUMNS = ["session_id", "datetime_start", "datetime_end", "tag", "note", "work_status", "break_reason"]
+# Log format before session records, with every field on each row
+LEGACY_LOG_COLUMNS = ["datetime_start", "datetime_end", "duration_seconds", "window_title", "tag", "note", "work_status", "break_reason"]
+# Segment rows joined with their session (used for uploads and central storage)
+DENORMALIZED_LOG_COLUMNS = LEGACY_LOG_COLUMNS + ["session_id", "pid", "exe_name", "window_class"]
+
+# --- Central upload (optional) ---
+UPLOAD_URL = None  # e.g. "http://127.0.0.1:8765"; None disables uploading
+UPLOAD_SPOOL_DIR = "upload_spool"
+UPLOAD_BATCH_SIZE = 500
+UPLOAD_FLUSH_INTERVAL = 5  # seconds
+
+# --- Window sampling in a child process (optional, see process_monitor.py) ---
+MONITOR_SAMPLE_INTERVAL = 1  # seconds between samples of the active window
+MONITOR_RING_SLOTS = 256  # switch events buffered in shared memory
+MONITOR_WATCHDOG_TIMEOUT = 10  # seconds without a sample before the sampler is restarted
+
+# --- Event bus (see event_bus.py) ---
+EVENT_QUEUE_SIZE = 1000  # events queued per subscriber
+EVENT_BLOCK_TIMEOUT = 1.0  # seconds a publisher waits for a full 'block' subscriber before dropping
+EVENT_POLICY_DROP_OLDEST = "drop_oldest"
+EVENT_POLICY_BLOCK = "block"
+EVENT_POLICY_COALESCE = "coalesce"
+
+# --- Retention (see retention.py) ---
+# Log rows older than this many days are rolled up into summaries in the background. Off (None)
+# unless enabled with --retention-days, since it rewrites the log and archives old rows
+RETENTION_DAYS = None
+# Days kept by the 'retention' command (and a retention run) when none are given
+RETENTION_DEFAULT_DAYS = 90
+RETENTION_HOURLY = "hour"
+RETENTION_DAILY = "day"
+RETENTION_RESOLUTION = RETENTION_HOURLY  # Length of the periods rows are summarized into
+RETENTION_ARCHIVE = True  # Keep the summarized rows in a compressed archive instead of deleting them
+RETENTION_CHECK_INTERVAL = 6 * 3600  # seconds between checks for rows to summarize
+# One row per period, tag, title class and note; summarized_until is the cutoff of the run that wrote it
+SUMMARY_COLUMNS = ["datetime_start", "datetime_end", "duration_seconds", "title_class", "tag", "note",
+                   "segments", "summarized_until"]
+
+# --- Profiling (see profiling.py) ---
+PROFILE_DIR = "profiles"  # Where profile reports are written by default
+PROFILE_TOP_FUNCTIONS = 30  # Functions listed per thread
+PROFILE_TOP_ALLOCATIONS = 20  # Allocation sites listed
+PROFILE_TRACEBACK_FRAMES = 1  # Frames tracemalloc keeps per allocation; more is slower
+PROFILE_HANDOFF_TIMEOUT = 5  # seconds a report waits for profiled threads to hand in their profiles
+PROFILE_CONTROL_PORT = 8766  # localhost port for 'profile' commands, when enabled with --profile-port
 
 # --- User States ---
 STATE_INACTIVE = "Inactive"
@@ -12,3 +66,11 @@ TAG_PACING = "Pacing"  # This is a special tag that must always be available
 
 # Default tags - these can be modified by the user
 DEFAULT_TAGS = [TAG_PACING, "Learning (work)", "Learning (fun)", "Work"]
+
+# --- State change notifications ---
+# Emitted by StateManager to its listeners so the GUI only redraws what changed
+CHANGE_STATE = "state"
+CHANGE_TAG = "tag"
+CHANGE_TAGS = "tags"
+CHANGE_NOTE = "note"
+CHANGE_WORK_STATUS = "work_status"
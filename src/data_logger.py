@@ -1,22 +1,63 @@
 import os
 import csv
+import queue
 import threading
 import datetime # Added for type hinting if used, or if any datetime ops are needed directly
-from .constants import LOG_FILE, UNIQUE_WINDOWS_FILE, DATETIME_FORMAT, STATE_TRACKING
+from .constants import (
+    LOG_FILE, UNIQUE_WINDOWS_FILE, SESSIONS_FILE, DATETIME_FORMAT, STATE_TRACKING,
+    LOG_COLUMNS, DENORMALIZED_LOG_COLUMNS, UPLOAD_URL, UPLOAD_SPOOL_DIR, RETENTION_DAYS
+)
+from .uploader import BatchUploader
+from .search_index import SearchIndex
+from .sessions import SessionStore, ensure_session_log, denormalize_row
+from .retention import RetentionJob
+from .file_lock import append_lock_for
 
 class DataLogger:
-    def __init__(self):
-        self.log_file = LOG_FILE
-        self.unique_windows_file = UNIQUE_WINDOWS_FILE
+    def __init__(self, upload_url=UPLOAD_URL, search_index=True, log_file=LOG_FILE,
+                 unique_windows_file=UNIQUE_WINDOWS_FILE, sessions_file=SESSIONS_FILE, retention_days=RETENTION_DAYS):
+        self.log_file = log_file
+        self.unique_windows_file = unique_windows_file
+        self.sessions_file = sessions_file
         self._initialize_log_file()
         self.lock = threading.Lock()
+        # Held while rows are appended to the log file, so the retention job or the compact
+        # command (even from another process) can swap in a rewritten log without losing rows
+        self.log_file_lock = append_lock_for(self.log_file)
+        self.session_store = SessionStore(self.sessions_file)
+        self.open_sessions = {}  # session_id -> record of sessions that haven't been closed yet
+        # session_id -> its latest logged row; uploaded once it is known whether it is the session's last
+        # row, since only the last one carries the session's final work status and break reason
+        self._pending_uploads = {}
         self.unique_window_titles = self._load_unique_windows()
+        # Files are appended by a writer thread, so logging never blocks the GUI or the monitor thread
+        self._write_queue = queue.Queue()
+        self._writer_thread = threading.Thread(target=self._write_loop, name="data-logger-writer", daemon=True)
+        self._writer_thread.start()
+        # Optional central upload; rows are handed off to a background thread and spooled
+        # next to the log, so the spool doesn't depend on the working directory
+        self.uploader = None
+        if upload_url:
+            spool_dir = os.path.join(os.path.dirname(os.path.abspath(self.log_file)), UPLOAD_SPOOL_DIR)
+            self.uploader = BatchUploader(upload_url, spool_dir=spool_dir)
+        # Full-text search index over titles/notes/break reasons, updated in the background
+        self.search_index = None
+        if search_index:
+            self.search_index = SearchIndex()
+            self.search_index.start_background_updates(self.log_file, self.sessions_file)
+        # Old rows are rolled up into summaries in the background (None or 0 keeps every row)
+        self.retention = None
+        if retention_days:
+            self.retention = RetentionJob(self, retention_days)
+            self.retention.start()
 
     def _initialize_log_file(self):
+        # Logs from before session records are converted once
+        ensure_session_log(self.log_file, self.sessions_file)
         if not os.path.exists(self.log_file):
             with open(self.log_file, 'w', newline='', encoding='utf-8') as f:
                 writer = csv.writer(f)
-                writer.writerow(["datetime_start", "datetime_end", "duration_seconds", "window_title", "tag", "note", "work_status", "break_reason"])
+                writer.writerow(LOG_COLUMNS)
 
     def _load_unique_windows(self):
         titles = set()
@@ -26,7 +67,39 @@ class DataLogger:
                     titles.add(line.strip())
         return titles
 
-    def log_window_activity(self, start_time, end_time, window_title, tag, note_text="", work_status=None, break_reason=None):
+    def open_session(self, start_time, tag, note_text, work_status=None):
+        """Record the start of a session (a run of segments sharing tag and note); returns its id"""
+        with self.lock:
+            session_id = self.session_store.new_id()
+            record = {
+                "session_id": session_id,
+                "datetime_start": start_time.strftime(DATETIME_FORMAT),
+                "datetime_end": "",
+                "tag": tag or "No Tag",
+                "note": note_text,
+                "work_status": work_status or "",
+                "break_reason": "",
+            }
+            self.open_sessions[session_id] = record
+            self._write_queue.put(("session", record))
+            print(f"Session {session_id} started. Tag: {record['tag']}, Note: {note_text}")
+        return session_id
+
+    def close_session(self, session_id, end_time, work_status=None, break_reason=None):
+        """Record the end of a session with its final work status and break reason"""
+        with self.lock:
+            record = self.open_sessions.pop(session_id, None)
+            if record is None:
+                return
+            record = dict(record, datetime_end=end_time.strftime(DATETIME_FORMAT),
+                          work_status=work_status or "", break_reason=break_reason or "")
+            self._write_queue.put(("session", record))
+            pending = self._pending_uploads.pop(session_id, None)
+            if pending:
+                self._upload(pending, record)
+            print(f"Session {session_id} ended. Work status: {work_status}, Break reason: {break_reason if break_reason else 'N/A'}")
+
+    def log_window_activity(self, start_time, end_time, window_title, session_id, window_info=None):
         with self.lock:
             duration = (end_time - start_time).total_seconds()
             if duration < 0: duration = 0 # Should not happen, but as a safeguard
@@ -34,17 +107,87 @@ class DataLogger:
             start_str = start_time.strftime(DATETIME_FORMAT)
             end_str = end_time.strftime(DATETIME_FORMAT)
             
-            print(f"Logging: {start_str}, {end_str}, {duration:.0f}, {window_title}, Tag: {tag}, Note: {note_text}")
-            if work_status:
-                print(f"Work status: {work_status}, Break reason: {break_reason if break_reason else 'N/A'}")
+            print(f"Logging: {start_str}, {end_str}, {duration:.0f}, {window_title}, Session: {session_id}")
                 
-            with open(self.log_file, 'a', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow([start_str, end_str, f"{duration:.0f}", window_title, tag, note_text, work_status or "", break_reason or ""])
-                f.flush()
+            row = [start_str, end_str, f"{duration:.0f}", window_title, session_id or ""]
+            # Owning process and window class, when the platform provides them
+            if window_info:
+                row += [str(window_info.pid), window_info.exe_name, window_info.window_class]
+            else:
+                row += ["", "", ""]
+            self._write_queue.put(("log", row))
+
+            if self.uploader:
+                # A new row means the session's previous one wasn't its last
+                previous = self._pending_uploads.pop(session_id, None)
+                if previous:
+                    self._upload(previous, self.open_sessions.get(session_id))
+                if session_id in self.open_sessions:
+                    self._pending_uploads[session_id] = row
+                else:
+                    self._upload(row, None)
             
-            if tag and window_title and window_title != "Unknown Window" and window_title != "Error getting active window." and window_title not in self.unique_window_titles:
+            if session_id and window_title and window_title != "Unknown Window" and window_title != "Error getting active window." and window_title not in self.unique_window_titles:
                 self.unique_window_titles.add(window_title)
-                with open(self.unique_windows_file, 'a', encoding='utf-8') as uf:
-                    uf.write(window_title + '\n')
-                    uf.flush()
+                self._write_queue.put(("title", window_title))
+
+    def _upload(self, row, session):
+        # The server stores self-contained rows, so join the session in before uploading
+        upload_row = denormalize_row(dict(zip(LOG_COLUMNS, row)), session)
+        self.uploader.enqueue({column: upload_row[column] for column in DENORMALIZED_LOG_COLUMNS})
+
+    def _write_loop(self):
+        """Append queued log rows, session records and window titles, all pending ones at a time"""
+        while True:
+            batch = [self._write_queue.get()]
+            while True:
+                try:
+                    batch.append(self._write_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch([item for item in batch if item is not None])
+            except Exception as e:
+                print(f"Error writing log data: {e}")
+            for _ in batch:
+                self._write_queue.task_done()
+            if self.search_index:
+                self.search_index.notify_appended()
+            if None in batch:
+                return
+
+    def _write_batch(self, items):
+        rows = [value for kind, value in items if kind == "log"]
+        titles = [value for kind, value in items if kind == "title"]
+        if rows or titles:
+            with self.log_file_lock:
+                if rows:
+                    with open(self.log_file, 'a', newline='', encoding='utf-8') as f:
+                        csv.writer(f).writerows(rows)
+                        f.flush()
+                if titles:
+                    with open(self.unique_windows_file, 'a', encoding='utf-8') as uf:
+                        uf.write("".join(title + '\n' for title in titles))
+                        uf.flush()
+        for kind, value in items:
+            if kind == "session":
+                self.session_store.append(value)
+
+    def flush(self):
+        """Wait until everything logged so far is written to the files"""
+        self._write_queue.join()
+
+    def close(self):
+        """Write pending rows and flush pending uploads (if uploading is enabled) before the application exits"""
+        if self.retention:
+            self.retention.stop()
+        if self._writer_thread.is_alive():
+            self._write_queue.put(None)
+            self._writer_thread.join()
+        if self.uploader:
+            with self.lock:
+                # Sessions still open when the application exits
+                for session_id, row in self._pending_uploads.items():
+                    self._upload(row, self.open_sessions.get(session_id))
+                self._pending_uploads.clear()
+            self.uploader.stop()
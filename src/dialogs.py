@@ -245,3 +245,72 @@ class BreakReasonDialog(tk.Toplevel):
     def _on_cancel(self):
         self.reason = None
         self.destroy()
+
+
+class SearchDialog(tk.Toplevel):
+    """Non-modal window listing logged segments whose title, note or break reason match a query"""
+
+    def __init__(self, parent, search_index, query=""):
+        super().__init__(parent)
+        self.parent = parent
+        self.search_index = search_index
+        
+        # Configure dialog
+        self.title("Search History")
+        self.geometry("700x400")
+        self.transient(parent)
+        
+        # Create widgets
+        self._setup_ui()
+        self.search(query)
+    
+    def _setup_ui(self):
+        main_frame = ttk.Frame(self, padding="10 10 10 10")
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        
+        # Query row
+        query_frame = ttk.Frame(main_frame)
+        query_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        self.query_var = tk.StringVar()
+        query_entry = ttk.Entry(query_frame, textvariable=self.query_var)
+        query_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        query_entry.bind("<Return>", lambda event: self.search(self.query_var.get()))
+        query_entry.focus_set()
+        
+        self.fuzzy_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(query_frame, text="Fuzzy", variable=self.fuzzy_var,
+                        command=lambda: self.search(self.query_var.get())).pack(side=tk.LEFT, padx=(5, 0))
+        ttk.Button(query_frame, text="Search",
+                   command=lambda: self.search(self.query_var.get())).pack(side=tk.LEFT, padx=(5, 0))
+        
+        # Results list
+        results_frame = ttk.Frame(main_frame)
+        results_frame.pack(fill=tk.BOTH, expand=True)
+        scrollbar = ttk.Scrollbar(results_frame)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.results_list = tk.Listbox(results_frame, yscrollcommand=scrollbar.set)
+        self.results_list.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.config(command=self.results_list.yview)
+        
+        self.summary_var = tk.StringVar()
+        ttk.Label(main_frame, textvariable=self.summary_var, anchor=tk.W).pack(fill=tk.X, pady=(5, 0))
+        
+        self.bind("<Escape>", lambda event: self.destroy())
+    
+    def search(self, query):
+        self.query_var.set(query)
+        self.results_list.delete(0, tk.END)
+        if not query.strip():
+            self.summary_var.set("Type a word from a window title, note or break reason.")
+            return
+        
+        results = self.search_index.search(query, fuzzy=self.fuzzy_var.get())
+        for result in results:
+            line = f"{result['start']} - {result['end'][11:]}  [{result['tag']}]  {result['title']}"
+            if "note" in result["matched"]:
+                line += f"  — note: {result['note']}"
+            if "break_reason" in result["matched"]:
+                line += f"  — break: {result['break_reason']}"
+            self.results_list.insert(tk.END, line)
+        self.summary_var.set(f"{len(results)} matching segments (most recent first)")
@@ -0,0 +1,196 @@
+"""Publish/subscribe bus for tracking events.
+
+WindowMonitor and StateManager publish typed events; every subscriber gets its own
+bounded queue and worker thread, so a slow consumer only delays itself. When a
+queue is full the subscriber's backpressure policy decides what happens:
+
+- drop_oldest: discard the oldest queued event (for consumers that only care about
+  recent events, e.g. a status display)
+- block: the publisher waits for room, but at most EVENT_BLOCK_TIMEOUT seconds; after
+  that the event is dropped, and so are further events until the subscriber makes
+  progress, so a hung subscriber delays sampling once rather than on every event
+- coalesce: a queued event with the same key (by default, the event type) is replaced
+  by the newer one in place (for consumers that only need the latest state)
+
+metrics() reports per-subscriber queue depth, drops and lag (time from publish to
+handling).
+"""
+import collections
+import threading
+import time
+from .constants import (
+    EVENT_QUEUE_SIZE, EVENT_BLOCK_TIMEOUT,
+    EVENT_POLICY_DROP_OLDEST, EVENT_POLICY_BLOCK, EVENT_POLICY_COALESCE
+)
+
+# --- Event types ---
+# A trackable window became active (title None: nothing is being tracked anymore)
+WindowChanged = collections.namedtuple("WindowChanged", ["time", "title", "tag", "window_info"])
+# A window segment ended and was logged
+SegmentClosed = collections.namedtuple(
+    "SegmentClosed", ["start", "end", "title", "tag", "session_id", "window_info"])
+StateChanged = collections.namedtuple("StateChanged", ["time", "state"])
+TagChanged = collections.namedtuple("TagChanged", ["time", "tag"])
+NoteChanged = collections.namedtuple("NoteChanged", ["time", "note"])
+WorkStatusChanged = collections.namedtuple("WorkStatusChanged", ["time", "status", "break_reason"])
+
+EVENT_POLICIES = (EVENT_POLICY_DROP_OLDEST, EVENT_POLICY_BLOCK, EVENT_POLICY_COALESCE)
+
+
+class Subscription:
+    """A subscriber's bounded queue and the worker thread that feeds its handler"""
+
+    def __init__(self, handler, event_types=None, maxsize=EVENT_QUEUE_SIZE, policy=EVENT_POLICY_DROP_OLDEST,
+                 coalesce_key=type, name=None):
+        if policy not in EVENT_POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {policy}")
+        self.handler = handler
+        self.event_types = tuple(event_types) if event_types else None
+        self.maxsize = maxsize
+        self.policy = policy
+        self.coalesce_key = coalesce_key
+        self.name = name or getattr(handler, "__qualname__", repr(handler))
+        self.condition = threading.Condition()
+        self.queue = collections.deque()  # [key, event, publish time] entries
+        self.pending_by_key = {}  # For coalescing: key -> queued entry
+        self.closed = False
+        self.stalled = False  # A blocking publish timed out and the worker hasn't caught up since
+        # Metrics
+        self.delivered = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.max_depth = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.thread = threading.Thread(target=self._run, name=f"event-subscriber-{self.name}", daemon=True)
+        self.thread.start()
+
+    def accepts(self, event):
+        return self.event_types is None or isinstance(event, self.event_types)
+
+    def offer(self, event):
+        """Queue an event according to the backpressure policy; never blocks longer than EVENT_BLOCK_TIMEOUT"""
+        with self.condition:
+            if self.closed:
+                return
+            key = None
+            if self.policy == EVENT_POLICY_COALESCE:
+                key = self.coalesce_key(event)
+                entry = self.pending_by_key.get(key)
+                if entry is not None:
+                    # Keep the queue position (and publish time, so lag stays honest), replace the event
+                    entry[1] = event
+                    self.coalesced += 1
+                    return
+            if len(self.queue) >= self.maxsize:
+                if self.policy == EVENT_POLICY_BLOCK and self.stalled:
+                    self.dropped += 1
+                    return
+                if self.policy == EVENT_POLICY_BLOCK:
+                    deadline = time.monotonic() + EVENT_BLOCK_TIMEOUT
+                    while len(self.queue) >= self.maxsize and not self.closed:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.dropped += 1
+                            self.stalled = True
+                            return
+                        self.condition.wait(remaining)
+                    if self.closed:
+                        return
+                else:
+                    oldest = self.queue.popleft()
+                    self.pending_by_key.pop(oldest[0], None)
+                    self.dropped += 1
+            entry = [key, event, time.monotonic()]
+            self.queue.append(entry)
+            if key is not None:
+                self.pending_by_key[key] = entry
+            self.max_depth = max(self.max_depth, len(self.queue))
+            self.condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.queue and not self.closed:
+                    self.condition.wait()
+                if not self.queue:
+                    return  # Closed and drained
+                key, event, published = self.queue.popleft()
+                if key is not None:
+                    self.pending_by_key.pop(key, None)
+                self.last_lag = time.monotonic() - published
+                self.max_lag = max(self.max_lag, self.last_lag)
+                self.stalled = False
+                self.condition.notify_all()  # Room for a blocked publisher
+            try:
+                self.handler(event)
+            except Exception as e:
+                self.errors += 1
+                print(f"Error in event subscriber '{self.name}' for {type(event).__name__}: {e}")
+            self.delivered += 1
+
+    def close(self, timeout=None):
+        """Stop accepting events; the worker handles what is queued, then exits"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join(timeout)
+
+    def metrics(self):
+        with self.condition:
+            oldest_age = time.monotonic() - self.queue[0][2] if self.queue else 0.0
+            return {
+                "name": self.name,
+                "policy": self.policy,
+                "depth": len(self.queue),
+                "max_depth": self.max_depth,
+                "delivered": self.delivered,
+                "dropped": self.dropped,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+                # Lag: seconds between publishing an event and its handler starting
+                "lag_seconds": max(self.last_lag, oldest_age),
+                "max_lag_seconds": self.max_lag,
+            }
+
+
+class EventBus:
+    """Fans published events out to the subscriptions that accept them"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = []
+
+    def subscribe(self, handler, event_types=None, maxsize=EVENT_QUEUE_SIZE, policy=EVENT_POLICY_DROP_OLDEST,
+                  coalesce_key=type, name=None):
+        """Call handler(event) from a dedicated thread for every published event of the given types"""
+        subscription = Subscription(handler, event_types, maxsize, policy, coalesce_key, name)
+        with self.lock:
+            # Copy on write, so publish() iterates without holding the lock
+            self.subscriptions = self.subscriptions + [subscription]
+        return subscription
+
+    def unsubscribe(self, subscription, timeout=None):
+        with self.lock:
+            self.subscriptions = [s for s in self.subscriptions if s is not subscription]
+        subscription.close(timeout)
+
+    def publish(self, event):
+        for subscription in self.subscriptions:
+            if subscription.accepts(event):
+                subscription.offer(event)
+
+    def metrics(self):
+        return [subscription.metrics() for subscription in self.subscriptions]
+
+    def close(self, timeout=2):
+        """Deliver queued events (waiting up to `timeout` seconds per subscriber) and stop all workers"""
+        with self.lock:
+            subscriptions, self.subscriptions = self.subscriptions, []
+        for subscription in subscriptions:
+            subscription.close(timeout)
+            metrics = subscription.metrics()
+            if metrics["dropped"] or metrics["errors"]:
+                print(f"Event subscriber '{metrics['name']}': {metrics['dropped']} events dropped, "
+                      f"{metrics['errors']} handler errors, max lag {metrics['max_lag_seconds']:.2f}s")
@@ -0,0 +1,304 @@
+"""Streaming exports of the window log to JSON Lines, iCalendar and a static HTML report.
+
+Rows are streamed from the log in a single pass and written in chunks, so memory
+use doesn't grow with the size of the log. Each export keeps a small state file
+next to its output recording how far the log was read; the next export of the
+same file only appends rows logged since then. If the log was replaced (e.g. by
+compaction) or the filters changed, the output is rewritten from scratch.
+Exports from scratch start with the summaries of rows removed by retention.py.
+"""
+import datetime
+import html
+import json
+import os
+from .constants import LOG_FILE, SESSIONS_FILE, LOG_COLUMNS, SESSION_LOG_COLUMNS_V1
+from .sessions import load_sessions, denormalize_row
+from .log_reader import iter_summary_rows, iter_log_from_offset, parse_log_datetime
+from .tag_tree import TAG_SEPARATOR
+
+# Rows buffered before each write to the output file
+EXPORT_CHUNK_ROWS = 1000
+
+_JSONL_FIELDS = ("datetime_start", "datetime_end", "duration_seconds", "window_title", "session_id",
+                 "pid", "exe_name", "window_class", "tag", "note", "work_status", "break_reason")
+
+_ICS_HEADER = "BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//screen_tracker//export//EN\r\n"
+_ICS_FOOTER = "END:VCALENDAR\r\n"
+
+
+class ExportFilter:
+    """Date range (inclusive 'YYYY-MM-DD' days) and tag filter; a tag also matches its sub-tags"""
+
+    def __init__(self, since=None, until=None, tags=None):
+        self.since = since
+        self.until = until
+        self.tags = sorted(tags) if tags else []
+
+    def to_dict(self):
+        return {"since": self.since, "until": self.until, "tags": self.tags}
+
+    def matches(self, datetime_start, tag):
+        # Log datetimes start with the day, so days compare as strings
+        day = datetime_start[:10]
+        if (self.since and day < self.since) or (self.until and day > self.until):
+            return False
+        if self.tags:
+            return any(tag == wanted or tag.startswith(wanted + TAG_SEPARATOR) for wanted in self.tags)
+        return True
+
+
+class _Export:
+    """Shared resume logic: state file handling, row streaming and chunked appends"""
+
+    def __init__(self, output_path, log_file=LOG_FILE, sessions_file=SESSIONS_FILE, export_filter=None):
+        self.output_path = output_path
+        self.log_file = log_file
+        self.sessions_file = sessions_file
+        self.filter = export_filter or ExportFilter()
+        self.state_path = output_path + ".export-state.json"
+
+    def _load_state(self):
+        if not os.path.exists(self.state_path) or not os.path.exists(self.output_path):
+            return None
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state.get("format") != self.FORMAT or state.get("filter") != self.filter.to_dict():
+            return None
+        if state.get("log_inode") != os.stat(self.log_file).st_ino:
+            return None
+        # The log only grows; a smaller one was rewritten under the same inode
+        if state.get("log_offset", 0) > os.path.getsize(self.log_file):
+            return None
+        return state
+
+    def _save_state(self, state):
+        state.update(format=self.FORMAT, filter=self.filter.to_dict(), log_inode=os.stat(self.log_file).st_ino)
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _rows(self, offset, sessions):
+        """Filtered, denormalized row dicts after offset; self.log_offset follows the rows read"""
+        self.log_offset = offset
+        if offset == 0:
+            # Summarizing rows rewrites the log, so summaries are only new when starting over
+            for row in iter_summary_rows(self.log_file):
+                if self.filter.matches(row["datetime_start"], row["tag"]):
+                    yield row
+        for values, self.log_offset in iter_log_from_offset(self.log_file, offset):
+            if values == LOG_COLUMNS or len(values) < len(SESSION_LOG_COLUMNS_V1):
+                continue  # Header or malformed row
+            # Rows without window metadata get empty values
+            values += [""] * (len(LOG_COLUMNS) - len(values))
+            row = denormalize_row(dict(zip(LOG_COLUMNS, values)), sessions.get(values[4]))
+            if self.filter.matches(row["datetime_start"], row["tag"]):
+                yield row
+
+    def _open_output(self, state):
+        """Open the output for appending at the end of the previous export (or empty it)"""
+        f = open(self.output_path, 'a+b')
+        # Discard anything written after the last saved state, e.g. by an interrupted export
+        f.truncate(state["output_size"] if state else 0)
+        f.seek(0, os.SEEK_END)
+        return f
+
+    @staticmethod
+    def _write_chunks(f, lines):
+        chunk = []
+        count = 0
+        for line in lines:
+            chunk.append(line)
+            count += 1
+            if len(chunk) >= EXPORT_CHUNK_ROWS:
+                f.write("".join(chunk).encode('utf-8'))
+                chunk = []
+        if chunk:
+            f.write("".join(chunk).encode('utf-8'))
+        return count
+
+    def run(self, full=False):
+        """Export (or append to) the output; returns the number of new records written"""
+        if not os.path.exists(self.log_file):
+            print(f"Nothing to export: {self.log_file} does not exist")
+            return 0
+        state = None if full else self._load_state()
+        return self._export(state)
+
+
+class JsonLinesExport(_Export):
+    """One JSON object per log segment, with its session's tag, note and status"""
+
+    FORMAT = "jsonl"
+
+    def _export(self, state):
+        sessions = load_sessions(self.sessions_file)
+        lines = (json.dumps({field: row[field] for field in _JSONL_FIELDS}, ensure_ascii=False) + "\n"
+                 for row in self._rows(state["log_offset"] if state else 0, sessions))
+        with self._open_output(state) as f:
+            written = self._write_chunks(f, lines)
+            f.flush()
+            os.fsync(f.fileno())
+            output_size = f.tell()
+        self._save_state({"log_offset": self.log_offset, "output_size": output_size})
+        return written
+
+
+def _ics_text(value):
+    return value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def _ics_datetime(value):
+    # Floating local time, as logged
+    return value.replace("-", "").replace(":", "").replace(" ", "T")
+
+
+def _ics_utc_datetime(value):
+    # DTSTAMP must be UTC (RFC 5545); the logged local time is converted with this machine's zone
+    moment = parse_log_datetime(value) or datetime.datetime.now()
+    return moment.astimezone(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _ics_fold(line):
+    """Fold content lines longer than 75 octets as required by RFC 5545"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + "\r\n"
+    parts = []
+    while encoded:
+        size = 75 if not parts else 74
+        # Don't split a multi-byte character
+        while size < len(encoded) and (encoded[size] & 0xC0) == 0x80:
+            size -= 1
+        parts.append(encoded[:size].decode('utf-8'))
+        encoded = encoded[size:]
+    return "\r\n ".join(parts) + "\r\n"
+
+
+class ICalendarExport(_Export):
+    """One VEVENT per closed session: the time span of a tag and note while tracking"""
+
+    FORMAT = "ics"
+
+    def _event(self, session, seconds):
+        lines = [
+            "BEGIN:VEVENT",
+            f"UID:session-{session['session_id']}-{_ics_datetime(session['datetime_start'])}@screen-tracker",
+            f"DTSTAMP:{_ics_utc_datetime(session['datetime_end'])}",
+            f"DTSTART:{_ics_datetime(session['datetime_start'])}",
+            f"DTEND:{_ics_datetime(session['datetime_end'])}",
+            f"SUMMARY:{_ics_text(session['tag'] or 'No Tag')}",
+        ]
+        description = f"Tracked {seconds // 60} min"
+        if session["note"]:
+            description += f"\n{session['note']}"
+        if session["break_reason"]:
+            description += f"\nBreak: {session['break_reason']}"
+        lines.append(f"DESCRIPTION:{_ics_text(description)}")
+        lines.append(f"CATEGORIES:{_ics_text(session['tag'].split(TAG_SEPARATOR, 1)[0] or 'No Tag')}")
+        lines.append("END:VEVENT")
+        return "".join(_ics_fold(line) for line in lines)
+
+    def _export(self, state):
+        sessions = load_sessions(self.sessions_file)
+        # A session is exported once it is closed; seconds tracked in still open sessions carry over.
+        # Ids increase and only one session is open at a time, so exported ids never reappear.
+        pending = dict(state["pending_seconds"]) if state else {}
+        last_exported = state["last_exported_id"] if state else 0
+        for row in self._rows(state["log_offset"] if state else 0, sessions):
+            session_id = row["session_id"]
+            if session_id.isdigit() and int(session_id) > last_exported:
+                pending[session_id] = pending.get(session_id, 0) + int(row["duration_seconds"] or 0)
+
+        closed = sorted((session_id for session_id in pending if sessions.get(session_id, {}).get("datetime_end")),
+                        key=int)
+        events = (self._event(sessions[session_id], pending.pop(session_id)) for session_id in closed)
+        with self._open_output(state) as f:
+            if not state:
+                f.write(_ICS_HEADER.encode('utf-8'))
+            written = self._write_chunks(f, events)
+            output_size = f.tell()
+            # The footer is overwritten by the events appended in the next export
+            f.write(_ICS_FOOTER.encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+        self._save_state({"log_offset": self.log_offset, "output_size": output_size, "pending_seconds": pending,
+                          "last_exported_id": int(closed[-1]) if closed else last_exported})
+        return written
+
+
+_HTML_STYLE = """
+body { font-family: sans-serif; margin: 2em; color: #222; }
+table { border-collapse: collapse; margin-bottom: 2em; }
+th, td { padding: 4px 10px; text-align: left; border-bottom: 1px solid #ddd; }
+td.num { text-align: right; font-variant-numeric: tabular-nums; }
+.bar { background: #4E79A7; height: 12px; }
+"""
+
+
+def _format_hours(seconds):
+    return f"{seconds / 3600:.2f} h"
+
+
+class HtmlReportExport(_Export):
+    """Self-contained HTML report of time per tag and per day.
+
+    Only the (day, tag) totals are kept in the state file, so each export folds
+    the new rows into them and re-renders the (small) report.
+    """
+
+    FORMAT = "html"
+
+    def _export(self, state):
+        sessions = load_sessions(self.sessions_file)
+        totals = state["totals"] if state else {}  # day -> {tag: seconds}
+        written = 0
+        for row in self._rows(state["log_offset"] if state else 0, sessions):
+            day_totals = totals.setdefault(row["datetime_start"][:10], {})
+            tag = row["tag"] or "No Tag"
+            day_totals[tag] = day_totals.get(tag, 0) + int(row["duration_seconds"] or 0)
+            written += 1
+
+        tmp_path = self.output_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self._render(totals))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.output_path)
+        self._save_state({"log_offset": self.log_offset, "output_size": os.path.getsize(self.output_path),
+                          "totals": totals})
+        return written
+
+    def _render(self, totals):
+        tag_totals = {}
+        for day_totals in totals.values():
+            for tag, seconds in day_totals.items():
+                tag_totals[tag] = tag_totals.get(tag, 0) + seconds
+        grand_total = sum(tag_totals.values())
+        longest = max(tag_totals.values(), default=0) or 1
+        days = sorted(totals)
+
+        parts = ["<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\"><title>Time report</title>",
+                 f"<style>{_HTML_STYLE}</style></head><body>",
+                 "<h1>Time report</h1>",
+                 f"<p>{html.escape(days[0]) if days else ''} &ndash; {html.escape(days[-1]) if days else ''}: "
+                 f"{_format_hours(grand_total)} tracked</p>",
+                 "<h2>By tag</h2><table><tr><th>Tag</th><th>Time</th><th></th></tr>"]
+        for tag, seconds in sorted(tag_totals.items(), key=lambda item: item[1], reverse=True):
+            parts.append(f"<tr><td>{html.escape(tag)}</td><td class=\"num\">{_format_hours(seconds)}</td>"
+                         f"<td><div class=\"bar\" style=\"width:{300 * seconds // longest}px\"></div></td></tr>")
+        parts.append("</table><h2>By day</h2><table><tr><th>Day</th><th>Time</th><th>Tags</th></tr>")
+        for day in reversed(days):
+            day_totals = totals[day]
+            breakdown = ", ".join(f"{html.escape(tag)} {_format_hours(seconds)}"
+                                  for tag, seconds in sorted(day_totals.items(), key=lambda item: item[1], reverse=True))
+            parts.append(f"<tr><td>{day}</td><td class=\"num\">{_format_hours(sum(day_totals.values()))}</td>"
+                         f"<td>{breakdown}</td></tr>")
+        parts.append("</table></body></html>\n")
+        return "\n".join(parts)
+
+
+EXPORTERS = {"jsonl": JsonLinesExport, "ics": ICalendarExport, "html": HtmlReportExport}
@@ -0,0 +1,99 @@
+"""Locks shared by every process that writes the window log.
+
+A running tracker appends to the log while the compact and retention commands (or
+the tracker's own retention job) rewrite it and swap the result in. A rewrite that
+doesn't hold the append lock while it copies the last rows and swaps the file
+loses whatever is appended in between, so both sides take the lock file next to
+the log. Rewriters also hold a second lock for their whole run, so two rewrites
+never replace each other's result.
+"""
+import sys
+import threading
+import time
+
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import fcntl
+
+
+def append_lock_for(log_file):
+    """Held while rows are appended to log_file and while a rewritten log is swapped in"""
+    return FileLock(log_file + ".lock")
+
+
+def rewrite_lock_for(log_file):
+    """Held for the whole run of anything that rewrites log_file"""
+    return FileLock(log_file + ".rewrite.lock")
+
+
+class FileLock:
+    """Exclusive lock on a lock file, held across processes and across threads of this one.
+
+    The OS lock belongs to the open file rather than the thread, so threads of one
+    process are serialized by a threading.Lock first. Not reentrant.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._file = None
+
+    def acquire(self, blocking=True):
+        if not self._thread_lock.acquire(blocking):
+            return False
+        try:
+            self._file = open(self.path, 'a+b')
+            if _lock(self._file, blocking):
+                return True
+            self._file.close()
+            self._file = None
+        except BaseException:
+            if self._file:
+                self._file.close()
+                self._file = None
+            self._thread_lock.release()
+            raise
+        self._thread_lock.release()
+        return False
+
+    def release(self):
+        _unlock(self._file)
+        self._file.close()
+        self._file = None
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+if sys.platform == "win32":
+    def _lock(f, blocking):
+        f.seek(0)
+        while True:
+            try:
+                # LK_NBLCK fails right away; LK_LOCK gives up after about 10 seconds, so retry
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+                time.sleep(0.1)
+
+    def _unlock(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    def _lock(f, blocking):
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def _unlock(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
@@ -1,16 +1,34 @@
 import tkinter as tk
 from tkinter import ttk, font, simpledialog, messagebox
 import datetime
-from .constants import STATE_INACTIVE, STATE_TRACKING, TAG_PACING
-from .dialogs import WorkStatusDialog
+import threading
+from .constants import (
+    STATE_INACTIVE, STATE_TRACKING, TAG_PACING,
+    CHANGE_STATE, CHANGE_TAG, CHANGE_TAGS, CHANGE_NOTE, CHANGE_WORK_STATUS
+)
+from .dialogs import WorkStatusDialog, SearchDialog
+from .tag_list import VirtualTagList
+from .timeline import TimelineData, TimelineWindow
 # StateManager, DataLogger, WindowMonitor will be passed as arguments, no direct import needed here.
 
+# GUI regions that have to be redrawn for each kind of StateManager change.
+# Anything not listed here (e.g. the timer) is refreshed by update_gui on every tick.
+DIRTY_REGIONS = {
+    CHANGE_STATE: {"state", "styles", "background"},
+    CHANGE_TAG: {"tag", "styles", "background"},
+    CHANGE_TAGS: {"tag_buttons", "styles"},
+    CHANGE_NOTE: {"note"},
+    CHANGE_WORK_STATUS: set(),
+}
+
 class SimpleGUI(tk.Tk):
-    def __init__(self, state_manager, data_logger, window_monitor):
+    def __init__(self, state_manager, data_logger, window_monitor, live_stats=None, profiler=None):
         super().__init__()
         self.state_manager = state_manager
         self.data_logger = data_logger
         self.window_monitor = window_monitor
+        self.live_stats = live_stats
+        self.profiler = profiler  # Runs profiling commands and profiles the Tk thread from update_gui
 
         self.style = ttk.Style()
         # Define styles for TFrame based on color names
@@ -26,15 +44,22 @@ class SimpleGUI(tk.Tk):
         }
 
         self.title("Window Monitor")
-        self.geometry("600x400") # Increased width and height for better text display
+        self.geometry("600x560") # Increased width and height for better text display and today's stats
         self.resizable(True, True)
         # self.attributes("-topmost", True) # Optional: always on top
 
         self.current_state_var = tk.StringVar(value=self.state_manager.get_current_state())
         self.active_work_time_var = tk.StringVar(value="00:00:00")
         self.current_tag_var = tk.StringVar(value="No Tag Selected")
+        self.stats_var = tk.StringVar(value="")
         # Note: self.note_text_widget will be created in _setup_ui
 
+        # Regions invalidated by StateManager notifications, redrawn on the next tick
+        self._dirty_regions = set()
+        self._dirty_lock = threading.Lock()
+        self._applied_color_name = None
+        self.state_manager.add_listener(self._on_state_change)
+
         self._setup_ui()
         self.update_gui() # Initial call to start the GUI update loop
         self.protocol("WM_DELETE_WINDOW", self._on_close) # Handle window close
@@ -98,6 +123,8 @@ class SimpleGUI(tk.Tk):
         self.note_text_widget.grid(row=5, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(0,5))
         self.note_text_widget.insert(tk.END, self.state_manager.get_note()) # Load initial note
         self.note_text_widget.bind("<Control-BackSpace>", self._on_ctrl_backspace)
+        # Unsaved edits are reverted to the saved note once the user leaves the widget
+        self.note_text_widget.bind("<FocusOut>", lambda event: self._mark_dirty("note"))
 
         # Note Buttons
         note_buttons_frame = ttk.Frame(self.left_frame)
@@ -116,6 +143,23 @@ class SimpleGUI(tk.Tk):
         status_bar = ttk.Label(self.left_frame, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W)
         status_bar.grid(row=7, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(10,0))
 
+        # Search box for the log history (only when the logger keeps a search index)
+        if self.data_logger.search_index:
+            ttk.Label(self.left_frame, text="Search:").grid(row=9, column=0, sticky=tk.W, pady=(10,0))
+            self.search_var = tk.StringVar()
+            search_entry = ttk.Entry(self.left_frame, textvariable=self.search_var)
+            search_entry.grid(row=9, column=1, sticky=(tk.W, tk.E), pady=(10,0))
+            search_entry.bind("<Return>", lambda event: self._open_search())
+
+        # Timeline of the logged history
+        ttk.Button(self.left_frame, text="Timeline", command=self._open_timeline).grid(
+            row=10, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(10,0))
+
+        # Today's live statistics (only shown when a LiveStats instance is provided)
+        if self.live_stats:
+            ttk.Label(self.left_frame, text="Today:", font=font.Font(weight='bold')).grid(row=8, column=0, sticky=(tk.W, tk.N), pady=(10,0))
+            ttk.Label(self.left_frame, textvariable=self.stats_var, justify=tk.LEFT).grid(row=8, column=1, sticky=tk.W, pady=(10,0))
+
         # Right Frame Contents (Tags)
         # Create a frame for the Tags header and + button
         tags_header_frame = ttk.Frame(self.right_frame)
@@ -128,32 +172,16 @@ class SimpleGUI(tk.Tk):
         add_tag_button = ttk.Button(tags_header_frame, text="+", width=3, command=self._add_new_tag)
         add_tag_button.pack(side=tk.RIGHT, padx=(5, 0))
         
-        # Create a canvas with scrollbar for tags
-        tag_canvas_frame = ttk.Frame(self.right_frame)
-        tag_canvas_frame.pack(fill=tk.BOTH, expand=True)
-        
-        # Add scrollbar to the frame
-        scrollbar = ttk.Scrollbar(tag_canvas_frame)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        # Type-ahead filter for the tag list
+        self.tag_filter_var = tk.StringVar()
+        tag_filter_entry = ttk.Entry(self.right_frame, textvariable=self.tag_filter_var)
+        tag_filter_entry.pack(fill=tk.X, pady=(0, 5))
+        tag_filter_entry.bind("<KeyRelease>", lambda event: self.tag_list.set_filter(self.tag_filter_var.get()))
         
-        # Create canvas
-        self.tag_canvas = tk.Canvas(tag_canvas_frame, yscrollcommand=scrollbar.set)
-        self.tag_canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        
-        # Configure scrollbar
-        scrollbar.config(command=self.tag_canvas.yview)
-        
-        # Create frame for tags inside canvas
-        self.tags_frame = ttk.Frame(self.tag_canvas)
-        self.tags_frame_window = self.tag_canvas.create_window((0, 0), window=self.tags_frame, anchor=tk.NW)
-        
-        # Add tags as buttons with delete options
-        self.tag_buttons = {}
+        # Virtualized tag list: only the visible rows have widgets, so large tag sets stay responsive
+        self.tag_list = VirtualTagList(self.right_frame, on_select=self._select_tag, on_delete=self._delete_tag)
+        self.tag_list.pack(fill=tk.BOTH, expand=True)
         self._refresh_tag_buttons()
-            
-        # Update canvas scroll region when tags frame changes size
-        self.tags_frame.bind("<Configure>", self._on_frame_configure)
-        self.tag_canvas.bind("<Configure>", self._on_canvas_configure)
         
         # Apply padding to all children in self.left_frame (which uses grid)
         for child in self.left_frame.winfo_children(): 
@@ -237,8 +265,6 @@ class SimpleGUI(tk.Tk):
         
         # Only update UI if state change was successful
         if result is not False:  # None or True is success
-            self.current_state_var.set(self.state_manager.get_current_state())
-            
             # Update status message based on work status
             if new_state == STATE_INACTIVE and work_status:
                 if work_status == "finished":
@@ -248,8 +274,7 @@ class SimpleGUI(tk.Tk):
             else:
                 self.status_var.set(f"State changed to {new_state}.")
                 
-            self._update_button_styles()
-            self._update_background_color()
+            self._render_dirty()
 
     def _update_button_styles(self):
         current_state = self.state_manager.get_current_state()
@@ -276,49 +301,126 @@ class SimpleGUI(tk.Tk):
             # buttons[current_state].configure(relief=tk.SUNKEN) # Simpler highlight - REMOVED TO FIX TCLERROR
             # self.state_label.config(text=current_state) # current_state_var handles this via textvariable
             
-        # Update tag buttons
+        # Update tag buttons (only the visible rows have buttons)
         current_tag = self.state_manager.get_current_tag()
-        for tag, button in self.tag_buttons.items():
+        tag_buttons = self.tag_list.tag_buttons
+        for tag, button in tag_buttons.items():
             if button.winfo_exists():
                 button.configure(style="TButton")
                 
-        if current_tag in self.tag_buttons and self.tag_buttons[current_tag].winfo_exists():
+        if current_tag in tag_buttons and tag_buttons[current_tag].winfo_exists():
             # Highlight the selected tag button
-            self.tag_buttons[current_tag].configure(style="TButton")
+            tag_buttons[current_tag].configure(style="TButton")
+
+    def _on_state_change(self, change):
+        """StateManager listener; only records what to redraw on the next tick"""
+        self._mark_dirty(*DIRTY_REGIONS.get(change, ()))
+
+    def _mark_dirty(self, *regions):
+        with self._dirty_lock:
+            self._dirty_regions.update(regions)
+
+    def _render_dirty(self):
+        """Redraw only the regions whose inputs changed since the last render"""
+        with self._dirty_lock:
+            dirty, self._dirty_regions = self._dirty_regions, set()
+        if not dirty:
+            return
+
+        if "state" in dirty:
+            self.current_state_var.set(self.state_manager.get_current_state())
+        if "tag" in dirty:
+            current_tag = self.state_manager.get_current_tag()
+            self.current_tag_var.set(current_tag if current_tag else "No Tag Selected")
+        if "tag_buttons" in dirty:
+            self._refresh_tag_buttons()
+        if "styles" in dirty:
+            self._update_button_styles()
+        if "background" in dirty:
+            self._update_background_color()
+        if "note" in dirty:
+            # Only update the note widget if it doesn't have focus (user isn't typing in it).
+            # Otherwise keep it dirty so the note is synced once the user is done.
+            if self.note_text_widget.focus_get() == self.note_text_widget:
+                self._mark_dirty("note")
+            else:
+                state_manager_note = self.state_manager.get_note()
+                current_gui_note = self.note_text_widget.get("1.0", tk.END).strip()
+                if current_gui_note != state_manager_note:
+                    self.note_text_widget.delete("1.0", tk.END)
+                    self.note_text_widget.insert(tk.END, state_manager_note)
 
     def update_gui(self):
+        # The timer is the only thing that changes every second
         active_s, _ = self.state_manager.get_session_timers()
-        self.active_work_time_var.set(self._format_time(active_s))
-        self.current_state_var.set(self.state_manager.get_current_state()) # Ensure state var is current
-        
-        # Update current tag display
-        current_tag = self.state_manager.get_current_tag()
-        self.current_tag_var.set(current_tag if current_tag else "No Tag Selected")
-        
-        self._update_button_styles()
-        self._update_background_color() # Added call
-
-        # Only update the note widget if it doesn't have focus (user isn't typing in it)
-        # This prevents the text from being reset while the user is typing
-        if not self.note_text_widget.focus_get() == self.note_text_widget:
-            # Get the current note from the state manager
-            state_manager_note = self.state_manager.get_note()
-            # Get the current text from the widget, strip newlines and whitespace
-            current_gui_note = self.note_text_widget.get("1.0", tk.END).strip()
-            # Only update if they're different and the widget doesn't have focus
-            if current_gui_note != state_manager_note:
-                self.note_text_widget.delete("1.0", tk.END)
-                self.note_text_widget.insert(tk.END, state_manager_note)
+        time_text = self._format_time(active_s)
+        if time_text != self.active_work_time_var.get():
+            self.active_work_time_var.set(time_text)
+
+        # Everything else is redrawn only when StateManager reported a change
+        self._render_dirty()
+        self._update_stats()
+        if self.profiler:
+            self.profiler.poll()
 
         self.after(1000, self.update_gui) # Update every second
 
+    def _open_search(self):
+        """Show matching history segments, reusing the search window if it is already open"""
+        query = self.search_var.get().strip()
+        if not query:
+            return
+        if getattr(self, 'search_dialog', None) and self.search_dialog.winfo_exists():
+            self.search_dialog.search(query)
+            self.search_dialog.lift()
+        else:
+            self.search_dialog = SearchDialog(self, self.data_logger.search_index, query)
+
+    def _open_timeline(self):
+        """Show the timeline window once its data is read on a worker thread; day summaries are kept between openings"""
+        if getattr(self, 'timeline_window', None) and self.timeline_window.winfo_exists():
+            self.timeline_window.lift()
+            return
+        if getattr(self, '_timeline_loading', False):
+            return
+        if not getattr(self, 'timeline_data', None):
+            self.timeline_data = TimelineData(self.data_logger.log_file, self.data_logger.sessions_file)
+        self._timeline_loading = True
+
+        def show():
+            self._timeline_loading = False
+            self.timeline_window = TimelineWindow(self, self.timeline_data)
+
+        self.timeline_data.refresh_in_background(self, show)
+
+    def _update_stats(self):
+        """Render today's statistics; LiveStats keeps them up to date, so this is just formatting"""
+        if not self.live_stats:
+            return
+        stats = self.live_stats.snapshot(current_tag=self.state_manager.get_current_tag())
+        lines = []
+        # Top-level tags only; their totals include all sub-tags
+        for tag, seconds in sorted(stats["tag_seconds"].top_level_totals().items(), key=lambda item: item[1], reverse=True):
+            lines.append(f"{tag}: {self._format_time(seconds)}")
+        for title, seconds in stats["top_titles"]:
+            short_title = title if len(title) <= 40 else title[:37] + "..."
+            lines.append(f"{self._format_time(seconds)}  {short_title}")
+        lines.append(f"Switches: {stats['switches']}    Longest focus: {self._format_time(stats['longest_focus_seconds'])}")
+        stats_text = "\n".join(lines)
+        if stats_text != self.stats_var.get():
+            self.stats_var.set(stats_text)
+
     def _on_close(self):
         print("Closing application...")
-        # Ensure current activity is logged before closing
-        # For STATE_TRACKING, self.window_monitor.stop_monitoring() (called later) will handle logging.
-        
-        if self.window_monitor.monitoring_active:
-            self.window_monitor.stop_monitoring() # Ensure monitor thread is stopped
+        self.state_manager.remove_listener(self._on_state_change)
+        # Ensure current activity is logged before closing: stopping tracking logs the last
+        # window and closes its session at the same moment
+        self.state_manager.shutdown(self.window_monitor)
+
+        self.window_monitor.close() # Stops the monitor thread (and a sampler process, if any)
+        if self.profiler:
+            self.profiler.close() # Writes the report of a profile still running
+        self.data_logger.close()
         self.destroy()
 
     def _save_note(self):
@@ -334,18 +436,16 @@ class SimpleGUI(tk.Tk):
     def _select_tag(self, tag):
         """Handle tag selection"""
         self.state_manager.set_tag(tag)
-        self.current_tag_var.set(tag)
         self.status_var.set(f"Tag set to: {tag}")
-        self._update_button_styles()
-        self._update_background_color() # Added call
+        self._render_dirty()
         
     def _add_new_tag(self):
         """Open a dialog to add a new tag"""
-        new_tag = simpledialog.askstring("Add New Tag", "Enter new tag name:")
+        new_tag = simpledialog.askstring("Add New Tag", "Enter new tag name (use / for sub-tags, e.g. Work/ClientA):")
         if new_tag and new_tag.strip():
             new_tag = new_tag.strip()
             if self.state_manager.add_tag(new_tag):
-                self._refresh_tag_buttons()
+                self._render_dirty()
                 self.status_var.set(f"Added new tag: {new_tag}")
             else:
                 self.status_var.set(f"Tag '{new_tag}' already exists")
@@ -356,48 +456,19 @@ class SimpleGUI(tk.Tk):
             messagebox.showinfo("Cannot Delete", f"The '{TAG_PACING}' tag cannot be deleted as it is required.")
             return
             
-        confirm = messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete the tag '{tag}'?")
+        sub_tags = self.state_manager.tag_tree.subtree_size(tag) - 1
+        message = f"Are you sure you want to delete the tag '{tag}'?"
+        if sub_tags > 0:
+            message = f"Are you sure you want to delete the tag '{tag}' and its {sub_tags} sub-tags?"
+        confirm = messagebox.askyesno("Confirm Delete", message)
         if confirm:
             if self.state_manager.remove_tag(tag):
-                self._refresh_tag_buttons()
+                self._render_dirty()
                 self.status_var.set(f"Deleted tag: {tag}")
                 
     def _refresh_tag_buttons(self):
-        """Refresh the tag buttons based on current tags in state manager"""
-        # Clear existing buttons
-        for widget in self.tags_frame.winfo_children():
-            widget.destroy()
-        
-        # Clear button references
-        self.tag_buttons = {}
-        
-        # Add buttons for each tag
-        for tag in self.state_manager.get_tags():
-            # Create a frame for each tag to hold the button and delete button
-            tag_frame = ttk.Frame(self.tags_frame)
-            tag_frame.pack(fill=tk.X, padx=2, pady=2)
-            
-            # Add the tag button
-            btn = ttk.Button(tag_frame, text=tag, command=lambda t=tag: self._select_tag(t))
-            btn.pack(side=tk.LEFT, fill=tk.X, expand=True)
-            self.tag_buttons[tag] = btn
-            
-            # Add delete button
-            delete_btn = ttk.Button(tag_frame, text="×", width=2, 
-                                  command=lambda t=tag: self._delete_tag(t))
-            delete_btn.pack(side=tk.RIGHT, padx=(2, 0))
-        
-        # Update the canvas scroll region
-        self._on_frame_configure(None)
-        
-    def _on_frame_configure(self, event):
-        """Update the scroll region to encompass the inner frame"""
-        self.tag_canvas.configure(scrollregion=self.tag_canvas.bbox("all"))
-        
-    def _on_canvas_configure(self, event):
-        """When the canvas changes size, resize the frame within it"""
-        # Update the width of the frame to fit the canvas
-        self.tag_canvas.itemconfig(self.tags_frame_window, width=event.width)
+        """Apply added/removed tags from the state manager to the tag list as a diff"""
+        self.tag_list.sync(self.state_manager.get_tags())
 
     def _update_background_color(self):
         current_state = self.state_manager.get_current_state()
@@ -414,6 +485,11 @@ class SimpleGUI(tk.Tk):
         # else: Not Pacing tag, and Not Tracking (e.g., Inactive or other state) = Gray (this is the default)
         # Note: If current_state is STATE_INACTIVE and not Pacing, it will correctly be Gray.
 
+        # Reconfiguring every frame is costly, so skip it when the color didn't change
+        if target_color_name == self._applied_color_name:
+            return
+        self._applied_color_name = target_color_name
+
         frame_style_name = f"{target_color_name}.TFrame"
         root_bg_color = self.BG_COLORS.get(target_color_name, self.BG_COLORS["Gray"])
 
@@ -431,7 +507,5 @@ class SimpleGUI(tk.Tk):
         if hasattr(self, 'note_text_widget') and self.note_text_widget:
             self.note_text_widget.configure(background=root_bg_color)
         
-        if hasattr(self, 'tag_canvas') and self.tag_canvas:  # This is a tk.Canvas
-            self.tag_canvas.configure(background=root_bg_color)
-        if hasattr(self, 'tags_frame') and self.tags_frame:  # This is a ttk.Frame
-            self.tags_frame.configure(style=frame_style_name)
+        if hasattr(self, 'tag_list') and self.tag_list:  # ttk.Frame holding the tag rows
+            self.tag_list.apply_style(frame_style_name)
@@ -0,0 +1,131 @@
+import datetime
+import heapq
+import threading
+from .log_reader import LogOffsetIndex
+from .sessions import load_sessions
+from .tag_tree import TagRollup
+
+# Upper bound on the number of distinct window titles kept in memory.
+# When full, the title with the least time is evicted to make room.
+MAX_TRACKED_TITLES = 500
+
+# Two segments closer than this are considered a direct switch rather than a break
+SWITCH_GAP_SECONDS = 2
+
+
+class LiveStats:
+    """Today's focus statistics, maintained incrementally from WindowMonitor segment boundaries.
+
+    Closed segments are folded into running totals when they end; the segment that
+    is still open is only added on the fly when a snapshot is taken.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._reset(datetime.date.today())
+        self._open_segment = None  # (title, tag, start_time) or None
+        self._log_files = None  # (log_file, sessions_file) seeded from, for resync()
+        self._offsets = None  # LogOffsetIndex of the log, kept so resync() only scans appended bytes
+        # End of the last segment read from the log; events for segments up to it are already counted
+        self._seeded_until = None
+
+    def _reset(self, day):
+        self.day = day
+        self.tag_seconds = TagRollup()  # Per tag, rolled up into parent tags
+        self.title_seconds = {}
+        self.switches = 0
+        self.longest_focus_seconds = 0
+        self._last_end_time = None
+
+    def seed_from_log(self, log_file, sessions_file):
+        """Fold in the segments already logged today (at startup, and again by resync())"""
+        self._log_files = (log_file, sessions_file)
+        if self._offsets is None or self._offsets.log_file != log_file:
+            self._offsets = LogOffsetIndex(log_file)
+        self._offsets.refresh()
+        midnight = datetime.datetime.combine(self.day, datetime.time.min)
+        self._seeded_until = None
+        seeded_until = None
+        # Only today's rows are read, from the offset of today's first row; they are never downsampled
+        for row in self._offsets.iter_rows(midnight, datetime.datetime.max, load_sessions(sessions_file)):
+            self.close_segment(row["start"], row["end"], row["window_title"], row["tag"] or "No Tag")
+            seeded_until = row["end"] if seeded_until is None else max(seeded_until, row["end"])
+        self._seeded_until = seeded_until
+
+    def resync(self):
+        """Rebuild today's totals from the log, after segment events were dropped"""
+        if self._log_files is None:
+            return
+        with self.lock:
+            self._reset(max(self.day, datetime.date.today()))
+        self.seed_from_log(*self._log_files)
+
+    # --- WindowMonitor segment listener interface ---
+
+    def open_segment(self, title, tag, start_time):
+        """A new trackable window became active (title None means nothing is open)"""
+        with self.lock:
+            self._open_segment = (title, tag, start_time) if title else None
+
+    def close_segment(self, start_time, end_time, title, tag):
+        """A segment was logged; fold it into today's totals"""
+        with self.lock:
+            day = end_time.date()
+            if day < self.day:
+                return
+            if day > self.day:
+                self._reset(day)
+            if self._open_segment and self._open_segment[0] == title and self._open_segment[2] == start_time:
+                self._open_segment = None
+            if self._seeded_until and end_time <= self._seeded_until:
+                return  # Read from the log already
+
+            # Only count the part of a segment that falls on the current day
+            start_time = max(start_time, datetime.datetime.combine(day, datetime.time.min))
+            duration = (end_time - start_time).total_seconds()
+            if duration < 0:
+                return
+
+            self.tag_seconds.add_time(tag, duration)
+            self._add_title_seconds(title, duration)
+            if self._last_end_time and abs((start_time - self._last_end_time).total_seconds()) <= SWITCH_GAP_SECONDS:
+                self.switches += 1
+            self._last_end_time = end_time
+            self.longest_focus_seconds = max(self.longest_focus_seconds, duration)
+
+    def _add_title_seconds(self, title, duration):
+        if title not in self.title_seconds and len(self.title_seconds) >= MAX_TRACKED_TITLES:
+            smallest = min(self.title_seconds, key=self.title_seconds.get)
+            del self.title_seconds[smallest]
+        self.title_seconds[title] = self.title_seconds.get(title, 0) + duration
+
+    def snapshot(self, current_tag=None, top_titles=3):
+        """Return today's statistics including the still-open segment.
+
+        current_tag overrides the tag of the open segment, since the tag is only
+        fixed for a segment once it gets logged.
+        """
+        now = datetime.datetime.now()
+        with self.lock:
+            if now.date() > self.day:
+                self._reset(now.date())
+            tag_seconds = self.tag_seconds.copy()
+            title_seconds = dict(self.title_seconds)
+            switches = self.switches
+            longest = self.longest_focus_seconds
+
+            if self._open_segment:
+                title, tag, start_time = self._open_segment
+                start_time = max(start_time, datetime.datetime.combine(self.day, datetime.time.min))
+                duration = max(0, (now - start_time).total_seconds())
+                tag = current_tag or tag
+                tag_seconds.add_time(tag, duration)
+                title_seconds[title] = title_seconds.get(title, 0) + duration
+                longest = max(longest, duration)
+
+        return {
+            "tag_seconds": tag_seconds,  # TagRollup; total_seconds(parent) includes its sub-tags
+            "top_titles": heapq.nlargest(top_titles, title_seconds.items(), key=lambda item: item[1]),
+            "switches": switches,
+            "longest_focus_seconds": longest,
+        }
@@ -0,0 +1,164 @@
+import bisect
+import csv
+import datetime
+import io
+import os
+from .constants import LOG_FILE, SESSIONS_FILE, DATETIME_FORMAT, LOG_COLUMNS, SUMMARY_COLUMNS
+from .sessions import load_sessions, denormalize_row
+
+
+def parse_log_datetime(value):
+    """Parse a datetime written by DataLogger, or return None if it is malformed"""
+    try:
+        return datetime.datetime.strptime(value, DATETIME_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+
+def summary_file_for(log_file):
+    """Summaries of rows removed from a log by retention.py are kept next to it"""
+    return os.path.splitext(log_file)[0] + "_summary.csv"
+
+
+def iter_summary_rows(log_file=LOG_FILE, since=None):
+    """Stream the summaries of a log's downsampled rows, shaped like iter_log_rows rows.
+
+    A summary covers the segments of one period with the same tag, title class and
+    note: window_title is the title class, 'start' and 'end' span its segments and
+    duration_seconds is their exact sum. Fields of single segments are empty.
+    """
+    summary_file = summary_file_for(log_file)
+    if not os.path.exists(summary_file):
+        return
+    with open(summary_file, 'r', newline='', encoding='utf-8') as f:
+        for values in csv.reader(f):
+            if values == SUMMARY_COLUMNS or len(values) != len(SUMMARY_COLUMNS):
+                continue  # Header or partially written row
+            summary = dict(zip(SUMMARY_COLUMNS, values))
+            start = parse_log_datetime(summary["datetime_start"])
+            end = parse_log_datetime(summary["datetime_end"])
+            if start is None or end is None or (since is not None and end < since):
+                continue
+            yield {
+                "datetime_start": summary["datetime_start"], "datetime_end": summary["datetime_end"],
+                "duration_seconds": summary["duration_seconds"], "window_title": summary["title_class"],
+                "session_id": "", "pid": "", "exe_name": "", "window_class": "",
+                "tag": summary["tag"], "note": summary["note"], "work_status": "", "break_reason": "",
+                "segments": summary["segments"], "start": start, "end": end,
+            }
+
+
+def iter_log_rows(log_file=LOG_FILE, since=None, sessions_file=SESSIONS_FILE):
+    """Stream rows of the window log as dicts, with 'start' and 'end' parsed to datetimes.
+
+    Each segment is joined with its session record, so rows carry tag, note,
+    work_status and break_reason as in the legacy format. Rows ending before
+    `since` are skipped. Malformed rows are skipped too, so a partially written
+    last line never breaks a reader. Summaries of downsampled rows (see
+    iter_summary_rows) come first, as only the oldest rows are downsampled.
+    """
+    yield from iter_summary_rows(log_file, since)
+    if not os.path.exists(log_file):
+        return
+    sessions = load_sessions(sessions_file)
+    with open(log_file, 'r', newline='', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            start = parse_log_datetime(row.get("datetime_start"))
+            end = parse_log_datetime(row.get("datetime_end"))
+            if start is None or end is None:
+                continue
+            if since is not None and end < since:
+                continue
+            row["start"] = start
+            row["end"] = end
+            if "session_id" in row:
+                denormalize_row(row, sessions.get(row["session_id"]))
+            yield row
+
+
+def iter_log_from_offset(log_file, offset=0):
+    """Yield (row values, offset after the row) for complete rows starting at a byte offset.
+
+    The returned offsets always fall on row boundaries, so an export can resume
+    from any of them. A partially written last line is left for the next call.
+    """
+    position = offset
+
+    def complete_lines(f):
+        nonlocal position
+        for line in f:
+            if not line.endswith(b"\n"):
+                return
+            position += len(line)
+            yield line.decode('utf-8', errors='replace')
+
+    with open(log_file, 'rb') as f:
+        f.seek(offset)
+        # csv.reader pulls exactly the lines of one row at a time, so `position` is at its end
+        for values in csv.reader(complete_lines(f)):
+            yield values, position
+
+
+class LogOffsetIndex:
+    """Byte offset of the first row of each day in the window log.
+
+    Rows are appended in chronological order, so the rows of a time range can be
+    read by seeking to the offset of its first day instead of scanning the whole
+    file. refresh() only scans bytes appended since the previous call.
+    """
+
+    def __init__(self, log_file=LOG_FILE):
+        self.log_file = log_file
+        self.days = []      # 'YYYY-MM-DD' strings, ascending
+        self.offsets = []   # Byte offset of the first row of each day
+        self._scanned = 0
+        self._identity = None
+
+    def refresh(self):
+        if not os.path.exists(self.log_file):
+            return
+        stat = os.stat(self.log_file)
+        if stat.st_ino != self._identity or stat.st_size < self._scanned:
+            # New or rewritten file (e.g. compacted): index it from scratch
+            self.days, self.offsets, self._scanned = [], [], 0
+            self._identity = stat.st_ino
+        with open(self.log_file, 'rb') as f:
+            f.seek(self._scanned)
+            offset = self._scanned
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Partially written last row; picked up next time
+                # Continuation lines of quoted values don't start with a date, so they are skipped
+                if len(line) > 10 and line[4:5] == b"-" and line[7:8] == b"-" and line[:4].isdigit():
+                    day = line[:10].decode('ascii', errors='replace')
+                    if not self.days or day > self.days[-1]:
+                        self.days.append(day)
+                        self.offsets.append(offset)
+                offset += len(line)
+            self._scanned = offset
+
+    def iter_rows(self, start, end, sessions):
+        """Yield rows (joined with sessions, see iter_log_rows) overlapping [start, end)"""
+        if not self.days:
+            return
+        # Rows are indexed by the day they start, so reading starts one day earlier:
+        # a segment that began before midnight may still overlap the range
+        i = bisect.bisect_left(self.days, start.strftime("%Y-%m-%d")) - 1
+        offset = self.offsets[max(i, 0)]
+        with open(self.log_file, 'rb') as raw:
+            raw.seek(offset)
+            text = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+            for values in csv.reader(text):
+                row = dict(zip(LOG_COLUMNS, values))
+                row_start = parse_log_datetime(row.get("datetime_start"))
+                row_end = parse_log_datetime(row.get("datetime_end"))
+                if row_start is None or row_end is None:
+                    continue
+                if row_start >= end:
+                    break
+                if row_end <= start:
+                    continue
+                row["start"] = row_start
+                row["end"] = row_end
+                yield denormalize_row(row, sessions.get(row.get("session_id")))
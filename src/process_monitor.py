@@ -0,0 +1,307 @@
+"""Window sampling in a child process, for a GUI-independent sampling rate.
+
+The child process polls the active window and writes an event to a ring buffer in
+shared memory whenever the title changes. The main process reads the events with
+the time they were sampled, so a busy Tk main loop (or the GIL) only delays when
+switches are logged, not their timestamps. A hung window backend only blocks the
+child, which a watchdog restarts once it stops producing heartbeats.
+"""
+import datetime
+import multiprocessing
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+from .constants import STATE_TRACKING, MONITOR_SAMPLE_INTERVAL, MONITOR_RING_SLOTS, MONITOR_WATCHDOG_TIMEOUT
+from .window_monitor import WindowMonitor
+from .window_info import WindowInfo
+from .clock import SYSTEM_CLOCK
+
+# Ring header: number of events written, number of samples taken (the heartbeat)
+_HEADER = struct.Struct("<QQ")
+# Slot header: event sequence number (0 while being written), sample time, process id,
+# byte lengths of the title, executable name and window class, and whether the window info is known.
+# The three strings follow the header.
+_SLOT_HEADER = struct.Struct("<QdIHBBB")
+_SEQ = struct.Struct("<Q")
+SLOT_SIZE = 1024
+MAX_NAME_BYTES = 255
+MAX_TITLE_BYTES = SLOT_SIZE - _SLOT_HEADER.size - 2 * MAX_NAME_BYTES
+# Title length marking a sample of our own GUI window, which the monitor ignores
+_IGNORED_TITLE = 0xFFFF
+
+# How often the main process reads new events
+CONSUME_INTERVAL = 0.25
+
+_NOT_SAMPLED = object()  # Makes the sampler always publish its first sample
+
+
+def _truncate_utf8(text, max_bytes):
+    encoded = text.encode('utf-8')
+    if len(encoded) <= max_bytes:
+        return encoded
+    return encoded[:max_bytes].decode('utf-8', errors='ignore').encode('utf-8')
+
+
+class SharedEventRing:
+    """Fixed-size window switch events in shared memory, with one writer and one reader.
+
+    The writer zeroes a slot's sequence number before overwriting it and stores it
+    last, so a reader that finds the expected number before and after copying a slot
+    knows the copy is intact. A reader that falls more than `slots` events behind
+    skips the overwritten ones and reports them as lost.
+    """
+
+    def __init__(self, name=None, slots=MONITOR_RING_SLOTS, create=False):
+        size = _HEADER.size + slots * SLOT_SIZE
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=size if create else 0)
+        self.slots = slots
+        if create:
+            _HEADER.pack_into(self.shm.buf, 0, 0, 0)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def _slot_offset(self, seq):
+        return _HEADER.size + (seq % self.slots) * SLOT_SIZE
+
+    def write_index(self):
+        return _HEADER.unpack_from(self.shm.buf, 0)[0]
+
+    def heartbeat(self):
+        return _HEADER.unpack_from(self.shm.buf, 0)[1]
+
+    def append(self, title, timestamp, window_info=None):
+        """Write a sample (title None for our own window) taken at a time.time() timestamp"""
+        buf = self.shm.buf
+        seq = self.write_index() + 1
+        offset = self._slot_offset(seq)
+        if title is None:
+            encoded, length = b"", _IGNORED_TITLE
+        else:
+            encoded = _truncate_utf8(title, MAX_TITLE_BYTES)
+            length = len(encoded)
+        pid, exe_name, window_class = window_info or (0, "", "")
+        exe_encoded = _truncate_utf8(exe_name, MAX_NAME_BYTES)
+        class_encoded = _truncate_utf8(window_class, MAX_NAME_BYTES)
+        data = encoded + exe_encoded + class_encoded
+        _SEQ.pack_into(buf, offset, 0)
+        data_offset = offset + _SLOT_HEADER.size
+        buf[data_offset:data_offset + len(data)] = data
+        _SLOT_HEADER.pack_into(buf, offset, seq, timestamp, pid, length, len(exe_encoded), len(class_encoded),
+                               1 if window_info else 0)
+        _SEQ.pack_into(buf, 0, seq)
+
+    def beat(self):
+        _SEQ.pack_into(self.shm.buf, _SEQ.size, self.heartbeat() + 1)
+
+    def read_after(self, last_seq):
+        """Return ([(seq, timestamp, title, window info), ...], number of lost events) for events after last_seq"""
+        buf = self.shm.buf
+        index = self.write_index()
+        if index <= last_seq:
+            return [], 0
+        first = max(last_seq + 1, index - self.slots + 1)
+        lost = first - last_seq - 1
+        events = []
+        for seq in range(first, index + 1):
+            offset = self._slot_offset(seq)
+            slot_seq, timestamp, pid, length, exe_length, class_length, has_info = \
+                _SLOT_HEADER.unpack_from(buf, offset)
+            title_length = 0 if length == _IGNORED_TITLE else length
+            data_offset = offset + _SLOT_HEADER.size
+            data = bytes(buf[data_offset:data_offset + title_length + exe_length + class_length])
+            if slot_seq != seq or _SEQ.unpack_from(buf, offset)[0] != seq:
+                lost += 1  # Overwritten while we were reading it
+                continue
+            title = None if length == _IGNORED_TITLE else data[:title_length].decode('utf-8', errors='replace')
+            window_info = None
+            if has_info:
+                window_info = WindowInfo(
+                    pid, data[title_length:title_length + exe_length].decode('utf-8', errors='replace'),
+                    data[title_length + exe_length:].decode('utf-8', errors='replace'))
+            events.append((seq, timestamp, title, window_info))
+        return events, lost
+
+    def close(self, unlink=False):
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _sampler_main(ring_name, slots, sample_interval):
+    """Child process: sample the active window and publish title changes until the parent exits"""
+    ring = SharedEventRing(ring_name, slots)
+    sampler = WindowMonitor()  # Only used for its active window lookup
+    parent = multiprocessing.parent_process()
+    last_sample = _NOT_SAMPLED
+    try:
+        while parent is None or parent.is_alive():
+            title = sampler._get_active_window_title()
+            sample = (title, sampler.sampled_window_info)
+            if sample != last_sample:
+                ring.append(title, time.time(), sampler.sampled_window_info)
+                last_sample = sample
+            ring.beat()
+            time.sleep(sample_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ring.close()
+
+
+class ProcessWindowMonitor(WindowMonitor):
+    """WindowMonitor whose samples come from a child process through a SharedEventRing.
+
+    Segments are logged and listeners notified exactly as by WindowMonitor, from the
+    monitor thread of the main process; only the window lookup moves out of it.
+    """
+
+    def __init__(self, sample_interval=MONITOR_SAMPLE_INTERVAL, ring_slots=MONITOR_RING_SLOTS,
+                 watchdog_timeout=MONITOR_WATCHDOG_TIMEOUT, clock=SYSTEM_CLOCK, event_bus=None):
+        super().__init__(clock, event_bus)
+        self.sample_interval = sample_interval
+        self.ring_slots = ring_slots
+        self.watchdog_timeout = watchdog_timeout
+        self.ring = None
+        self.process = None
+        self.last_seq = 0
+        self.latest_title = "Unknown Window"
+        self.latest_window_info = None
+        self._heartbeat = 0
+        self._heartbeat_changed = time.monotonic()
+        self.restarts = 0
+        self.lost_events = 0
+        self._ring_lock = threading.Lock()
+        # Guards self.process: the monitor thread restarts the sampler, close() stops it
+        self._sampler_lock = threading.Lock()
+        self._closed = False
+
+    # --- Sampler process (called with _sampler_lock held) ---
+
+    def _start_sampler(self):
+        if self.ring is None:
+            self.ring = SharedEventRing(slots=self.ring_slots, create=True)
+        self.process = multiprocessing.Process(
+            target=_sampler_main, args=(self.ring.name, self.ring_slots, self.sample_interval),
+            name="window-sampler", daemon=True)
+        self.process.start()
+        self._heartbeat = self.ring.heartbeat()
+        self._heartbeat_changed = time.monotonic()
+
+    def _stop_sampler(self):
+        if self.process is None:
+            return
+        self.process.terminate()
+        self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.process.kill()  # Stuck in a call that ignores SIGTERM
+            self.process.join(timeout=2)
+        self.process = None
+
+    def _check_watchdog(self):
+        """Start the sampler, or restart it if it died or has not completed a sample for watchdog_timeout seconds"""
+        with self._sampler_lock:
+            if self._closed:
+                return
+            if self.process is None:
+                self._start_sampler()
+                return
+            heartbeat = self.ring.heartbeat()
+            now = time.monotonic()
+            if heartbeat != self._heartbeat:
+                self._heartbeat = heartbeat
+                self._heartbeat_changed = now
+                return
+            if self.process.is_alive() and now - self._heartbeat_changed < self.watchdog_timeout:
+                return
+            print(f"Window sampler not responding for {now - self._heartbeat_changed:.0f}s, restarting it")
+            self._stop_sampler()
+            self._start_sampler()
+            self.restarts += 1
+
+    def _read_events(self):
+        """Return [(title, window info, sampled datetime), ...] published since the last call"""
+        events, lost = self.ring.read_after(self.last_seq)
+        if lost:
+            self.lost_events += lost
+            print(f"Window sampler overran the event ring, {lost} switches lost")
+        samples = []
+        for seq, timestamp, title, window_info in events:
+            self.last_seq = seq
+            self.latest_title = title
+            self.latest_window_info = window_info
+            samples.append((title, window_info, datetime.datetime.fromtimestamp(timestamp)))
+        return samples
+
+    # --- WindowMonitor overrides ---
+
+    def _get_active_window_title(self):
+        """Latest title published by the sampler so far (used for the first segment, on the GUI thread,
+        which never waits for the sampler); the monitor thread corrects it once the sampler reports"""
+        self.sampled_window_info = self.latest_window_info
+        return self.latest_title
+
+    def _monitor_loop(self, stop_event):
+        # Starting (or restarting) the sampler and waiting for its first sample can take
+        # seconds, so it happens here rather than in start_monitoring on the GUI thread
+        self._check_watchdog()
+        ring = self.ring
+        deadline = time.monotonic() + self.watchdog_timeout
+        while ring is not None and not self._closed and ring.write_index() == 0 \
+                and time.monotonic() < deadline and not stop_event.is_set():
+            stop_event.wait(0.05)
+        self._apply_events(stop_event=stop_event, first=True)
+        while not stop_event.is_set():
+            if not self.state_manager_ref or self.state_manager_ref.get_current_state() != STATE_TRACKING:
+                break
+            self._apply_events(stop_event=stop_event)
+            self._check_watchdog()
+            if self.profiler:
+                self.profiler.checkpoint()
+            stop_event.wait(CONSUME_INTERVAL)
+        if self.profiler:
+            self.profiler.checkpoint(exiting=True)
+
+    def stop_monitoring(self, end_time=None):
+        if self.monitoring_active and self.ring is not None:
+            end_time = end_time or self.clock.now()
+            # Switches sampled before the transition but not read yet still belong to this run.
+            # Reading the ring never blocks, unlike waiting for the monitor thread.
+            self._apply_events(until=end_time)
+        super().stop_monitoring(end_time)
+
+    def split_segment(self, split_time=None):
+        if self.monitoring_active and self.ring is not None:
+            split_time = split_time or self.clock.now()
+            # Switches sampled before the split but not read yet belong to the part before it
+            self._apply_events()
+        super().split_segment(split_time)
+
+    def _apply_events(self, until=None, stop_event=None, first=False):
+        # The monitor thread and stop_monitoring both read the ring; each event is applied once
+        with self._ring_lock:
+            if self.ring is None:
+                return
+            samples = self._read_events()
+            if first and self.current_window_start_time:
+                # Switches before tracking started only matter for the current title
+                before = [sample for sample in samples if sample[2] <= self.current_window_start_time]
+                samples = before[-1:] + samples[len(before):]
+            for title, window_info, sampled_at in samples:
+                if until and sampled_at > until:
+                    continue
+                # A switch sampled just before tracking started belongs to the first segment
+                if self.current_window_start_time and sampled_at < self.current_window_start_time:
+                    sampled_at = self.current_window_start_time
+                self._handle_sample(title, sampled_at, window_info, stop_event)
+
+    def close(self):
+        super().close()
+        with self._sampler_lock, self._ring_lock:
+            self._closed = True
+            self._stop_sampler()
+            if self.ring is not None:
+                self.ring.close(unlink=True)
+                self.ring = None
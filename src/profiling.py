@@ -0,0 +1,303 @@
+"""On-demand profiling of a running tracker.
+
+Profiling is started and stopped without restarting the app: with --profile at
+startup, by SIGUSR1 (SIGBREAK, i.e. Ctrl+Break, on Windows) or with the 'profile'
+command when the tracker listens on --profile-port. While it runs, the Tk main
+loop and the monitor thread are profiled with cProfile, allocations are traced
+with tracemalloc, and gauges (e.g. the number of known window titles or Tk
+widgets) are read at every snapshot. Stopping or dumping writes a report with the
+top functions per thread, the top allocations, their growth and the gauges.
+
+cProfile only profiles the thread that enables it, so each profiled thread calls
+checkpoint() once per loop and starts or stops its own profile there. While
+profiling is off nothing is installed; a checkpoint is a single comparison.
+"""
+import collections
+import cProfile
+import datetime
+import io
+import os
+import pstats
+import signal
+import socket
+import socketserver
+import threading
+import time
+import tracemalloc
+from .constants import (
+    PROFILE_DIR, PROFILE_TOP_FUNCTIONS, PROFILE_TOP_ALLOCATIONS, PROFILE_TRACEBACK_FRAMES,
+    PROFILE_HANDOFF_TIMEOUT, PROFILE_CONTROL_PORT
+)
+
+PROFILE_COMMANDS = ("start", "stop", "toggle", "snapshot", "dump", "status")
+
+
+def count_widgets(widget):
+    """Number of Tk widgets below (and including) widget"""
+    return 1 + sum(count_widgets(child) for child in widget.winfo_children())
+
+
+class Profiler:
+    """cProfile and tracemalloc sessions controlled from signals, other threads or the GUI.
+
+    Requests are queued by request(); poll() runs them on the GUI thread, which is
+    also where gauges are read, since they may look at Tk widgets.
+    """
+
+    def __init__(self, report_dir=PROFILE_DIR):
+        self.report_dir = report_dir
+        self.active = False
+        self.started_at = None
+        # Bumped to make every profiled thread hand in its profile (and start a new one if active)
+        self.generation = 0
+        self.lock = threading.Lock()
+        self._local = threading.local()
+        self.requests = collections.deque()  # (command, argument); appending is safe from signal handlers
+        self.running = {}  # thread ident -> (thread name, generation) for threads with an enabled profile
+        self.finished = []  # (thread name, disabled cProfile.Profile) not yet reported
+        self.gauges = {}  # name -> callable returning a number
+        self.gauge_readings = []  # (time, {name: value})
+        self.first_snapshot = None
+        self.latest_snapshot = None
+        self._started_tracemalloc = False
+        self._pending_reports = []  # Reports waiting for threads to hand in their profiles
+        self._report_threads = []
+
+    def add_gauge(self, name, read):
+        self.gauges[name] = read
+
+    def request(self, command, argument=None):
+        """Queue a command from any thread (or a signal handler); returns a short description"""
+        if command not in PROFILE_COMMANDS:
+            raise ValueError(f"Unknown profiling command: {command}")
+        if command == "status":
+            if not self.active:
+                return "profiling is off"
+            threads = ", ".join(sorted(name for name, _ in self.running.values()))
+            return f"profiling since {self.started_at:%H:%M:%S}, threads: {threads}"
+        if command in ("stop", "dump") or (command == "toggle" and self.active):
+            argument = argument or self._default_report_path()
+            self.requests.append((command, argument))
+            return f"report will be written to {argument}"
+        self.requests.append((command, argument))
+        return f"{command} requested"
+
+    def _default_report_path(self):
+        return os.path.join(self.report_dir, datetime.datetime.now().strftime("profile-%Y%m%d-%H%M%S.txt"))
+
+    # --- Called by profiled threads ---
+
+    def checkpoint(self, exiting=False):
+        """Start or stop the calling thread's profile as requested; exiting hands in the profile for good"""
+        local = self._local
+        if getattr(local, "generation", None) == self.generation and not exiting:
+            return
+        profile = getattr(local, "profile", None)
+        if profile is not None:
+            profile.disable()
+            with self.lock:
+                self.running.pop(threading.get_ident(), None)
+                self.finished.append((threading.current_thread().name, profile))
+            local.profile = None
+        local.generation = self.generation
+        if self.active and not exiting:
+            with self.lock:
+                self.running[threading.get_ident()] = (threading.current_thread().name, self.generation)
+            local.profile = cProfile.Profile()
+            local.profile.enable()
+
+    def poll(self):
+        """Run queued commands and apply them to the calling (GUI) thread; call about once a second"""
+        while self.requests:
+            command, argument = self.requests.popleft()
+            try:
+                self._run(command, argument)
+            except Exception as e:
+                print(f"Error running profiling command '{command}': {e}")
+        self.checkpoint()
+        if self._pending_reports:
+            self._write_ready_reports()
+
+    def _run(self, command, argument):
+        if command == "toggle":
+            command = "stop" if self.active else "start"
+        if command == "start" and not self.active:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(PROFILE_TRACEBACK_FRAMES)
+                self._started_tracemalloc = True
+            self.active = True
+            self.started_at = datetime.datetime.now()
+            self.generation += 1
+            self.gauge_readings = []
+            self._read_gauges()
+            self.first_snapshot = tracemalloc.take_snapshot()
+            self.latest_snapshot = None
+            print("Profiling started")
+        elif command == "snapshot" and self.active:
+            self._read_gauges()
+            self.latest_snapshot = tracemalloc.take_snapshot()
+        elif command in ("stop", "dump") and self.active:
+            argument = argument or self._default_report_path()
+            self._read_gauges()
+            self.latest_snapshot = tracemalloc.take_snapshot()
+            if command == "stop":
+                self.active = False
+                if self._started_tracemalloc:
+                    tracemalloc.stop()
+                    self._started_tracemalloc = False
+            # Threads hand in their profiles at their next checkpoint; the report waits for them
+            self.generation += 1
+            with self.lock:
+                waiting = set(self.running)
+            self._pending_reports.append({
+                "path": argument,
+                "generation": self.generation,
+                "waiting": waiting,
+                "deadline": time.monotonic() + PROFILE_HANDOFF_TIMEOUT,
+                "started_at": self.started_at,
+                "gauges": list(self.gauge_readings),
+                "first_snapshot": self.first_snapshot,
+                "latest_snapshot": self.latest_snapshot,
+            })
+            if command == "stop":
+                self.first_snapshot = self.latest_snapshot = None  # Snapshots are large
+                print("Profiling stopped")
+
+    def _read_gauges(self):
+        values = {}
+        for name, read in self.gauges.items():
+            try:
+                values[name] = read()
+            except Exception as e:
+                values[name] = f"error: {e}"
+        self.gauge_readings.append((datetime.datetime.now(), values))
+
+    # --- Reports ---
+
+    def _write_ready_reports(self):
+        alive = {thread.ident for thread in threading.enumerate()}
+        while self._pending_reports:
+            report = self._pending_reports[0]
+            with self.lock:
+                # A thread is done once it handed in (it may have started a newer profile since)
+                # or when it is gone; a thread that ended without a last checkpoint loses its profile
+                report["waiting"] = {ident for ident in report["waiting"]
+                                     if ident in alive and ident in self.running
+                                     and self.running[ident][1] < report["generation"]}
+                if report["waiting"] and time.monotonic() < report["deadline"]:
+                    return
+                report["profiles"], self.finished = self.finished, []
+                report["missing"] = [self.running[ident][0] for ident in report["waiting"]]
+            self._pending_reports.pop(0)
+            report["written_at"] = datetime.datetime.now()
+            # Formatting the statistics takes a while; keep it off the GUI thread
+            thread = threading.Thread(target=self._save_report, args=(report["path"], report),
+                                      name="profile-report", daemon=True)
+            thread.start()
+            self._report_threads = [t for t in self._report_threads if t.is_alive()] + [thread]
+
+    def close(self):
+        """Stop profiling, if it is running, and finish writing reports before the application exits"""
+        if self.active:
+            self.request("stop")
+        self.poll()
+        while self._pending_reports:
+            time.sleep(0.05)  # The deadline of each pending report bounds this
+            self._write_ready_reports()
+        for thread in self._report_threads:
+            thread.join()
+
+    def _save_report(self, path, report):
+        try:
+            text = format_report(report)
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            print(f"Profile report written to {path}")
+        except Exception as e:
+            print(f"Error writing profile report {path}: {e}")
+
+
+def format_report(report):
+    out = io.StringIO()
+    started, written = report["started_at"], report["written_at"]
+    out.write(f"Profile report written {written:%Y-%m-%d %H:%M:%S}\n")
+    if started:
+        out.write(f"Profiled since {started:%Y-%m-%d %H:%M:%S} ({(written - started).total_seconds():.0f} s)\n")
+    for name in report["missing"]:
+        out.write(f"Thread {name} did not hand in its profile in time; it is included in the next report\n")
+
+    by_thread = {}
+    for name, profile in report["profiles"]:
+        stats = by_thread.get(name)
+        if stats is None:
+            by_thread[name] = pstats.Stats(profile, stream=out)
+        else:
+            stats.add(profile)
+    for name, stats in by_thread.items():
+        out.write(f"\n== Thread {name}: top {PROFILE_TOP_FUNCTIONS} functions by cumulative time ==\n")
+        stats.sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+
+    latest, first = report["latest_snapshot"], report["first_snapshot"]
+    if latest is not None:
+        out.write(f"\n== Top {PROFILE_TOP_ALLOCATIONS} allocations (tracemalloc) ==\n")
+        for stat in latest.statistics("lineno")[:PROFILE_TOP_ALLOCATIONS]:
+            out.write(f"{stat}\n")
+        if first is not None:
+            out.write(f"\n== Top {PROFILE_TOP_ALLOCATIONS} allocation growth since profiling started ==\n")
+            for stat in latest.compare_to(first, "lineno")[:PROFILE_TOP_ALLOCATIONS]:
+                out.write(f"{stat}\n")
+
+    if report["gauges"]:
+        names = list(dict.fromkeys(name for _, values in report["gauges"] for name in values))
+        out.write("\n== Gauges ==\n")
+        out.write("time      " + "  ".join(f"{name:>20}" for name in names) + "\n")
+        for moment, values in report["gauges"]:
+            out.write(f"{moment:%H:%M:%S}  " + "  ".join(f"{str(values.get(name, '')):>20}" for name in names) + "\n")
+    return out.getvalue()
+
+
+def install_signal_handler(profiler):
+    """Toggle profiling on SIGUSR1 (Ctrl+Break on Windows); returns the signal name, or None"""
+    signum = getattr(signal, "SIGUSR1", None) or getattr(signal, "SIGBREAK", None)
+    if signum is None:
+        return None
+    signal.signal(signum, lambda *_: profiler.request("toggle"))
+    return signal.Signals(signum).name
+
+
+class _ControlHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline(1024).decode('utf-8', errors='replace').strip()
+        command, _, argument = line.partition(" ")
+        try:
+            reply = self.server.profiler.request(command, argument or None)
+        except ValueError as e:
+            reply = str(e)
+        self.wfile.write((reply + "\n").encode('utf-8'))
+
+
+class ProfilerControlServer(socketserver.ThreadingTCPServer):
+    """Accepts one-line profiling commands ('start', 'dump [path]', ...) on a localhost port"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, profiler, port=PROFILE_CONTROL_PORT):
+        super().__init__(("127.0.0.1", port), _ControlHandler)
+        self.profiler = profiler
+        self.thread = threading.Thread(target=self.serve_forever, name="profile-control", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+def send_command(command, argument=None, port=PROFILE_CONTROL_PORT, timeout=5):
+    """Send a command to a tracker started with --profile-port and return its reply"""
+    with socket.create_connection(("127.0.0.1", port), timeout=timeout) as connection:
+        connection.sendall(f"{command} {argument or ''}".strip().encode('utf-8') + b"\n")
+        return connection.makefile('r', encoding='utf-8').readline().strip()
@@ -0,0 +1,248 @@
+"""Downsampling of old window log rows into hourly or daily summaries.
+
+Rows that started before the retention cutoff (midnight, retention_days ago) are
+folded into one summary per (period, tag, title class, note) in the summary file
+next to the log (see log_reader.summary_file_for), and removed from the log. The
+removed rows are appended to a compressed archive unless archiving is disabled.
+Durations are summed as logged, never recomputed, so the seconds per tag and day
+stay exactly the same; iter_log_rows, the timeline and the exporters read the
+summaries alongside the log.
+
+Only the summarized head of the log is parsed; the rest is copied verbatim, and
+rows appended in the meantime are copied under the log's append lock (see
+file_lock.py) right before the new log is swapped in, so logging never waits for
+a run, even when it happens in another process.
+"""
+import contextlib
+import csv
+import datetime
+import gzip
+import os
+import shutil
+import threading
+from .constants import (
+    LOG_FILE, SESSIONS_FILE, DATETIME_FORMAT, LOG_COLUMNS, SESSION_LOG_COLUMNS_V1, SUMMARY_COLUMNS,
+    RETENTION_DEFAULT_DAYS, RETENTION_RESOLUTION, RETENTION_DAILY, RETENTION_ARCHIVE, RETENTION_CHECK_INTERVAL
+)
+from .log_reader import parse_log_datetime, summary_file_for, iter_log_from_offset
+from .file_lock import append_lock_for, rewrite_lock_for
+from .sessions import load_sessions, denormalize_row
+
+
+def archive_file_for(log_file):
+    return os.path.splitext(log_file)[0] + "_archive.csv.gz"
+
+
+def title_class(title, exe_name=""):
+    """What summaries group window titles by: the executable if known, otherwise the
+    application part of a 'Document - Application' title, otherwise the title itself"""
+    if exe_name:
+        return exe_name
+    return title.rsplit(" - ", 1)[-1].strip() or title
+
+
+def _period_start(moment, resolution):
+    if resolution == RETENTION_DAILY:
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _previous_cutoff(summary_file):
+    """Cutoff of the latest run that wrote summaries, or None"""
+    latest = ""
+    if os.path.exists(summary_file):
+        with open(summary_file, 'r', newline='', encoding='utf-8') as f:
+            for values in csv.reader(f):
+                if len(values) == len(SUMMARY_COLUMNS) and values != SUMMARY_COLUMNS:
+                    latest = max(latest, values[-1])
+    return parse_log_datetime(latest)
+
+
+def _append_atomically(path, header, rows):
+    """Write path's current content plus rows to a temporary file and swap it in"""
+    tmp_path = path + ".retention.tmp"
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as out:
+        if os.path.exists(path):
+            with open(path, 'r', newline='', encoding='utf-8') as f:
+                shutil.copyfileobj(f, out)
+        else:
+            csv.writer(out).writerow(header)
+        csv.writer(out).writerows(rows)
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(tmp_path, path)
+
+
+def downsample_log(log_file=LOG_FILE, sessions_file=SESSIONS_FILE, retention_days=RETENTION_DEFAULT_DAYS,
+                   resolution=RETENTION_RESOLUTION, archive=RETENTION_ARCHIVE, now=None, file_lock=None,
+                   stop_event=None, wait=True):
+    """Summarize and remove the rows of log_file that started before midnight retention_days ago.
+
+    file_lock is the lock held while appending to the log (by default the lock file
+    next to it); it is only taken to copy the last appended rows and swap in the new
+    log. If stop_event gets set while the log is read, the run is abandoned before
+    anything is written. While another rewrite (e.g. the compact command) runs, the
+    run waits for it, or does nothing if wait is False.
+
+    Returns a dict with the cutoff and the number of rows summarized, summaries
+    written and seconds summarized.
+    """
+    now = now or datetime.datetime.now()
+    cutoff = datetime.datetime.combine(now.date() - datetime.timedelta(days=retention_days), datetime.time.min)
+    stats = {"cutoff": cutoff.strftime(DATETIME_FORMAT), "rows": 0, "summaries": 0, "seconds": 0}
+    if not os.path.exists(log_file):
+        return stats
+    rewrite_lock = rewrite_lock_for(log_file)
+    if not rewrite_lock.acquire(wait):
+        return stats
+    try:
+        return _downsample_log(log_file, sessions_file, resolution, archive, cutoff, stats,
+                               file_lock or append_lock_for(log_file), stop_event)
+    finally:
+        rewrite_lock.release()
+
+
+def _downsample_log(log_file, sessions_file, resolution, archive, cutoff, stats, file_lock, stop_event):
+    summary_file = summary_file_for(log_file)
+    archive_file = archive_file_for(log_file)
+    archive_tmp = archive_file + ".retention.tmp"
+    # Rows that started before the previous run's cutoff were summarized by it, but that
+    # run was interrupted before it could swap in the log without them
+    previous_cutoff = _previous_cutoff(summary_file)
+    sessions = load_sessions(sessions_file)
+    groups = {}  # (period start, tag, title class, note) -> [first start, last end, seconds, segments]
+    kept = []  # Malformed rows before the cutoff stay in the log rather than dropping data
+    already_summarized = 0
+    split_offset = 0  # Rows from here on are copied to the new log verbatim
+
+    with contextlib.ExitStack() as stack:
+        archive_writer = None
+        if archive:
+            archive_out = stack.enter_context(gzip.open(archive_tmp, 'wt', newline='', encoding='utf-8'))
+            archive_writer = csv.writer(archive_out)
+            if not os.path.exists(archive_file):
+                archive_writer.writerow(LOG_COLUMNS)
+
+        # Rows are appended in chronological order, so only the head of the log is parsed
+        for values, offset in iter_log_from_offset(log_file):
+            if stop_event is not None and stop_event.is_set():
+                break
+            if values and values[0] == LOG_COLUMNS[0]:
+                split_offset = offset  # Header
+                continue
+            start = parse_log_datetime(values[0]) if values else None
+            end = parse_log_datetime(values[1]) if len(values) > 1 else None
+            if start is None or end is None or len(values) < len(SESSION_LOG_COLUMNS_V1):
+                kept.append(values)
+                split_offset = offset
+                continue
+            if start >= cutoff:
+                break
+            split_offset = offset
+            if previous_cutoff and start < previous_cutoff:
+                already_summarized += 1
+                continue
+
+            values += [""] * (len(LOG_COLUMNS) - len(values))
+            row = denormalize_row(dict(zip(LOG_COLUMNS, values)), sessions.get(values[4]))
+            seconds = int(row["duration_seconds"]) if row["duration_seconds"].isdigit() else 0
+            key = (_period_start(start, resolution), row["tag"],
+                   title_class(row["window_title"], row["exe_name"]), row["note"])
+            group = groups.get(key)
+            if group is None:
+                groups[key] = [start, end, seconds, 1]
+            else:
+                group[0] = min(group[0], start)
+                group[1] = max(group[1], end)
+                group[2] += seconds
+                group[3] += 1
+            if archive_writer:
+                archive_writer.writerow(values)
+            stats["rows"] += 1
+            stats["seconds"] += seconds
+
+    if (stop_event is not None and stop_event.is_set()) or not (groups or already_summarized):
+        if os.path.exists(archive_tmp):
+            os.remove(archive_tmp)
+        return {"cutoff": stats["cutoff"], "rows": 0, "summaries": 0, "seconds": 0}
+
+    # The archive comes first: if the run is interrupted after it, the next run archives
+    # the same rows again, which is better than losing them
+    if archive and groups:
+        with open(archive_tmp, 'rb') as src, open(archive_file, 'ab') as out:
+            shutil.copyfileobj(src, out)  # Concatenated gzip members read back as one stream
+            out.flush()
+            os.fsync(out.fileno())
+    if os.path.exists(archive_tmp):
+        os.remove(archive_tmp)
+
+    # Then the summaries, in a single atomic step, so the totals are never counted twice or lost
+    if groups:
+        summaries = [
+            [first.strftime(DATETIME_FORMAT), last.strftime(DATETIME_FORMAT), str(seconds),
+             class_name, tag, note, str(segments), stats["cutoff"]]
+            for (_, tag, class_name, note), (first, last, seconds, segments)
+            in sorted(groups.items(), key=lambda item: item[0])
+        ]
+        _append_atomically(summary_file, SUMMARY_COLUMNS, summaries)
+        stats["summaries"] = len(summaries)
+
+    # Finally the log without the summarized rows
+    tmp_path = log_file + ".retention.tmp"
+    with open(log_file, 'rb') as raw, open(tmp_path, 'w', newline='', encoding='utf-8') as out:
+        writer = csv.writer(out)
+        writer.writerow(LOG_COLUMNS)
+        writer.writerows(kept)
+        out.flush()
+        raw.seek(split_offset)
+        shutil.copyfileobj(raw, out.buffer)
+        with file_lock:
+            # Rows appended while we were copying
+            shutil.copyfileobj(raw, out.buffer)
+            out.flush()
+            os.fsync(out.fileno())
+            os.replace(tmp_path, log_file)
+    return stats
+
+
+class RetentionJob:
+    """Runs downsample_log on a DataLogger's files from a daemon thread every `interval` seconds"""
+
+    def __init__(self, data_logger, retention_days=RETENTION_DEFAULT_DAYS, resolution=RETENTION_RESOLUTION,
+                 archive=RETENTION_ARCHIVE, interval=RETENTION_CHECK_INTERVAL):
+        self.data_logger = data_logger
+        self.retention_days = retention_days
+        self.resolution = resolution
+        self.archive = archive
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="log-retention", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Error downsampling old log rows: {e}")
+            self.stop_event.wait(self.interval)
+
+    def run_once(self):
+        stats = downsample_log(self.data_logger.log_file, self.data_logger.sessions_file, self.retention_days,
+                               self.resolution, self.archive, file_lock=self.data_logger.log_file_lock,
+                               stop_event=self.stop_event, wait=False)
+        if stats["rows"]:
+            print(f"Summarized {stats['rows']} log rows from before {stats['cutoff']} "
+                  f"into {stats['summaries']} summaries")
+            if self.data_logger.search_index:
+                self.data_logger.search_index.notify_appended()  # The log was rewritten
+        return stats
+
+    def stop(self):
+        """Stop the thread; a run in progress is abandoned unless it is already writing"""
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
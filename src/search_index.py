@@ -0,0 +1,328 @@
+import csv
+import heapq
+import io
+import math
+import os
+import sqlite3
+import threading
+from .constants import LOG_FILE, SESSIONS_FILE, SEARCH_INDEX_FILE
+
+# Fraction of the query trigrams a text must share to count as a fuzzy match. A typo
+# inside a word breaks up to three trigrams, so "invoce" keeps only 2 of its 4 for "invoice".
+FUZZY_THRESHOLD = 0.4
+
+# catch_up() indexes at most this many bytes of a file per step and lets searches run in between
+CHUNK_BYTES = 1 << 20
+
+# Bumped whenever the tables change; older index files are dropped and rebuilt
+SCHEMA_VERSION = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS texts (id INTEGER PRIMARY KEY, text TEXT UNIQUE);
+CREATE TABLE IF NOT EXISTS trigrams (
+    trigram TEXT, text_id INTEGER, PRIMARY KEY (trigram, text_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY, start TEXT, end TEXT, tag TEXT, note_id INTEGER, reason_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS sessions_note ON sessions (note_id);
+CREATE INDEX IF NOT EXISTS sessions_reason ON sessions (reason_id);
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY, start TEXT, end TEXT, title_id INTEGER, session_id TEXT
+);
+CREATE INDEX IF NOT EXISTS segments_title ON segments (title_id, id);
+CREATE INDEX IF NOT EXISTS segments_session ON segments (session_id, id);
+"""
+
+
+def trigrams(text):
+    folded = text.casefold()
+    return {folded[i:i + 3] for i in range(len(folded) - 2)}
+
+
+class SearchIndex:
+    """Persistent trigram index over window titles, notes and break reasons.
+
+    Each distinct string is stored and trigram-indexed once (titles repeat on many
+    segments), segments reference their title by id and notes and break reasons are
+    reached through the segment's session. A query finds the matching strings from
+    the trigram postings and then looks up segments through the (column, id)
+    indexes, so the cost depends on the number of matches rather than on the size
+    of the log.
+
+    The index remembers how far into the log and sessions files it has read, so
+    catch_up() only parses rows appended since it last ran (including rows from
+    before a restart).
+    """
+
+    def __init__(self, index_file=SEARCH_INDEX_FILE):
+        self.index_file = index_file
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(index_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            self.conn.executescript("DROP TABLE IF EXISTS segments; DROP TABLE IF EXISTS sessions; "
+                                    "DROP TABLE IF EXISTS trigrams; DROP TABLE IF EXISTS texts; DROP TABLE IF EXISTS meta;")
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.executescript(_SCHEMA)
+        self._text_ids = {}  # Cache of recently used text -> id
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    # --- Indexing ---
+
+    def _get_meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _text_id(self, text):
+        if not text:
+            return None
+        text_id = self._text_ids.get(text)
+        if text_id is not None:
+            return text_id
+        row = self.conn.execute("SELECT id FROM texts WHERE text = ?", (text,)).fetchone()
+        if row:
+            text_id = row[0]
+        else:
+            text_id = self.conn.execute("INSERT INTO texts (text) VALUES (?)", (text,)).lastrowid
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO trigrams (trigram, text_id) VALUES (?, ?)",
+                ((trigram, text_id) for trigram in trigrams(text)),
+            )
+        if len(self._text_ids) > 10000:
+            self._text_ids.clear()
+        self._text_ids[text] = text_id
+        return text_id
+
+    def _segment_values(self, row):
+        start, end, _, title, session_id = (row + [""] * 5)[:5]
+        return (start, end, self._text_id(title), session_id)
+
+    def _session_values(self, row):
+        session_id, start, end, tag, note, _, break_reason = (row + [""] * 7)[:7]
+        return (session_id, start, end, tag, self._text_id(note), self._text_id(break_reason))
+
+    def start_background_updates(self, log_file=LOG_FILE, sessions_file=SESSIONS_FILE):
+        """Keep the index current from a daemon thread, woken by notify_appended()"""
+        self._log_file = log_file
+        self._sessions_file = sessions_file
+        self._wakeup = threading.Event()
+        self._wakeup.set()  # Catch up on anything logged while the app wasn't running
+        self._thread = threading.Thread(target=self._update_loop, daemon=True)
+        self._thread.start()
+
+    def notify_appended(self):
+        """Called after rows are appended to the log or sessions file; never blocks on indexing"""
+        self._wakeup.set()
+
+    def _update_loop(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                self.catch_up(self._log_file, self._sessions_file)
+            except Exception as e:
+                print(f"Error updating search index: {e}")
+
+    def catch_up(self, log_file=LOG_FILE, sessions_file=SESSIONS_FILE):
+        """Index rows appended to the log and sessions files since the last indexed position.
+
+        Files are indexed in chunks of about CHUNK_BYTES, each committed with its
+        offset, and the lock is released between chunks, so a search never waits
+        for a whole (possibly rebuilt) log to be indexed.
+
+        Returns how many segments were added.
+        """
+        added = 0
+        while True:
+            with self.lock:
+                if self._file_replaced(log_file, "log") or self._file_replaced(sessions_file, "sessions"):
+                    # A file was rewritten (e.g. compacted and swapped in), so start over
+                    self._clear()
+                # Sessions first, so segments find the sessions they reference
+                rows = self._read_appended(sessions_file, "sessions")
+                if rows is not None:
+                    # Later records of a session (e.g. when it closes) replace earlier ones
+                    self.conn.executemany(
+                        "INSERT OR REPLACE INTO sessions (id, start, end, tag, note_id, reason_id) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        [self._session_values(row) for row in rows if row and row[0] != "session_id"],
+                    )
+                else:
+                    rows = self._read_appended(log_file, "log")
+                    if rows is None:
+                        return added
+                    segment_values = [self._segment_values(row) for row in rows if row and row[0] != "datetime_start"]
+                    self.conn.executemany(
+                        "INSERT INTO segments (start, end, title_id, session_id) VALUES (?, ?, ?, ?)",
+                        segment_values,
+                    )
+                    added += len(segment_values)
+                self.conn.commit()
+
+    def _file_replaced(self, path, name):
+        offset = int(self._get_meta(f"{name}_offset", 0))
+        if not os.path.exists(path):
+            return offset > 0
+        stat = os.stat(path)
+        identity = str(stat.st_ino)
+        return stat.st_size < offset or self._get_meta(f"{name}_identity", identity) != identity
+
+    def _read_appended(self, path, name):
+        """Parse the next chunk of complete CSV rows appended to path since the stored offset and
+        advance it; returns None when there are none"""
+        if not os.path.exists(path):
+            return None
+        offset = int(self._get_meta(f"{name}_offset", 0))
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(CHUNK_BYTES)
+            if len(data) == CHUNK_BYTES:
+                data += f.readline()  # Finish the last row, however long it is
+            identity = str(os.fstat(f.fileno()).st_ino)
+        # Only parse complete lines; a partially written last row is picked up next time
+        end = data.rfind(b"\n") + 1
+        if end == 0:
+            return None
+        rows = list(csv.reader(io.StringIO(data[:end].decode('utf-8'), newline='')))
+        self._set_meta(f"{name}_offset", offset + end)
+        self._set_meta(f"{name}_identity", identity)
+        return rows
+
+    def rebuild(self, log_file=LOG_FILE, sessions_file=SESSIONS_FILE):
+        """Drop everything and index the log from the beginning"""
+        with self.lock:
+            self._clear()
+            self.conn.commit()
+        return self.catch_up(log_file, sessions_file)
+
+    def _clear(self):
+        self.conn.executescript("DELETE FROM segments; DELETE FROM sessions; DELETE FROM trigrams; "
+                                "DELETE FROM texts; DELETE FROM meta;")
+        self._text_ids.clear()
+
+    # --- Queries ---
+
+    def _matching_text_ids(self, query, fuzzy):
+        """Return {text id: score} of the strings matching query; the score is 1 for substring
+        matches and the fraction of the query's trigrams a fuzzy match shares"""
+        grams = trigrams(query)
+        folded = query.casefold()
+        if not grams:
+            # Too short for trigrams: scan the distinct strings, which are far fewer than rows
+            rows = self.conn.execute("SELECT id, text FROM texts").fetchall()
+            return {text_id: 1.0 for text_id, text in rows if folded in text.casefold()}
+
+        placeholders = ",".join("?" * len(grams))
+        if fuzzy:
+            needed = max(1, math.ceil(len(grams) * FUZZY_THRESHOLD))
+            rows = self.conn.execute(
+                f"SELECT trigrams.text_id, COUNT(*), texts.text FROM trigrams "
+                f"JOIN texts ON texts.id = trigrams.text_id WHERE trigram IN ({placeholders}) "
+                f"GROUP BY trigrams.text_id HAVING COUNT(*) >= ?",
+                (*grams, needed),
+            ).fetchall()
+            return {text_id: 1.0 if folded in text.casefold() else shared / len(grams)
+                    for text_id, shared, text in rows}
+
+        # Every match contains the query's rarest trigram, so its posting list is the
+        # smallest candidate set; verify the substring on those candidates directly
+        rarest = min(grams, key=lambda gram: self.conn.execute(
+            "SELECT COUNT(*) FROM trigrams WHERE trigram = ?", (gram,)).fetchone()[0])
+        rows = self.conn.execute(
+            "SELECT texts.id, texts.text FROM trigrams JOIN texts ON texts.id = trigrams.text_id WHERE trigram = ?",
+            (rarest,),
+        ).fetchall()
+        return {text_id: 1.0 for text_id, text in rows if folded in text.casefold()}
+
+    def _newest_matching_segments(self, limit):
+        """Ids of the newest segments (at most limit) whose title, note or break reason is in matched_texts.
+
+        A break reason belongs to the segment the break began at, its session's last segment.
+        """
+        segment_ids = {row[0] for row in self.conn.execute(
+            "SELECT id FROM segments WHERE title_id IN matched_texts ORDER BY id DESC LIMIT ?", (limit,)
+        )}
+        segment_ids.update(row[0] for row in self.conn.execute(
+            """
+            SELECT id FROM segments WHERE session_id IN (
+                SELECT id FROM sessions WHERE note_id IN matched_texts
+            ) ORDER BY id DESC LIMIT ?
+            """, (limit,)
+        ))
+        segment_ids.update(row[0] for row in self.conn.execute(
+            """
+            SELECT MAX(id) FROM segments WHERE session_id IN (
+                SELECT id FROM sessions WHERE reason_id IN matched_texts
+            ) GROUP BY session_id ORDER BY MAX(id) DESC LIMIT ?
+            """, (limit,)
+        ))
+        return heapq.nlargest(limit, segment_ids)
+
+    def search(self, query, fuzzy=False, limit=100):
+        """Return the segments whose title, note or break reason match query, best matches
+        first and the most recent first among equally good ones.
+
+        Each result is a dict with start, end, tag, title, note, break_reason and
+        'matched' naming the field(s) that matched.
+        """
+        query = query.strip()
+        if not query:
+            return []
+        with self.lock:
+            scores = self._matching_text_ids(query, fuzzy)
+            if not scores:
+                return []
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS matched_texts (id INTEGER PRIMARY KEY)")
+            # Newest segments of the best scoring strings first, then of the next best, and so on,
+            # through the (column, id) indexes
+            newest = []
+            segment_scores = {}
+            for score in sorted(set(scores.values()), reverse=True):
+                if len(newest) >= limit:
+                    break
+                self.conn.execute("DELETE FROM matched_texts")
+                self.conn.executemany("INSERT INTO matched_texts (id) VALUES (?)",
+                                      ((i,) for i, s in scores.items() if s == score))
+                for segment_id in self._newest_matching_segments(limit):
+                    if segment_id not in segment_scores and len(newest) < limit:
+                        segment_scores[segment_id] = score
+                        newest.append(segment_id)
+            placeholders = ",".join("?" * len(newest))
+            rows = self.conn.execute(
+                f"""
+                SELECT s.id, s.start, s.end, ss.tag, t.text, n.text, r.text, s.title_id, ss.note_id, ss.reason_id,
+                       s.id = (SELECT MAX(id) FROM segments WHERE session_id = s.session_id)
+                FROM segments AS s
+                LEFT JOIN sessions AS ss ON ss.id = s.session_id
+                LEFT JOIN texts AS t ON t.id = s.title_id
+                LEFT JOIN texts AS n ON n.id = ss.note_id
+                LEFT JOIN texts AS r ON r.id = ss.reason_id
+                WHERE s.id IN ({placeholders})
+                """,
+                newest,
+            ).fetchall()
+
+        rows.sort(key=lambda row: (segment_scores[row[0]], row[0]), reverse=True)
+        results = []
+        for _, start, end, tag, title, note, reason, title_id, note_id, reason_id, is_last in rows:
+            if not is_last:
+                reason, reason_id = None, None  # The break began at the session's last segment
+            matched = [
+                name for name, text_id in (("title", title_id), ("note", note_id), ("break_reason", reason_id))
+                if text_id in scores
+            ]
+            results.append({
+                "start": start, "end": end, "tag": tag or "",
+                "title": title or "", "note": note or "", "break_reason": reason or "",
+                "matched": matched,
+            })
+        return results
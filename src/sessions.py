@@ -0,0 +1,156 @@
+"""Session records: the note, tag and status shared by a run of window segments.
+
+A session starts when tracking starts and ends when tracking stops or the note or
+tag changes. Its record is appended to the sessions file when it opens and again,
+with the end time and final work status, when it closes; readers keep the last
+record per session id. Window segments in the log only reference the session id,
+so a long note is stored once per session instead of once per window switch.
+"""
+import csv
+import os
+import shutil
+from .constants import LOG_COLUMNS, LEGACY_LOG_COLUMNS, SESSION_LOG_COLUMNS_V1, SESSION_COLUMNS, SESSIONS_FILE
+
+
+def load_sessions(sessions_file=SESSIONS_FILE):
+    """Return {session_id: record dict}, the last record for each id winning"""
+    sessions = {}
+    if not os.path.exists(sessions_file):
+        return sessions
+    with open(sessions_file, 'r', newline='', encoding='utf-8') as f:
+        for record in csv.DictReader(f):
+            sessions[record["session_id"]] = record
+    return sessions
+
+
+class SessionStore:
+    """Appends session records and hands out increasing session ids"""
+
+    def __init__(self, sessions_file=SESSIONS_FILE):
+        self.sessions_file = sessions_file
+        if not os.path.exists(self.sessions_file):
+            with open(self.sessions_file, 'w', newline='', encoding='utf-8') as f:
+                csv.writer(f).writerow(SESSION_COLUMNS)
+        ids = [int(session_id) for session_id in load_sessions(sessions_file) if session_id.isdigit()]
+        self.next_id = max(ids, default=0) + 1
+
+    def new_id(self):
+        session_id = str(self.next_id)
+        self.next_id += 1
+        return session_id
+
+    def append(self, record):
+        with open(self.sessions_file, 'a', newline='', encoding='utf-8') as f:
+            csv.DictWriter(f, fieldnames=SESSION_COLUMNS, extrasaction='ignore').writerow(record)
+            f.flush()
+
+
+def read_log_header(log_file):
+    if not os.path.exists(log_file):
+        return None
+    with open(log_file, 'r', newline='', encoding='utf-8') as f:
+        return next(csv.reader(f), None)
+
+
+def is_legacy_log(log_file):
+    """True for logs written before session records, with the note and tag on every row"""
+    return read_log_header(log_file) == LEGACY_LOG_COLUMNS
+
+
+def migrate_legacy_log(log_file, sessions_file=SESSIONS_FILE):
+    """Convert a legacy log in place: runs of rows with the same tag and note become sessions.
+
+    A row with work status 'break' or 'finished' ends its session, as it marked the
+    last segment before tracking stopped. The new log is streamed to a temp file and
+    swapped in atomically; the legacy file is kept next to it as a backup.
+    """
+    store = SessionStore(sessions_file)
+    tmp_path = log_file + ".migrate.tmp"
+    current = None
+    migrated = 0
+
+    def close_current():
+        if current:
+            store.append(current)
+
+    with open(log_file, 'r', newline='', encoding='utf-8') as src, \
+            open(tmp_path, 'w', newline='', encoding='utf-8') as out:
+        reader = csv.DictReader(src)
+        writer = csv.writer(out)
+        writer.writerow(LOG_COLUMNS)
+        for row in reader:
+            if current is None or (row["tag"], row["note"]) != (current["tag"], current["note"]):
+                close_current()
+                current = {
+                    "session_id": store.new_id(),
+                    "datetime_start": row["datetime_start"],
+                    "datetime_end": row["datetime_end"],
+                    "tag": row["tag"],
+                    "note": row["note"],
+                    "work_status": "tracking",
+                    "break_reason": "",
+                }
+            current["datetime_end"] = row["datetime_end"]
+            writer.writerow([row["datetime_start"], row["datetime_end"], row["duration_seconds"],
+                             row["window_title"], current["session_id"], "", "", ""])
+            migrated += 1
+            if row["work_status"] in ("break", "finished"):
+                current["work_status"] = row["work_status"]
+                current["break_reason"] = row["break_reason"]
+                close_current()
+                current = None
+        close_current()
+        out.flush()
+        os.fsync(out.fileno())
+
+    shutil.copyfile(log_file, log_file + ".legacy")
+    os.replace(tmp_path, log_file)
+    print(f"Migrated {migrated} rows of {log_file} to session records in {sessions_file}")
+    return migrated
+
+
+def add_window_metadata_columns(log_file):
+    """Rewrite a session log from before window metadata with the current header and empty metadata"""
+    padding = [""] * (len(LOG_COLUMNS) - len(SESSION_LOG_COLUMNS_V1))
+    tmp_path = log_file + ".migrate.tmp"
+    upgraded = 0
+    with open(log_file, 'r', newline='', encoding='utf-8') as src, \
+            open(tmp_path, 'w', newline='', encoding='utf-8') as out:
+        reader = csv.reader(src)
+        writer = csv.writer(out)
+        next(reader, None)
+        writer.writerow(LOG_COLUMNS)
+        for row in reader:
+            writer.writerow(row + padding)
+            upgraded += 1
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(tmp_path, log_file)
+    print(f"Added window metadata columns to {upgraded} rows of {log_file}")
+    return upgraded
+
+
+def ensure_session_log(log_file, sessions_file=SESSIONS_FILE):
+    """Migrate log_file if it still uses the legacy format or lacks columns added since"""
+    if is_legacy_log(log_file):
+        migrate_legacy_log(log_file, sessions_file)
+    elif read_log_header(log_file) == SESSION_LOG_COLUMNS_V1:
+        add_window_metadata_columns(log_file)
+
+
+def denormalize_row(row, session):
+    """Fill tag, note, work_status and break_reason of a segment dict from its session record.
+
+    The session's final work status only applies to its last segment; earlier
+    segments were logged while still tracking, as in the legacy log format.
+    """
+    if not session:
+        row.update(tag="", note="", work_status="", break_reason="")
+        return row
+    row["tag"] = session["tag"]
+    row["note"] = session["note"]
+    # The last segment is logged at (or just after) the moment the session closes
+    is_last = bool(session["datetime_end"]) and row["datetime_end"] >= session["datetime_end"]
+    row["work_status"] = session["work_status"] if is_last else "tracking"
+    row["break_reason"] = session["break_reason"] if is_last else ""
+    return row
@@ -1,21 +1,71 @@
-import datetime
-import json
 import os
-from .constants import STATE_INACTIVE, STATE_TRACKING, DEFAULT_TAGS, TAG_PACING
+from .constants import (
+    STATE_INACTIVE, STATE_TRACKING, DEFAULT_TAGS, TAG_PACING,
+    CHANGE_STATE, CHANGE_TAG, CHANGE_TAGS, CHANGE_NOTE, CHANGE_WORK_STATUS
+)
+from .tag_tree import TagTree, TagStore, normalize_tag_path
+from .clock import SYSTEM_CLOCK
+from .event_bus import StateChanged, TagChanged, NoteChanged, WorkStatusChanged
+
+TAGS_FILE = os.path.join(os.path.dirname(__file__), "schemas", "tags.json")
 
 class StateManager:
-    def __init__(self):
+    def __init__(self, clock=SYSTEM_CLOCK, tags_file=TAGS_FILE, event_bus=None):
+        # Source of the current time; a VirtualClock when replaying a recorded trace
+        self.clock = clock
         self.current_state = STATE_INACTIVE
-        self.session_start_time = datetime.datetime.now()
+        self.session_start_time = self.clock.now()
         self.active_work_seconds = 0
-        self.last_state_change_time = datetime.datetime.now()
+        self.last_state_change_time = self.clock.now()
         self.current_note = ""
         self.current_tag = None
-        # Initialize tags from JSON file or use defaults
-        self.tags = self._load_tags()
+        # Initialize tags from JSON file or use defaults.
+        # Tags are hierarchical ('Work/ClientA/Review') and indexed by path in a TagTree.
+        self.tag_store = TagStore(tags_file)
+        self.tag_tree = self._load_tags()
         # Work status and break reason
         self.work_status = None  # 'finished' or 'break'
         self.break_reason = None
+        # Session record shared by the window segments logged while tracking.
+        # A new session starts whenever tracking starts or the note or tag changes.
+        self.current_session_id = None
+        self.data_logger_ref = None
+        # Monitor of the current tracking run; its segment in progress is split when the session changes
+        self.window_monitor_ref = None
+        # Callbacks notified with a CHANGE_* constant whenever an input of the GUI changes
+        self._listeners = []
+        # Optional EventBus that also receives each change as a typed event
+        self.event_bus = event_bus
+
+    def add_listener(self, callback):
+        """Register a callback that receives a CHANGE_* constant on every change"""
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        """Unregister a previously added change callback"""
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _notify(self, change):
+        if self.event_bus:
+            self._publish(change)
+        for callback in list(self._listeners):
+            try:
+                callback(change)
+            except Exception as e:
+                print(f"Error in state listener for '{change}': {e}")
+
+    def _publish(self, change):
+        now = self.clock.now()
+        if change == CHANGE_STATE:
+            self.event_bus.publish(StateChanged(now, self.current_state))
+        elif change == CHANGE_TAG:
+            self.event_bus.publish(TagChanged(now, self.current_tag))
+        elif change == CHANGE_NOTE:
+            self.event_bus.publish(NoteChanged(now, self.current_note))
+        elif change == CHANGE_WORK_STATUS:
+            self.event_bus.publish(WorkStatusChanged(now, self.work_status, self.break_reason))
 
     def set_state(self, new_state, data_logger, window_monitor):
         # If trying to set the same state, do nothing
@@ -33,27 +83,40 @@ class StateManager:
             # Set work_status to 'tracking' when starting to track
             self.work_status = "tracking"
             self.break_reason = None
+            self._notify(CHANGE_WORK_STATUS)
 
-        now = datetime.datetime.now()
+        now = self.clock.now()
         time_in_current_state = (now - self.last_state_change_time).total_seconds()
 
         if self.current_state == STATE_TRACKING:
             self.active_work_seconds += time_in_current_state
             # The window_monitor.stop_monitoring() call below will handle logging the last activity.
-            window_monitor.stop_monitoring() # Stop window monitor if not in tracking state
+            # It closes the last segment at the transition time and returns without waiting for its thread.
+            window_monitor.stop_monitoring(now) # Stop window monitor if not in tracking state
+            # The last segment references the session, so close it only after the monitor logged it
+            self._close_session(now)
 
         self.current_state = new_state
         self.last_state_change_time = now
         print(f"State changed to: {self.current_state}")
+        self._notify(CHANGE_STATE)
 
         if self.current_state == STATE_TRACKING:
-            window_monitor.start_monitoring(self, data_logger)
+            self.data_logger_ref = data_logger
+            self.window_monitor_ref = window_monitor
+            self._open_session(now)
+            window_monitor.start_monitoring(self, data_logger, now)
         # No specific action for Inactive here, handled by WindowMonitor's active state check
         
         return True
 
+    def shutdown(self, window_monitor):
+        """Stop tracking before the application exits, so the last segment and its session end together"""
+        if self.current_state == STATE_TRACKING:
+            self.set_state(STATE_INACTIVE, self.data_logger_ref, window_monitor)
+
     def get_session_timers(self):
-        now = datetime.datetime.now()
+        now = self.clock.now()
         current_duration_in_state = (now - self.last_state_change_time).total_seconds()
         active_display = self.active_work_seconds
 
@@ -64,49 +127,96 @@ class StateManager:
 
     def get_current_state(self):
         return self.current_state
+
+    def get_session_id(self):
+        """Id of the session the current window segments belong to (None when not tracking)"""
+        return self.current_session_id
+
+    def _open_session(self, now):
+        if self.data_logger_ref:
+            self.current_session_id = self.data_logger_ref.open_session(
+                now, self.current_tag, self.current_note, self.work_status)
+
+    def _close_session(self, now):
+        if self.data_logger_ref and self.current_session_id is not None:
+            self.data_logger_ref.close_session(self.current_session_id, now, self.work_status, self.break_reason)
+        self.current_session_id = None
+
+    def _end_session_segment(self, now):
+        """The note or tag is about to change while tracking: the window segment in progress ends
+        now, under the session it started in, and the same window continues in a new segment"""
+        if self.current_state == STATE_TRACKING and self.current_session_id is not None and self.window_monitor_ref:
+            self.window_monitor_ref.split_segment(now)
+
+    def _restart_session(self, now):
+        """The note or tag changed while tracking, so following segments belong to a new session"""
+        if self.current_state == STATE_TRACKING and self.current_session_id is not None:
+            self._close_session(now)
+            self._open_session(now)
         
     def set_tag(self, tag):
-        if tag in self.tags or tag is None:
+        if tag in self.tag_tree or tag is None:
+            changed = self.current_tag != tag
+            now = self.clock.now()
+            if changed:
+                self._end_session_segment(now)
             self.current_tag = tag
             print(f"Tag set to: {self.current_tag}")
+            if changed:
+                self._restart_session(now)
+                self._notify(CHANGE_TAG)
         else:
             print(f"Invalid tag: {tag}")
             
     def add_tag(self, tag):
-        """Add a new tag to the list of available tags"""
-        if tag and tag not in self.tags:
-            self.tags.append(tag)
+        """Add a new tag (and any missing parents, e.g. 'Work/ClientA/Review') to the available tags"""
+        tag = normalize_tag_path(tag or "")
+        created = self.tag_tree.add(tag)
+        if created:
             print(f"Added new tag: {tag}")
-            self._save_tags()
+            for path in created:
+                self._record_tag_change("add", path)
+            self._notify(CHANGE_TAGS)
             return True
         return False
         
     def remove_tag(self, tag):
-        """Remove a tag from the list of available tags"""
+        """Remove a tag and all of its sub-tags from the available tags"""
         if tag == TAG_PACING:
             print(f"Cannot remove the {TAG_PACING} tag as it is required")
             return False
         
-        if tag in self.tags:
-            self.tags.remove(tag)
-            # If the current tag is being removed, reset it
-            if self.current_tag == tag:
+        removed = self.tag_tree.remove(tag)
+        if removed:
+            # If the current tag is being removed (directly or as a sub-tag), reset it
+            tag_reset = self.current_tag in removed
+            if tag_reset:
                 self.current_tag = None
-            print(f"Removed tag: {tag}")
-            self._save_tags()
+            print(f"Removed tag: {tag}" + (f" and {len(removed) - 1} sub-tags" if len(removed) > 1 else ""))
+            self._record_tag_change("remove", tag)
+            self._notify(CHANGE_TAGS)
+            if tag_reset:
+                self._notify(CHANGE_TAG)
             return True
         return False
         
     def get_tags(self):
-        """Get the list of all available tags"""
-        return self.tags.copy()
+        """Get the list of all available tags, each parent followed by its sub-tags"""
+        return list(self.tag_tree.paths())
             
     def get_current_tag(self):
         return self.current_tag
 
     def set_note(self, note_text):
+        changed = self.current_note != note_text
+        now = self.clock.now()
+        if changed:
+            self._end_session_segment(now)
         self.current_note = note_text
         print(f"Note updated to: {self.current_note}")
+        if changed:
+            self._restart_session(now)
+            self._notify(CHANGE_NOTE)
 
     def get_note(self):
         return self.current_note
@@ -118,6 +228,7 @@ class StateManager:
         print(f"Work status set to: {status}")
         if reason:
             print(f"Break reason: {reason}")
+        self._notify(CHANGE_WORK_STATUS)
             
     def get_work_status(self):
         """Get the current work status"""
@@ -128,38 +239,26 @@ class StateManager:
         return self.break_reason
         
     def _load_tags(self):
-        """Load tags from JSON file or use defaults if file doesn't exist"""
-        tags_file_path = os.path.join(os.path.dirname(__file__), "schemas", "tags.json")
+        """Load tags from the JSON snapshot and journal, or use defaults if the file doesn't exist"""
         try:
-            if os.path.exists(tags_file_path):
-                with open(tags_file_path, 'r') as f:
-                    data = json.load(f)
-                    tags = data.get('tags', [])
-                    
-                    # Ensure Pacing tag is always included
-                    if TAG_PACING not in tags:
-                        tags.insert(0, TAG_PACING)
-                    
-                    print(f"Loaded {len(tags)} tags from {tags_file_path}")
-                    return tags
+            tags = self.tag_store.load(DEFAULT_TAGS)
+            if tags is not None:
+                # Ensure Pacing tag is always included
+                if TAG_PACING not in tags:
+                    tags.insert(0, TAG_PACING)
+                
+                print(f"Loaded {len(tags)} tags from {self.tag_store.snapshot_path}")
+                return TagTree(tags)
         except Exception as e:
-            print(f"Error loading tags from {tags_file_path}: {e}")
+            print(f"Error loading tags from {self.tag_store.snapshot_path}: {e}")
         
         # If file doesn't exist or there was an error, use default tags
         print(f"Using default tags")
-        return DEFAULT_TAGS.copy()
+        return TagTree(DEFAULT_TAGS)
     
-    def _save_tags(self):
-        """Save tags to JSON file"""
-        tags_file_path = os.path.join(os.path.dirname(__file__), "schemas", "tags.json")
+    def _record_tag_change(self, op, path):
+        """Persist a single tag change by appending it to the journal"""
         try:
-            # Ensure directory exists
-            os.makedirs(os.path.dirname(tags_file_path), exist_ok=True)
-            
-            # Save tags to file
-            with open(tags_file_path, 'w') as f:
-                json.dump({'tags': self.tags}, f, indent=4)
-            
-            print(f"Saved {len(self.tags)} tags to {tags_file_path}")
+            self.tag_store.record(op, path, self.tag_tree)
         except Exception as e:
-            print(f"Error saving tags to {tags_file_path}: {e}")
+            print(f"Error saving tags to {self.tag_store.snapshot_path}: {e}")
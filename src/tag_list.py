@@ -0,0 +1,193 @@
+import bisect
+import tkinter as tk
+from tkinter import ttk
+from .tag_tree import TAG_SEPARATOR
+
+# Height of one tag row in pixels. Rows have a fixed height so the visible range
+# can be computed from the scroll position without measuring widgets.
+ROW_HEIGHT = 30
+
+
+class TagPrefixIndex:
+    """Sorted, case-insensitive index of tags answering prefix queries in O(log n + k)"""
+
+    def __init__(self, tags=()):
+        self._keys = sorted((tag.casefold(), tag) for tag in tags)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, tag):
+        key = (tag.casefold(), tag)
+        i = bisect.bisect_left(self._keys, key)
+        if i == len(self._keys) or self._keys[i] != key:
+            self._keys.insert(i, key)
+
+    def remove(self, tag):
+        key = (tag.casefold(), tag)
+        i = bisect.bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            del self._keys[i]
+
+    def matches(self, prefix):
+        """Return all tags starting with prefix (case-insensitive), in sorted order"""
+        folded = prefix.casefold()
+        # (folded,) sorts before every (folded, tag) pair, so this is the first candidate
+        i = bisect.bisect_left(self._keys, (folded,))
+        result = []
+        while i < len(self._keys) and self._keys[i][0].startswith(folded):
+            result.append(self._keys[i][1])
+            i += 1
+        return result
+
+
+class _TagRow:
+    """A pooled row widget (tag button + delete button) that gets rebound to different tags on scroll"""
+
+    def __init__(self, parent, on_select, on_delete):
+        self.tag = None
+        self.label = None
+        self.frame = ttk.Frame(parent)
+        self.button = ttk.Button(self.frame, command=lambda: self.tag is not None and on_select(self.tag))
+        self.button.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.delete_button = ttk.Button(self.frame, text="×", width=2,
+                                        command=lambda: self.tag is not None and on_delete(self.tag))
+        self.delete_button.pack(side=tk.RIGHT, padx=(2, 0))
+
+    def bind_tag(self, tag, label):
+        # Only touch the widget when the row now shows a different tag or label
+        if tag != self.tag or label != self.label:
+            self.tag = tag
+            self.label = label
+            self.button.configure(text=label)
+
+
+class VirtualTagList(ttk.Frame):
+    """Scrollable tag list that only creates widgets for the rows that are visible.
+
+    Rows are kept in a small pool and rebound to other tags while scrolling, so the
+    number of widgets depends on the panel height rather than on the number of tags.
+    """
+
+    def __init__(self, parent, on_select, on_delete):
+        super().__init__(parent)
+        self.on_select = on_select
+        self.on_delete = on_delete
+
+        self._all_tags = []       # All tags, in StateManager order
+        self._tag_set = set()
+        self._index = TagPrefixIndex()
+        self._filter = ""
+        self._rows = []           # Tags currently listed (all tags or the filter matches)
+        self._top = 0             # Index in self._rows of the first visible row
+        self._pool = []
+
+        self.scrollbar = ttk.Scrollbar(self, command=self._yview)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.body = ttk.Frame(self)
+        self.body.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.body.bind("<Configure>", self._on_body_configure)
+        self._bind_wheel(self.body)
+
+    @property
+    def tag_buttons(self):
+        """Tag buttons that currently exist, keyed by the tag they show"""
+        return {row.tag: row.button for row in self._pool if row.tag is not None and row.frame.winfo_ismapped()}
+
+    def sync(self, tags):
+        """Apply the difference between the listed tags and tags, touching only visible rows"""
+        new_set = set(tags)
+        removed = self._tag_set - new_set
+        added = [tag for tag in tags if tag not in self._tag_set]
+        if not removed and not added and len(tags) == len(self._all_tags):
+            return
+
+        for tag in removed:
+            self._index.remove(tag)
+        for tag in added:
+            self._index.add(tag)
+        self._all_tags = list(tags)
+        self._tag_set = new_set
+        self._apply_filter()
+
+    def set_filter(self, prefix):
+        """Show only the tags starting with prefix (type-ahead)"""
+        prefix = prefix.strip()
+        if prefix == self._filter:
+            return
+        self._filter = prefix
+        self._top = 0
+        self._apply_filter()
+
+    def apply_style(self, frame_style_name):
+        self.configure(style=frame_style_name)
+        self.body.configure(style=frame_style_name)
+
+    def _apply_filter(self):
+        if self._filter:
+            self._rows = self._index.matches(self._filter)
+        else:
+            self._rows = self._all_tags
+        self._render()
+
+    def _visible_count(self):
+        return max(1, self.body.winfo_height() // ROW_HEIGHT)
+
+    def _on_body_configure(self, event):
+        # Keep exactly enough pooled rows to fill the visible height
+        needed = max(1, event.height // ROW_HEIGHT + 1)
+        while len(self._pool) < needed:
+            row = _TagRow(self.body, self.on_select, self.on_delete)
+            for widget in (row.frame, row.button, row.delete_button):
+                self._bind_wheel(widget)
+            self._pool.append(row)
+        while len(self._pool) > needed:
+            self._pool.pop().frame.destroy()
+        self._render()
+
+    def _render(self):
+        max_top = max(0, len(self._rows) - self._visible_count())
+        self._top = min(max(self._top, 0), max_top)
+
+        for i, row in enumerate(self._pool):
+            index = self._top + i
+            if index < len(self._rows):
+                row.bind_tag(self._rows[index], self._row_label(self._rows[index]))
+                row.frame.place(x=0, y=i * ROW_HEIGHT, relwidth=1, height=ROW_HEIGHT)
+            else:
+                row.tag = None
+                row.frame.place_forget()
+
+        total = len(self._rows)
+        if total:
+            self.scrollbar.set(self._top / total, min(1.0, (self._top + self._visible_count()) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def _row_label(self, tag):
+        # Filter matches are listed flat, so they show the full path;
+        # otherwise sub-tags follow their parent and are shown indented
+        if self._filter or TAG_SEPARATOR not in tag:
+            return tag
+        depth = tag.count(TAG_SEPARATOR)
+        return "   " * depth + tag.rsplit(TAG_SEPARATOR, 1)[-1]
+
+    def _yview(self, *args):
+        if args[0] == "moveto":
+            self._top = int(float(args[1]) * len(self._rows))
+        elif args[0] == "scroll":
+            amount = int(args[1])
+            if args[2] == "pages":
+                amount *= self._visible_count()
+            self._top += amount
+        self._render()
+
+    def _bind_wheel(self, widget):
+        widget.bind("<MouseWheel>", self._on_mouse_wheel)  # Windows / macOS
+        widget.bind("<Button-4>", lambda event: self._yview("scroll", -1, "units"))  # X11
+        widget.bind("<Button-5>", lambda event: self._yview("scroll", 1, "units"))
+
+    def _on_mouse_wheel(self, event):
+        steps = -int(event.delta / 120) if abs(event.delta) >= 120 else (-1 if event.delta > 0 else 1)
+        self._yview("scroll", steps, "units")
@@ -0,0 +1,209 @@
+import json
+import os
+
+TAG_SEPARATOR = "/"
+
+# Number of journaled changes after which the snapshot is rewritten and the journal truncated
+JOURNAL_COMPACT_THRESHOLD = 200
+
+
+def normalize_tag_path(path):
+    """Turn ' Work / ClientA//Review ' into 'Work/ClientA/Review' (empty string if nothing is left)"""
+    return TAG_SEPARATOR.join(part.strip() for part in path.split(TAG_SEPARATOR) if part.strip())
+
+
+def parent_path(path):
+    """Return the parent of a tag path, or None for a top-level tag"""
+    if TAG_SEPARATOR not in path:
+        return None
+    return path.rsplit(TAG_SEPARATOR, 1)[0]
+
+
+def ancestor_paths(path):
+    """Yield the path itself followed by each of its ancestors, e.g. a/b/c, a/b, a"""
+    while path:
+        yield path
+        path = parent_path(path)
+
+
+class TagRollup:
+    """Seconds per tag path, rolled up into every ancestor as they are added.
+
+    The total of a parent therefore includes its children without rescanning any rows.
+    """
+
+    def __init__(self):
+        self._own_seconds = {}
+        self._total_seconds = {}
+
+    def add_time(self, path, seconds):
+        """Add seconds to a tag; every ancestor's total is updated in O(depth)"""
+        self._own_seconds[path] = self._own_seconds.get(path, 0) + seconds
+        for ancestor in ancestor_paths(path):
+            self._total_seconds[ancestor] = self._total_seconds.get(ancestor, 0) + seconds
+
+    def own_seconds(self, path):
+        return self._own_seconds.get(path, 0)
+
+    def total_seconds(self, path):
+        """Time of the tag including all of its descendants"""
+        return self._total_seconds.get(path, 0)
+
+    def top_level_totals(self):
+        """Rolled-up totals of the top-level tags"""
+        return {path: seconds for path, seconds in self._total_seconds.items() if TAG_SEPARATOR not in path}
+
+    def copy(self):
+        clone = TagRollup()
+        clone._own_seconds = dict(self._own_seconds)
+        clone._total_seconds = dict(self._total_seconds)
+        return clone
+
+
+class TagNode:
+    __slots__ = ("path", "name", "parent", "children")
+
+    def __init__(self, path, parent):
+        self.path = path
+        self.name = path.rsplit(TAG_SEPARATOR, 1)[-1]
+        self.parent = parent
+        self.children = {}  # name -> TagNode, in insertion order
+
+
+class TagTree:
+    """Hierarchical tags (e.g. 'Work/ClientA/Review') with a dict index from path to node.
+
+    Membership checks and lookups are O(1) through the index.
+    """
+
+    def __init__(self, paths=()):
+        self._roots = {}
+        self._index = {}
+        for path in paths:
+            self.add(path)
+
+    def __contains__(self, path):
+        return path in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def add(self, path):
+        """Add a tag and any missing ancestors; returns the list of newly created paths"""
+        path = normalize_tag_path(path)
+        created = []
+        if not path or path in self._index:
+            return created
+        parent = None
+        siblings = self._roots
+        current = ""
+        for name in path.split(TAG_SEPARATOR):
+            current = f"{current}{TAG_SEPARATOR}{name}" if current else name
+            node = self._index.get(current)
+            if node is None:
+                node = TagNode(current, parent)
+                siblings[name] = node
+                self._index[current] = node
+                created.append(current)
+            parent = node
+            siblings = node.children
+        return created
+
+    def remove(self, path):
+        """Remove a tag and its whole subtree; returns the list of removed paths"""
+        node = self._index.get(path)
+        if node is None:
+            return []
+        siblings = node.parent.children if node.parent else self._roots
+        del siblings[node.name]
+        removed = list(self._iter_subtree(node))
+        for removed_path in removed:
+            del self._index[removed_path]
+        return removed
+
+    def _iter_subtree(self, node):
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            yield current.path
+            stack.extend(reversed(list(current.children.values())))
+
+    def paths(self):
+        """All tag paths in tree order (each parent directly followed by its children)"""
+        for root in list(self._roots.values()):
+            yield from self._iter_subtree(root)
+
+    def children(self, path=None):
+        """Paths of the direct children of a tag (or of the top-level tags)"""
+        siblings = self._index[path].children if path else self._roots
+        return [child.path for child in siblings.values()]
+
+    def subtree_size(self, path):
+        node = self._index.get(path)
+        return len(list(self._iter_subtree(node))) if node else 0
+
+
+class TagStore:
+    """Persists a TagTree as a JSON snapshot plus an append-only journal of changes.
+
+    Adding or removing a tag appends one line to the journal instead of rewriting the
+    whole file. The snapshot is rewritten atomically (temp file + os.replace) once the
+    journal grows past JOURNAL_COMPACT_THRESHOLD. Journal entries are idempotent, so
+    replaying them over a newer snapshot after a crash gives the same tags.
+    """
+
+    def __init__(self, snapshot_path):
+        self.snapshot_path = snapshot_path
+        self.journal_path = os.path.splitext(snapshot_path)[0] + ".journal"
+        self._journal_entries = 0
+
+    def load(self, defaults=None):
+        """Return the tag paths from the snapshot with the journal replayed.
+
+        Without a snapshot the journal is replayed over `defaults`; None is returned
+        if there is neither a snapshot nor a journal.
+        """
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'r') as f:
+                tree = TagTree(json.load(f).get('tags', []))
+        elif os.path.exists(self.journal_path):
+            tree = TagTree(defaults or [])
+        else:
+            return None
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # A torn last line from an interrupted write
+                    if entry.get("op") == "add":
+                        tree.add(entry["path"])
+                    elif entry.get("op") == "remove":
+                        tree.remove(entry["path"])
+                    self._journal_entries += 1
+        return list(tree.paths())
+
+    def record(self, op, path, tag_tree):
+        """Journal a single 'add' or 'remove', compacting into the snapshot when the journal is long"""
+        os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+        with open(self.journal_path, 'a') as f:
+            f.write(json.dumps({"op": op, "path": path}) + "\n")
+            f.flush()
+        self._journal_entries += 1
+        # Without a snapshot the journal would have nothing to be replayed over
+        if self._journal_entries >= JOURNAL_COMPACT_THRESHOLD or not os.path.exists(self.snapshot_path):
+            self.save_snapshot(tag_tree)
+
+    def save_snapshot(self, tag_tree):
+        """Atomically rewrite the snapshot and truncate the journal"""
+        os.makedirs(os.path.dirname(self.snapshot_path), exist_ok=True)
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'tags': list(tag_tree.paths())}, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        # Truncate only after the snapshot is in place; replaying old entries is harmless
+        open(self.journal_path, 'w').close()
+        self._journal_entries = 0
@@ -0,0 +1,350 @@
+import bisect
+import collections
+import datetime
+import os
+import threading
+import tkinter as tk
+from tkinter import ttk
+from .constants import LOG_FILE, SESSIONS_FILE
+from .log_reader import LogOffsetIndex, iter_summary_rows, summary_file_for
+from .sessions import load_sessions
+from .tag_tree import TAG_SEPARATOR
+
+SECONDS_PER_DAY = 24 * 3600
+MINUTE_SLOTS = 24 * 60
+
+# Level-of-detail resolutions, finest first: (slot length in seconds, slots per day)
+LOD_LEVELS = ((60, MINUTE_SLOTS), (3600, 24), (SECONDS_PER_DAY, 1))
+
+# Number of days whose slot arrays are kept in memory
+MAX_CACHED_DAYS = 800
+
+TAG_COLORS = ["#4E79A7", "#F28E2B", "#E15759", "#76B7B2", "#59A14F",
+              "#EDC948", "#B07AA1", "#FF9DA7", "#9C755F", "#BAB0AC"]
+
+
+def _dominant(values):
+    """Most frequent non-empty slot value (0 means no activity)"""
+    counts = collections.Counter(value for value in values if value)
+    return counts.most_common(1)[0][0] if counts else 0
+
+
+class TimelineData:
+    """Serves timeline segments for a time range at a resolution matching the zoom level.
+
+    Exact segments are read through a LogOffsetIndex, so only the visible range is
+    loaded. For zoomed-out views each day is summarized once into per-minute,
+    per-hour and per-day slots holding the dominant tag, which keeps a year of data
+    at a few bytes per pixel. Periods whose rows were downsampled by retention.py
+    are drawn from their summaries, which are few enough to keep in memory.
+
+    Nothing is read until the first refresh(); the GUI runs it with
+    refresh_in_background(), since indexing a large log takes a while.
+    """
+
+    def __init__(self, log_file=LOG_FILE, sessions_file=SESSIONS_FILE):
+        self.log_file = log_file
+        self.sessions_file = sessions_file
+        self.offsets = LogOffsetIndex(log_file)
+        self.summaries = []  # (start, end, tag, title class), sorted by start
+        self._summary_starts = []
+        self._summary_identity = None
+        self.sessions = {}
+        self._sessions_size = -1
+        self.tag_ids = {}     # tag -> small int used in slot arrays (0 = no activity)
+        self.tag_names = [None]
+        self._day_slots = collections.OrderedDict()  # date -> {slot_seconds: list of tag ids}
+
+    def refresh(self):
+        """Pick up rows and sessions appended since the last refresh"""
+        self.offsets.refresh()
+        size = os.path.getsize(self.sessions_file) if os.path.exists(self.sessions_file) else 0
+        if size != self._sessions_size:
+            self.sessions = load_sessions(self.sessions_file)
+            self._sessions_size = size
+        summary_file = summary_file_for(self.log_file)
+        identity = None
+        if os.path.exists(summary_file):
+            stat = os.stat(summary_file)
+            identity = (stat.st_ino, stat.st_size)
+        if identity != self._summary_identity:
+            # New summaries replace rows of the log, so cached days may be out of date
+            self.summaries = sorted((row["start"], row["end"], row["tag"] or "No Tag", row["window_title"])
+                                    for row in iter_summary_rows(self.log_file))
+            self._summary_starts = [summary[0] for summary in self.summaries]
+            self._summary_identity = identity
+            self._day_slots.clear()
+        # Today's summary is still growing
+        self._day_slots.pop(datetime.date.today(), None)
+
+    def refresh_in_background(self, widget, on_done):
+        """Run refresh() on a worker thread and then call on_done() on the Tk thread of widget.
+
+        The data must not be read until on_done runs.
+        """
+        done = threading.Event()
+
+        def run():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Error reading the timeline data: {e}")
+            finally:
+                done.set()
+
+        def poll():
+            if done.is_set():
+                on_done()
+            else:
+                widget.after(100, poll)
+
+        threading.Thread(target=run, name="timeline-refresh", daemon=True).start()
+        poll()
+
+    def tag_id(self, tag):
+        """Small int standing for tag in slot arrays (0 = no activity)"""
+        tag = tag or "No Tag"
+        if tag not in self.tag_ids:
+            self.tag_ids[tag] = len(self.tag_names)
+            self.tag_names.append(tag)
+        return self.tag_ids[tag]
+
+    def segments(self, start, end):
+        """Exact (start, end, tag, title) tuples overlapping [start, end); summaries (see refresh) come first"""
+        # A summary spans at most its period (an hour or a day) plus the end of its last segment
+        first = bisect.bisect_left(self._summary_starts, start - datetime.timedelta(days=2))
+        last = bisect.bisect_left(self._summary_starts, end)
+        for summary in self.summaries[first:last]:
+            if summary[1] > start:
+                yield summary
+        for row in self.offsets.iter_rows(start, end, self.sessions):
+            yield row["start"], row["end"], row["tag"] or "No Tag", row["window_title"]
+
+    def _slots_for_day(self, day):
+        cached = self._day_slots.get(day)
+        if cached is not None:
+            self._day_slots.move_to_end(day)
+            return cached
+
+        minutes = [0] * MINUTE_SLOTS
+        day_start = datetime.datetime.combine(day, datetime.time.min)
+        for seg_start, seg_end, tag, _ in self.segments(day_start, day_start + datetime.timedelta(days=1)):
+            first = max(0, int((seg_start - day_start).total_seconds() // 60))
+            last = min(MINUTE_SLOTS - 1, int(((seg_end - day_start).total_seconds() - 1) // 60))
+            tag_id = self.tag_id(tag)
+            for minute in range(first, last + 1):
+                minutes[minute] = tag_id
+        hours = [_dominant(minutes[h * 60:(h + 1) * 60]) for h in range(24)]
+        slots = {60: minutes, 3600: hours, SECONDS_PER_DAY: [_dominant(hours)]}
+
+        self._day_slots[day] = slots
+        if len(self._day_slots) > MAX_CACHED_DAYS:
+            self._day_slots.popitem(last=False)
+        return slots
+
+    def blocks(self, start, end, seconds_per_pixel):
+        """Yield (block_start, block_end, tag) covering [start, end) at roughly one block per pixel.
+
+        Adjacent blocks with the same tag are merged, so the caller draws one item per run.
+        """
+        if seconds_per_pixel < 60:
+            yield from self._merged(
+                (seg_start, seg_end, tag) for seg_start, seg_end, tag, _ in self.segments(start, end))
+            return
+
+        # Coarsest level whose slots are still no wider than a pixel
+        slot_seconds = max(level for level, _ in LOD_LEVELS if level <= seconds_per_pixel)
+        day = start.date()
+        slot_blocks = []
+        while day <= (end - datetime.timedelta(microseconds=1)).date():
+            day_start = datetime.datetime.combine(day, datetime.time.min)
+            for i, tag_id in enumerate(self._slots_for_day(day)[slot_seconds]):
+                if tag_id:
+                    slot_start = day_start + datetime.timedelta(seconds=i * slot_seconds)
+                    slot_blocks.append((slot_start, slot_start + datetime.timedelta(seconds=slot_seconds),
+                                        self.tag_names[tag_id]))
+            day += datetime.timedelta(days=1)
+        yield from self._merged(block for block in slot_blocks if block[1] > start and block[0] < end)
+
+    def _merged(self, blocks):
+        current = None
+        for block_start, block_end, tag in blocks:
+            if current and current[2] == tag and block_start <= current[1] + datetime.timedelta(seconds=1):
+                current[1] = max(current[1], block_end)
+                continue
+            if current:
+                yield tuple(current)
+            current = [block_start, block_end, tag]
+        if current:
+            yield tuple(current)
+
+
+class TimelineWindow(tk.Toplevel):
+    """Day/week/year timeline of logged segments, colored by top-level tag, with zoom and pan.
+
+    Canvas rectangles are pooled and reconfigured on every redraw instead of being
+    deleted and recreated, and at most one block is drawn per pixel.
+    """
+
+    BAR_TOP = 30
+    BAR_HEIGHT = 60
+    MIN_SPAN = datetime.timedelta(minutes=10)
+    MAX_SPAN = datetime.timedelta(days=366)
+
+    def __init__(self, parent, data):
+        super().__init__(parent)
+        self.data = data
+        self.title("Timeline")
+        self.geometry("900x200")
+        self.transient(parent)
+
+        today = datetime.datetime.combine(datetime.date.today(), datetime.time.min)
+        self.view_start = today
+        self.view_end = today + datetime.timedelta(days=1)
+        self._rects = []       # Pooled rectangle items
+        self._rect_blocks = []  # Block drawn by each visible rectangle, for hover info
+        self._ticks = []       # Pooled (line, text) items for the time axis
+        self._redraw_pending = False
+        self._refreshing = False  # The data is being refreshed on a worker thread; don't read it
+        self._drag_x = None
+
+        self._setup_ui()
+        self._schedule_redraw()
+
+    def _setup_ui(self):
+        toolbar = ttk.Frame(self, padding="5 5 5 0")
+        toolbar.pack(fill=tk.X)
+        for label, days in (("Day", 1), ("Week", 7), ("Year", 365)):
+            ttk.Button(toolbar, text=label, command=lambda d=days: self._show_last_days(d)).pack(side=tk.LEFT, padx=2)
+        ttk.Button(toolbar, text="Refresh", command=self._refresh).pack(side=tk.LEFT, padx=2)
+        self.info_var = tk.StringVar()
+        ttk.Label(toolbar, textvariable=self.info_var, anchor=tk.W).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=10)
+
+        self.canvas = tk.Canvas(self, background="white", highlightthickness=0)
+        self.canvas.pack(fill=tk.BOTH, expand=True)
+        self.canvas.bind("<Configure>", lambda event: self._schedule_redraw())
+        self.canvas.bind("<MouseWheel>", lambda event: self._zoom(event.x, 0.8 if event.delta > 0 else 1.25))
+        self.canvas.bind("<Button-4>", lambda event: self._zoom(event.x, 0.8))
+        self.canvas.bind("<Button-5>", lambda event: self._zoom(event.x, 1.25))
+        self.canvas.bind("<ButtonPress-1>", self._on_drag_start)
+        self.canvas.bind("<B1-Motion>", self._on_drag)
+        self.canvas.bind("<Motion>", self._on_motion)
+        self.bind("<Escape>", lambda event: self.destroy())
+
+    # --- View changes ---
+
+    def _show_last_days(self, days):
+        end = datetime.datetime.combine(datetime.date.today(), datetime.time.min) + datetime.timedelta(days=1)
+        self.view_start = end - datetime.timedelta(days=days)
+        self.view_end = end
+        self._schedule_redraw()
+
+    def _refresh(self):
+        if self._refreshing:
+            return
+        self._refreshing = True
+        self.info_var.set("Refreshing...")
+
+        def done():
+            self._refreshing = False
+            if self.winfo_exists():
+                self._schedule_redraw()
+
+        self.data.refresh_in_background(self, done)
+
+    def _time_at(self, x):
+        width = max(1, self.canvas.winfo_width())
+        return self.view_start + (self.view_end - self.view_start) * (x / width)
+
+    def _zoom(self, x, factor):
+        anchor = self._time_at(x)
+        span = (self.view_end - self.view_start) * factor
+        span = min(max(span, self.MIN_SPAN), self.MAX_SPAN)
+        ratio = x / max(1, self.canvas.winfo_width())
+        self.view_start = anchor - span * ratio
+        self.view_end = self.view_start + span
+        self._schedule_redraw()
+
+    def _on_drag_start(self, event):
+        self._drag_x = event.x
+
+    def _on_drag(self, event):
+        if self._drag_x is None:
+            return
+        shift = self._time_at(self._drag_x) - self._time_at(event.x)
+        self._drag_x = event.x
+        self.view_start += shift
+        self.view_end += shift
+        self._schedule_redraw()
+
+    def _on_motion(self, event):
+        moment = self._time_at(event.x)
+        for block_start, block_end, tag in self._rect_blocks:
+            if block_start <= moment < block_end:
+                self.info_var.set(f"{tag}: {block_start:%Y-%m-%d %H:%M} - {block_end:%H:%M}")
+                return
+        self.info_var.set(f"{moment:%Y-%m-%d %H:%M}")
+
+    # --- Rendering ---
+
+    def _schedule_redraw(self):
+        # Coalesce bursts of zoom/drag/resize events into a single redraw
+        if not self._redraw_pending:
+            self._redraw_pending = True
+            self.after_idle(self._redraw)
+
+    def _color_for(self, tag):
+        top_level = tag.split(TAG_SEPARATOR, 1)[0]
+        return TAG_COLORS[self.data.tag_id(top_level) % len(TAG_COLORS)]
+
+    def _redraw(self):
+        self._redraw_pending = False
+        if not self.winfo_exists() or self._refreshing:
+            return
+        width = max(1, self.canvas.winfo_width())
+        span_seconds = (self.view_end - self.view_start).total_seconds()
+        seconds_per_pixel = span_seconds / width
+
+        blocks = list(self.data.blocks(self.view_start, self.view_end, seconds_per_pixel))
+        self._rect_blocks = blocks
+        for i, (block_start, block_end, tag) in enumerate(blocks):
+            x0 = max(0.0, (block_start - self.view_start).total_seconds() / seconds_per_pixel)
+            x1 = min(float(width), (block_end - self.view_start).total_seconds() / seconds_per_pixel)
+            x1 = max(x1, x0 + 1)  # Keep very short blocks visible
+            if i == len(self._rects):
+                self._rects.append(self.canvas.create_rectangle(0, 0, 0, 0, width=0))
+            rect = self._rects[i]
+            self.canvas.coords(rect, x0, self.BAR_TOP, x1, self.BAR_TOP + self.BAR_HEIGHT)
+            self.canvas.itemconfigure(rect, fill=self._color_for(tag), state=tk.NORMAL)
+        for rect in self._rects[len(blocks):]:
+            self.canvas.itemconfigure(rect, state=tk.HIDDEN)
+
+        self._draw_axis(width, span_seconds)
+        self.info_var.set(f"{self.view_start:%Y-%m-%d %H:%M} - {self.view_end:%Y-%m-%d %H:%M}  ({len(blocks)} blocks)")
+
+    def _draw_axis(self, width, span_seconds):
+        # Tick spacing: the smallest "nice" step giving at most ~10 ticks
+        steps = (600, 1800, 3600, 3 * 3600, 6 * 3600, SECONDS_PER_DAY, 7 * SECONDS_PER_DAY, 30 * SECONDS_PER_DAY)
+        step = next((s for s in steps if span_seconds / s <= 10), steps[-1])
+        label_format = "%H:%M" if step < SECONDS_PER_DAY else "%m-%d"
+
+        midnight = datetime.datetime.combine(self.view_start.date(), datetime.time.min)
+        offset = (self.view_start - midnight).total_seconds()
+        tick = midnight + datetime.timedelta(seconds=(offset // step + 1) * step)
+        y = self.BAR_TOP + self.BAR_HEIGHT
+        i = 0
+        while tick < self.view_end:
+            x = (tick - self.view_start).total_seconds() * width / span_seconds
+            if i == len(self._ticks):
+                self._ticks.append((self.canvas.create_line(0, 0, 0, 0, fill="#888888"),
+                                    self.canvas.create_text(0, 0, anchor=tk.N, fill="#444444")))
+            line, text = self._ticks[i]
+            self.canvas.coords(line, x, self.BAR_TOP - 5, x, y + 5)
+            self.canvas.coords(text, x, y + 8)
+            self.canvas.itemconfigure(line, state=tk.NORMAL)
+            self.canvas.itemconfigure(text, text=tick.strftime(label_format), state=tk.NORMAL)
+            tick += datetime.timedelta(seconds=step)
+            i += 1
+        for line, text in self._ticks[i:]:
+            self.canvas.itemconfigure(line, state=tk.HIDDEN)
+            self.canvas.itemconfigure(text, state=tk.HIDDEN)
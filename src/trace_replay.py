@@ -0,0 +1,223 @@
+"""Recording and replaying the inputs of tracking runs.
+
+A trace is a JSON Lines file with one event per line: state, tag, note and work
+status changes made in the GUI, and the window switches applied by the monitor,
+each with its timestamp. Replaying a trace drives a StateManager, DataLogger and
+monitor with a VirtualClock, so a recorded week is replayed in seconds and the
+resulting log and session files can be compared byte for byte between versions.
+"""
+import contextlib
+import datetime
+import filecmp
+import json
+import os
+import threading
+import time
+from .constants import (
+    LOG_FILE, SESSIONS_FILE, UNIQUE_WINDOWS_FILE,
+    CHANGE_STATE, CHANGE_TAG, CHANGE_NOTE, CHANGE_WORK_STATUS
+)
+from .clock import VirtualClock
+from .data_logger import DataLogger
+from .state_manager import StateManager
+from .window_monitor import WindowMonitor
+from .window_info import WindowInfo
+
+TRACE_STATE = "state"
+TRACE_TAG = "tag"
+TRACE_NOTE = "note"
+TRACE_WORK_STATUS = "work_status"
+TRACE_TITLE = "title"
+
+# Files written by a replay, compared by compare_outputs
+REPLAY_OUTPUT_FILES = (LOG_FILE, SESSIONS_FILE, UNIQUE_WINDOWS_FILE)
+
+
+class TraceRecorder:
+    """Appends the inputs of a live tracking run to a trace file"""
+
+    def __init__(self, trace_file):
+        self.trace_file = trace_file
+        self.state_manager = None
+        self.lock = threading.Lock()  # Titles come from the monitor thread, the rest from the GUI
+        self.file = open(trace_file, 'a', encoding='utf-8')
+
+    def attach(self, state_manager, window_monitor):
+        self.state_manager = state_manager
+        state_manager.add_listener(self._on_state_change)
+        window_monitor.trace_recorder = self
+
+    def _write(self, moment, kind, **fields):
+        line = json.dumps(dict(t=moment.isoformat(), kind=kind, **fields), ensure_ascii=False)
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+
+    def _on_state_change(self, change):
+        state_manager = self.state_manager
+        now = state_manager.clock.now()
+        if change == CHANGE_STATE:
+            self._write(now, TRACE_STATE, state=state_manager.get_current_state())
+        elif change == CHANGE_TAG:
+            self._write(now, TRACE_TAG, tag=state_manager.get_current_tag())
+        elif change == CHANGE_NOTE:
+            self._write(now, TRACE_NOTE, note=state_manager.get_note())
+        elif change == CHANGE_WORK_STATUS:
+            self._write(now, TRACE_WORK_STATUS, status=state_manager.get_work_status(),
+                        reason=state_manager.get_break_reason())
+
+    def record_title(self, moment, title, window_info=None, initial=False):
+        """Called by the monitor for the window at the start of monitoring and on every switch"""
+        fields = {"title": title}
+        if window_info:
+            fields.update(window_info._asdict())
+        if initial:
+            fields["initial"] = True
+        self._write(moment, TRACE_TITLE, **fields)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def read_trace(trace_file):
+    """Yield trace events as dicts, with 't' parsed to a datetime"""
+    with open(trace_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue  # Blank or partially written last line
+            event["t"] = datetime.datetime.fromisoformat(event["t"])
+            yield event
+
+
+def _window_info(event):
+    """WindowInfo of a title event (None in traces without window metadata)"""
+    if "pid" not in event:
+        return None
+    return WindowInfo(event["pid"], event["exe_name"], event["window_class"])
+
+
+class ReplayWindowMonitor(WindowMonitor):
+    """Monitor whose windows come from a trace; the replayer applies switches synchronously"""
+
+    def __init__(self, clock):
+        super().__init__(clock)
+        self.next_title = None  # Window active when monitoring (re)starts
+        self.next_window_info = None
+
+    def _get_active_window_title(self):
+        self.sampled_window_info = self.next_window_info
+        return self.next_title
+
+    def _monitor_loop(self, stop_event):
+        pass  # No polling: TraceReplayer calls _handle_sample for each recorded switch
+
+
+class TraceReplayer:
+    """Replays a trace into fresh log, session and unique-window files in output_dir"""
+
+    def __init__(self, trace_file, output_dir):
+        self.trace_file = trace_file
+        self.output_dir = output_dir
+
+    def _output_path(self, name):
+        return os.path.join(self.output_dir, name)
+
+    def run(self, quiet=True):
+        """Replay the whole trace; returns counts and the replayed vs. wall-clock duration"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        # Replays always start from scratch, so two replays of a trace give identical files
+        for name in REPLAY_OUTPUT_FILES + ("tags.json", "tags.journal"):
+            if os.path.exists(self._output_path(name)):
+                os.remove(self._output_path(name))
+
+        stats = {"events": 0, "virtual_seconds": 0, "wall_seconds": 0}
+        events = read_trace(self.trace_file)
+        event = next(events, None)
+        if event is None:
+            return stats
+
+        started = time.perf_counter()
+        clock = VirtualClock(event["t"])
+        output = open(os.devnull, 'w') if quiet else None
+        # The DataLogger and StateManager print every change; replays would mostly measure the console
+        with contextlib.redirect_stdout(output) if quiet else contextlib.nullcontext():
+            self.state_manager = StateManager(clock, tags_file=self._output_path("tags.json"))
+            self.data_logger = DataLogger(upload_url=None, search_index=False,
+                                          log_file=self._output_path(LOG_FILE),
+                                          unique_windows_file=self._output_path(UNIQUE_WINDOWS_FILE),
+                                          sessions_file=self._output_path(SESSIONS_FILE),
+                                          retention_days=None)
+            self.monitor = ReplayWindowMonitor(clock)
+            first_time = event["t"]
+            while event is not None:
+                following = next(events, None)
+                # The monitor records the initial window just after the state change that starts it
+                if event["kind"] == TRACE_STATE and following and following["kind"] == TRACE_TITLE \
+                        and following.get("initial"):
+                    self._set_next_window(following)
+                    stats["events"] += 1
+                    following = next(events, None)
+                clock.set(event["t"])
+                self._apply(event)
+                stats["events"] += 1
+                event = following
+
+            # Like closing the GUI: the last window is logged and its session closed even if
+            # tracking was never stopped
+            self.state_manager.shutdown(self.monitor)
+            self.monitor.close()
+            self.data_logger.close()
+        if output:
+            output.close()
+
+        stats["virtual_seconds"] = (clock.now() - first_time).total_seconds()
+        stats["wall_seconds"] = time.perf_counter() - started
+        return stats
+
+    def _set_next_window(self, event):
+        self.monitor.next_title = event["title"]
+        self.monitor.next_window_info = _window_info(event)
+
+    def _apply(self, event):
+        kind = event["kind"]
+        state_manager = self.state_manager
+        if kind == TRACE_TITLE:
+            if event.get("initial") or not self.monitor.monitoring_active:
+                self._set_next_window(event)
+            else:
+                self.monitor._handle_sample(event["title"], event["t"], _window_info(event))
+        elif kind == TRACE_STATE:
+            state_manager.set_state(event["state"], self.data_logger, self.monitor)
+        elif kind == TRACE_TAG:
+            tag = event["tag"]
+            if tag and tag not in state_manager.tag_tree:
+                state_manager.add_tag(tag)
+            state_manager.set_tag(tag)
+        elif kind == TRACE_NOTE:
+            state_manager.set_note(event["note"])
+        elif kind == TRACE_WORK_STATUS:
+            state_manager.set_work_status(event["status"], event["reason"])
+
+
+def compare_outputs(dir_a, dir_b):
+    """Return a list of differences between the replay outputs in two directories (empty if identical)"""
+    differences = []
+    for name in REPLAY_OUTPUT_FILES:
+        path_a, path_b = os.path.join(dir_a, name), os.path.join(dir_b, name)
+        if not os.path.exists(path_a) or not os.path.exists(path_b):
+            if os.path.exists(path_a) != os.path.exists(path_b):
+                differences.append(f"{name}: only in {dir_a if os.path.exists(path_a) else dir_b}")
+            continue
+        if filecmp.cmp(path_a, path_b, shallow=False):
+            continue
+        with open(path_a, 'rb') as fa, open(path_b, 'rb') as fb:
+            for line_number, (line_a, line_b) in enumerate(zip(fa, fb), start=1):
+                if line_a != line_b:
+                    differences.append(f"{name}: first difference at line {line_number}")
+                    break
+            else:
+                differences.append(f"{name}: one file is a prefix of the other")
+    return differences
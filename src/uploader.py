@@ -0,0 +1,161 @@
+import getpass
+import gzip
+import json
+import os
+import re
+import socket
+import threading
+import uuid
+import urllib.error
+import urllib.request
+from .constants import UPLOAD_SPOOL_DIR, UPLOAD_BATCH_SIZE, UPLOAD_FLUSH_INTERVAL
+
+# Retry backoff bounds when the server is unreachable
+MIN_RETRY_SECONDS = 1
+MAX_RETRY_SECONDS = 60
+REQUEST_TIMEOUT_SECONDS = 10
+
+
+def default_client_id():
+    """Stable per-workstation id: host name plus user name, restricted to safe characters"""
+    try:
+        user = getpass.getuser()
+    except Exception:
+        user = "user"
+    return re.sub(r"[^A-Za-z0-9._-]", "_", f"{socket.gethostname()}-{user}")[:64]
+
+
+class BatchUploader:
+    """Ships logged rows to the aggregation server in compressed, numbered batches.
+
+    enqueue() only appends to an in-memory buffer, so the monitor thread never waits
+    on the network. A background thread writes each batch to the spool directory
+    first and then sends spooled batches in sequence order, deleting them once the
+    server stored them (now or on an earlier attempt). Anything still spooled is
+    retried after a restart.
+
+    Sequence numbers count within an epoch, a random id created with the spool. If
+    the spool is lost, numbering restarts at 1 in a new epoch, so the server can't
+    mistake the new batches for ones it already has.
+    """
+
+    def __init__(self, url, client_id=None, spool_dir=UPLOAD_SPOOL_DIR,
+                 batch_size=UPLOAD_BATCH_SIZE, flush_interval=UPLOAD_FLUSH_INTERVAL):
+        self.url = url.rstrip("/") + "/ingest"
+        self.client_id = client_id or default_client_id()
+        self.spool_dir = spool_dir
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        os.makedirs(self.spool_dir, exist_ok=True)
+
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._next_seq = self._load_next_seq()
+        self.epoch = self._load_epoch()
+        self._retry_delay = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def enqueue(self, row):
+        """Queue one row (a dict keyed by LOG_COLUMNS); never blocks on I/O"""
+        with self._lock:
+            self._pending.append(row)
+            if len(self._pending) >= self.batch_size:
+                self._wakeup.set()
+
+    def stop(self, timeout=2):
+        """Spool whatever is still buffered and make a last, bounded attempt to send it"""
+        self._stop_event.set()
+        self._wakeup.set()
+        self.thread.join(timeout=timeout)
+
+    # --- Background thread ---
+
+    def _seq_path(self):
+        return os.path.join(self.spool_dir, "next_seq")
+
+    def _load_next_seq(self):
+        try:
+            with open(self._seq_path(), 'r') as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return 1
+
+    def _load_epoch(self):
+        path = os.path.join(self.spool_dir, "epoch")
+        try:
+            with open(path, 'r') as f:
+                epoch = f.read().strip()
+            if epoch:
+                return epoch
+        except OSError:
+            pass
+        epoch = uuid.uuid4().hex
+        with open(path + ".tmp", 'w') as f:
+            f.write(epoch)
+        os.replace(path + ".tmp", path)
+        return epoch
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wakeup.wait(self._retry_delay or self.flush_interval)
+            self._wakeup.clear()
+            self._spool_pending()
+            self._send_spooled()
+        # Final flush on shutdown
+        self._spool_pending()
+        self._send_spooled()
+
+    def _spool_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for i in range(0, len(pending), self.batch_size):
+            seq = self._next_seq
+            batch = {"client_id": self.client_id, "epoch": self.epoch, "batch_seq": seq,
+                     "rows": pending[i:i + self.batch_size]}
+            path = os.path.join(self.spool_dir, f"{seq:012d}.json.gz")
+            with gzip.open(path + ".tmp", 'wt', encoding='utf-8') as f:
+                json.dump(batch, f)
+            os.replace(path + ".tmp", path)
+            self._next_seq = seq + 1
+            with open(self._seq_path() + ".tmp", 'w') as f:
+                f.write(str(self._next_seq))
+            os.replace(self._seq_path() + ".tmp", self._seq_path())
+
+    def _send_spooled(self):
+        for name in sorted(os.listdir(self.spool_dir)):
+            if not name.endswith(".json.gz"):
+                continue
+            path = os.path.join(self.spool_dir, name)
+            with open(path, 'rb') as f:
+                body = f.read()
+            request = urllib.request.Request(self.url, data=body, method="POST", headers={
+                "Content-Type": "application/json",
+                "Content-Encoding": "gzip",
+            })
+            try:
+                with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT_SECONDS) as response:
+                    reply = json.loads(response.read())
+            except urllib.error.HTTPError as e:
+                if 400 <= e.code < 500:
+                    # The server will never accept this batch; set it aside instead of retrying forever
+                    print(f"Upload of {name} rejected ({e.code}); moved aside as .rejected")
+                    os.replace(path, path + ".rejected")
+                    continue
+                self._retry_delay = min(MAX_RETRY_SECONDS, max(MIN_RETRY_SECONDS, self._retry_delay * 2))
+                print(f"Upload failed ({e}); {name} stays spooled, retrying in {self._retry_delay}s")
+                return
+            except (urllib.error.URLError, OSError, ValueError) as e:
+                # Keep the batch spooled and back off exponentially
+                self._retry_delay = min(MAX_RETRY_SECONDS, max(MIN_RETRY_SECONDS, self._retry_delay * 2))
+                print(f"Upload failed ({e}); {name} stays spooled, retrying in {self._retry_delay}s")
+                return
+            if not (reply.get("accepted") or reply.get("duplicate")):
+                # Only delete what the server has; anything else is retried
+                self._retry_delay = min(MAX_RETRY_SECONDS, max(MIN_RETRY_SECONDS, self._retry_delay * 2))
+                print(f"Upload of {name} not accepted ({reply}); it stays spooled, retrying in {self._retry_delay}s")
+                return
+            os.remove(path)
+            self._retry_delay = 0
@@ -0,0 +1,100 @@
+"""Owning process and window class of the active window.
+
+Titles alone are ambiguous ("Untitled", the same document open in two apps), so
+each segment also records the process id, executable name and window class. The
+lookups need a few system calls per window, so results are cached by window
+handle and process id: the samples of an unchanged window cost a dict lookup.
+"""
+import collections
+import ntpath
+import sys
+
+WindowInfo = collections.namedtuple("WindowInfo", ["pid", "exe_name", "window_class"])
+
+# Entries kept per cache; both are cleared when full (windows and processes come and go)
+MAX_CACHED_WINDOWS = 1024
+
+PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+
+
+class _Win32Backend:
+    """GetWindowThreadProcessId / GetClassNameW / QueryFullProcessImageNameW through ctypes"""
+
+    def __init__(self):
+        import ctypes
+        from ctypes import wintypes
+        self.ctypes = ctypes
+        self.wintypes = wintypes
+        self.user32 = ctypes.WinDLL("user32", use_last_error=True)
+        self.kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+        self.user32.GetWindowThreadProcessId.argtypes = [wintypes.HWND, ctypes.POINTER(wintypes.DWORD)]
+        self.user32.GetWindowThreadProcessId.restype = wintypes.DWORD
+        self.user32.GetClassNameW.argtypes = [wintypes.HWND, wintypes.LPWSTR, ctypes.c_int]
+        self.kernel32.OpenProcess.argtypes = [wintypes.DWORD, wintypes.BOOL, wintypes.DWORD]
+        self.kernel32.OpenProcess.restype = wintypes.HANDLE
+        self.kernel32.QueryFullProcessImageNameW.argtypes = [
+            wintypes.HANDLE, wintypes.DWORD, wintypes.LPWSTR, ctypes.POINTER(wintypes.DWORD)]
+        self.kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+
+    def window_pid_and_class(self, handle):
+        pid = self.wintypes.DWORD()
+        self.user32.GetWindowThreadProcessId(handle, self.ctypes.byref(pid))
+        buffer = self.ctypes.create_unicode_buffer(256)
+        self.user32.GetClassNameW(handle, buffer, len(buffer))
+        return pid.value, buffer.value
+
+    def exe_name(self, pid):
+        process = self.kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not process:
+            return ""  # e.g. an elevated process we may not query
+        try:
+            buffer = self.ctypes.create_unicode_buffer(1024)
+            size = self.wintypes.DWORD(len(buffer))
+            if self.kernel32.QueryFullProcessImageNameW(process, 0, buffer, self.ctypes.byref(size)):
+                return ntpath.basename(buffer.value)
+            return ""
+        finally:
+            self.kernel32.CloseHandle(process)
+
+
+def _default_backend():
+    # pygetwindow windows only expose a native handle we can query on Windows
+    if sys.platform == "win32":
+        try:
+            return _Win32Backend()
+        except (OSError, AttributeError) as e:
+            print(f"Window metadata unavailable: {e}")
+    return None
+
+
+class WindowInfoLookup:
+    """Cached WindowInfo for pygetwindow windows (None where the platform gives no handle)"""
+
+    def __init__(self, backend=None):
+        self.backend = backend or _default_backend()
+        self.by_window = {}  # window handle -> WindowInfo
+        self.exe_by_pid = {}
+
+    def lookup(self, window):
+        handle = getattr(window, "_hWnd", None)
+        if handle is None or self.backend is None:
+            return None
+        info = self.by_window.get(handle)
+        if info is not None:
+            return info
+        try:
+            pid, window_class = self.backend.window_pid_and_class(handle)
+            exe_name = self.exe_by_pid.get(pid)
+            if exe_name is None:
+                exe_name = self.backend.exe_name(pid)
+                if len(self.exe_by_pid) >= MAX_CACHED_WINDOWS:
+                    self.exe_by_pid.clear()
+                self.exe_by_pid[pid] = exe_name
+        except Exception as e:
+            print(f"Error getting window metadata: {e}")
+            return None
+        info = WindowInfo(pid, exe_name, window_class)
+        if len(self.by_window) >= MAX_CACHED_WINDOWS:
+            self.by_window.clear()
+        self.by_window[handle] = info
+        return info
@@ -1,139 +1,286 @@
-import datetime
+import contextlib
 import threading
-import time
-import pygetwindow as gw
-from .constants import STATE_TRACKING
+try:
+    import pygetwindow as gw
+except (ImportError, NotImplementedError):
+    # Missing or unsupported on this platform: every sample reports an error window.
+    # Replaying recorded traces (trace_replay.py) doesn't need it.
+    gw = None
+from .constants import STATE_TRACKING, EVENT_POLICY_COALESCE
+from .clock import SYSTEM_CLOCK
+from .window_info import WindowInfoLookup
+from .event_bus import EventBus, WindowChanged, SegmentClosed
 
 class WindowMonitor:
-    def __init__(self):
+    def __init__(self, clock=SYSTEM_CLOCK, event_bus=None):
+        # Source of the current time; a VirtualClock when replaying a recorded trace
+        self.clock = clock
         self.current_window_title = None
         self.current_window_start_time = None
+        # Process id, executable and window class (a WindowInfo) of the current window, if known
+        self.current_window_info = None
+        self.window_info = WindowInfoLookup()
+        self.sampled_window_info = None  # WindowInfo of the last _get_active_window_title() sample
         self.monitoring_active = False
         self.thread = None
+        # Set to stop the current monitoring run; each run gets a fresh event (see start_monitoring)
         self.stop_event = threading.Event()
+        # Serializes samples from the monitor thread with start/stop on the GUI thread
+        self._segment_lock = threading.Lock()
+        # Events of a segment change are published after _segment_lock is released; this
+        # lock, taken before that, keeps them in the order of the changes
+        self._publish_lock = threading.Lock()
+        self._queued_events = []
         self.state_manager_ref = None
         self.data_logger_ref = None
+        # WindowChanged and SegmentClosed events are published here, at the same segment
+        # boundaries that get logged; subscribers run on their own threads, never on the sampling thread
+        self._owns_event_bus = event_bus is None
+        self.event_bus = event_bus or EventBus()
+        # Objects with open_segment(title, tag, start) / close_segment(start, end, title, tag),
+        # e.g. LiveStats, each fed by its own event bus subscription, and optionally resync()
+        # to rebuild their state from the log after events were dropped
+        self.segment_listeners = {}
+        # Optional TraceRecorder capturing the window switches applied by this monitor
+        self.trace_recorder = None
+        # Optional Profiler (see profiling.py); the monitor thread checks in with it once per loop
+        self.profiler = None
+
+    def add_segment_listener(self, listener):
+        if listener in self.segment_listeners:
+            return
+        handled_drops = 0
+
+        def deliver(event):
+            nonlocal handled_drops
+            subscription = self.segment_listeners.get(listener)
+            dropped = subscription.dropped if subscription else 0
+            if dropped != handled_drops and hasattr(listener, "resync"):
+                # Closed segments were lost; they are in the log once the writer caught up
+                handled_drops = dropped
+                if self.data_logger_ref:
+                    self.data_logger_ref.flush()
+                listener.resync()
+            if isinstance(event, SegmentClosed):
+                listener.close_segment(event.start, event.end, event.title, event.tag)
+            else:
+                listener.open_segment(event.title, event.tag, event.time)
+
+        # Sampling never waits for a listener: only the latest WindowChanged matters, and when
+        # the queue overflows anyway the listener is resynced from the log
+        self.segment_listeners[listener] = self.event_bus.subscribe(
+            deliver, (WindowChanged, SegmentClosed), policy=EVENT_POLICY_COALESCE,
+            coalesce_key=lambda event: WindowChanged if isinstance(event, WindowChanged) else id(event),
+            name=type(listener).__name__)
+
+    @contextlib.contextmanager
+    def _segment_update(self):
+        """Hold _segment_lock while the current segment changes, then publish its events without it"""
+        with self._segment_lock:
+            self._queued_events = []
+            yield
+            events = self._queued_events
+            self._publish_lock.acquire()
+        try:
+            for event in events:
+                self.event_bus.publish(event)
+        finally:
+            self._publish_lock.release()
+
+    def _notify_segment_opened(self, title, start_time):
+        # Unknown/error windows are never logged, so they don't open a segment either
+        if title in ["Unknown Window", "Error getting active window."]:
+            title = None
+        tag = (self.state_manager_ref.get_current_tag() if self.state_manager_ref else None) or "No Tag"
+        self._queued_events.append(WindowChanged(start_time, title, tag, self.current_window_info if title else None))
+
+    def _notify_segment_closed(self, start_time, end_time, title, tag):
+        session_id = self.state_manager_ref.get_session_id() if self.state_manager_ref else None
+        self._queued_events.append(
+            SegmentClosed(start_time, end_time, title, tag, session_id, self.current_window_info))
 
     def _get_active_window_title(self):
+        self.sampled_window_info = None
         try:
+            if gw is None:
+                raise RuntimeError("pygetwindow is not available on this platform")
             active_window = gw.getActiveWindow()
             if active_window:
                 if active_window.title == "Window Monitor": # Title of our GUI
                     return None # Special value to ignore this window
+                self.sampled_window_info = self.window_info.lookup(active_window)
                 return active_window.title
             return "Unknown Window" # Consistent name for no active window
         except Exception as e:
             print(f"Error getting active window title: {e}")
             return "Error getting active window."
 
-    def _monitor_loop(self):
-        while not self.stop_event.is_set():
+    def _monitor_loop(self, stop_event):
+        while not stop_event.is_set():
             if not self.state_manager_ref or self.state_manager_ref.get_current_state() != STATE_TRACKING:
                 break # Exit loop if state is no longer active work or refs are gone
 
             active_title_from_os = self._get_active_window_title() # This might be None for "Window Monitor"
-            now = datetime.datetime.now()
+            self._handle_sample(active_title_from_os, self.clock.now(), self.sampled_window_info, stop_event)
+            if self.profiler:
+                self.profiler.checkpoint()
+            self.clock.wait(stop_event, 1) # Check every second; stop_monitoring wakes us up early
+        if self.profiler:
+            self.profiler.checkpoint(exiting=True)
 
-            # If the active window is our GUI ("Window Monitor", which returns None),
-            # effectively ignore it and continue. The current_window_title and start_time remain unchanged.
-            if active_title_from_os is None:
-                time.sleep(1)
-                continue
+    def _handle_sample(self, active_title_from_os, now, window_info=None, stop_event=None):
+        """Apply one sample of the active window taken at `now`, logging the previous window on a switch.
 
-            # If we are here, active_title_from_os is not our GUI.
-            # It could be a trackable window, or "Unknown Window", "Error getting active window."
+        Samples of a monitoring run that was stopped in the meantime (its stop_event is set) are dropped.
+        """
+        with self._segment_update():
+            if stop_event is not None and stop_event.is_set():
+                return
+            self._apply_sample(active_title_from_os, now, window_info)
 
-            if active_title_from_os != self.current_window_title:
-                # A change has occurred (or it's the first valid window).
-                
-                # Log previous window's activity if it was a valid, trackable window.
-                if self.current_window_title and \
-                   self.current_window_title not in ["Unknown Window", "Error getting active window."] and \
-                   self.data_logger_ref and self.state_manager_ref: # Ensure refs are valid
-                    # Get work status and break reason before logging
-                    work_status = self.state_manager_ref.get_work_status()
-                    break_reason = self.state_manager_ref.get_break_reason()
-                    
-                    self.data_logger_ref.log_window_activity(
-                        self.current_window_start_time,
-                        now, # End time is current time
-                        self.current_window_title,
-                        self.state_manager_ref.get_current_tag() or "No Tag", # Use the current tag
-                        self.state_manager_ref.get_note(),
-                        work_status,
-                        break_reason
-                    )
-                    
-                    # Reset work status and break reason if they were 'break' or 'finished'
-                    if work_status in ['break', 'finished']:
-                        self.state_manager_ref.set_work_status('tracking')
+    def _apply_sample(self, active_title_from_os, now, window_info):
+        # If the active window is our GUI ("Window Monitor", which returns None),
+        # effectively ignore it and continue. The current_window_title and start_time remain unchanged.
+        if active_title_from_os is None:
+            return
+
+        # If we are here, active_title_from_os is not our GUI.
+        # It could be a trackable window, or "Unknown Window", "Error getting active window."
+
+        # Windows of different applications can share a title ("Untitled"), so the owner counts too
+        if (active_title_from_os, window_info) != (self.current_window_title, self.current_window_info):
+            # A change has occurred (or it's the first valid window).
+            if self.trace_recorder:
+                self.trace_recorder.record_title(now, active_title_from_os, window_info)
+            
+            # Log previous window's activity if it was a valid, trackable window.
+            if self.current_window_title and \
+               self.current_window_title not in ["Unknown Window", "Error getting active window."] and \
+               self.data_logger_ref and self.state_manager_ref: # Ensure refs are valid
+                # Get work status and break reason before logging
+                tag = self.state_manager_ref.get_current_tag() or "No Tag" # Use the current tag
                 
-                # Now, set the new window as current.
-                # If active_title_from_os is "Unknown Window" or "Error getting active window.",
-                # it will become the current_window_title. These are not logged when they *start*,
-                # only when a *trackable* window *ends*.
-                self.current_window_title = active_title_from_os
-                self.current_window_start_time = now 
+                # Note, tag and work status are stored once in the session record
+                self.data_logger_ref.log_window_activity(
+                    self.current_window_start_time,
+                    now, # End time is current time
+                    self.current_window_title,
+                    self.state_manager_ref.get_session_id(),
+                    self.current_window_info
+                )
+                self._notify_segment_closed(self.current_window_start_time, now, self.current_window_title, tag)
             
-            time.sleep(1) # Check every second
+            # Now, set the new window as current.
+            # If active_title_from_os is "Unknown Window" or "Error getting active window.",
+            # it will become the current_window_title. These are not logged when they *start*,
+            # only when a *trackable* window *ends*.
+            self.current_window_title = active_title_from_os
+            self.current_window_info = window_info
+            self.current_window_start_time = now 
+            self._notify_segment_opened(self.current_window_title, now)
 
-    def start_monitoring(self, state_manager, data_logger):
+    def start_monitoring(self, state_manager, data_logger, start_time=None):
+        """Start a monitoring run whose first segment starts at start_time (default: now)"""
         if not self.monitoring_active:
-            self.monitoring_active = True
-            self.stop_event.clear()
-            self.state_manager_ref = state_manager
-            self.data_logger_ref = data_logger
-            self.current_window_title = self._get_active_window_title() # Might be None
-            self.current_window_start_time = datetime.datetime.now() 
+            initial_title = self._get_active_window_title() # Might be None
+            initial_info = self.sampled_window_info
+            with self._segment_update():
+                self.monitoring_active = True
+                # A thread of a previous run may still be finishing its last sample; it keeps its own (set) event
+                self.stop_event = threading.Event()
+                self.state_manager_ref = state_manager
+                self.data_logger_ref = data_logger
+                self.current_window_title = initial_title
+                self.current_window_info = initial_info
+                self.current_window_start_time = start_time or self.clock.now()
+                if self.trace_recorder:
+                    self.trace_recorder.record_title(self.current_window_start_time, self.current_window_title,
+                                                     self.current_window_info, initial=True)
+                self._notify_segment_opened(self.current_window_title, self.current_window_start_time)
             
             print(f"Window monitoring started. Initial window: {self.current_window_title if self.current_window_title is not None else 'Window Monitor (ignored)'}")
             # No immediate log here. The first valid window will be logged on change or when monitoring stops.
             
-            self.thread = threading.Thread(target=self._monitor_loop, daemon=True)
+            self.thread = threading.Thread(target=self._monitor_loop, args=(self.stop_event,), daemon=True)
             self.thread.start()
 
-    def stop_monitoring(self):
+    def stop_monitoring(self, end_time=None):
+        """Stop the current run, closing its last segment at end_time (default: now).
+
+        The monitor thread is only woken up, not waited for: once the stop event is set it
+        can no longer log anything, so the GUI thread never blocks on a sample in progress.
+        """
         if self.monitoring_active:
-            self.monitoring_active = False
-            self.stop_event.set()
-            if self.thread and self.thread.is_alive(): # Check if alive before join
-                self.thread.join(timeout=2)
+            end_time = end_time or self.clock.now()
+            with self._segment_update():
+                self.monitoring_active = False
+                self.stop_event.set()
 
-            # Log the last active window before stopping, if it was a valid one.
-            # This is the single point of logging for the final segment of a monitored window.
-            if self.current_window_title and \
-               self.current_window_start_time and \
-               self.current_window_title not in ["Unknown Window", "Error getting active window."] and \
-               self.data_logger_ref and self.state_manager_ref:
-                
-                # Check if the state manager confirms we were in STATE_ACTIVE_WORK.
-                # This ensures logging only happens if monitoring is stopped during/from an active work session.
-                if self.state_manager_ref.get_current_state() == STATE_TRACKING:
-                    log_end_time = datetime.datetime.now()
-                    duration = (log_end_time - self.current_window_start_time).total_seconds()
+                # Log the last active window before stopping, if it was a valid one.
+                # This is the single point of logging for the final segment of a monitored window.
+                if self.current_window_title and \
+                   self.current_window_start_time and \
+                   self.current_window_title not in ["Unknown Window", "Error getting active window."] and \
+                   self.data_logger_ref and self.state_manager_ref:
                     
-                    if duration > 0.1: # Minimum duration to log
-                        # Get work status and break reason before logging
-                        work_status = self.state_manager_ref.get_work_status()
-                        break_reason = self.state_manager_ref.get_break_reason()
-                        
-                        self.data_logger_ref.log_window_activity(
-                            self.current_window_start_time,
-                            log_end_time,
-                            self.current_window_title,
-                            self.state_manager_ref.get_current_tag() or "No Tag", # Use the current tag
-                            self.state_manager_ref.get_note(),
-                            work_status,
-                            break_reason
-                        )
+                    # Check if the state manager confirms we were in STATE_ACTIVE_WORK.
+                    # This ensures logging only happens if monitoring is stopped during/from an active work session.
+                    if self.state_manager_ref.get_current_state() == STATE_TRACKING:
+                        # A switch sampled just after the transition timestamp must not give a negative duration
+                        log_end_time = max(end_time, self.current_window_start_time)
+                        duration = (log_end_time - self.current_window_start_time).total_seconds()
                         
-                        # Reset work status and break reason if they were 'break' or 'finished'
-                        if work_status in ['break', 'finished']:
-                            self.state_manager_ref.set_work_status('tracking')
-            
-            self.current_window_title = None
-            self.current_window_start_time = None
+                        if duration > 0.1: # Minimum duration to log
+                            # Get work status and break reason before logging
+                            tag = self.state_manager_ref.get_current_tag() or "No Tag" # Use the current tag
+                            
+                            # Note, tag and work status are stored once in the session record
+                            self.data_logger_ref.log_window_activity(
+                                self.current_window_start_time,
+                                log_end_time,
+                                self.current_window_title,
+                                self.state_manager_ref.get_session_id(),
+                                self.current_window_info
+                            )
+                            self._notify_segment_closed(self.current_window_start_time, log_end_time, self.current_window_title, tag)
+                
+                self.current_window_title = None
+                self.current_window_info = None
+                self.current_window_start_time = None
+                self._notify_segment_opened(None, end_time)
             # Per original file comments, refs are not cleared here to allow for multiple stop/start cycles.
             # self.state_manager_ref = None 
             # self.data_logger_ref = None
             print("Window monitoring stopped.")
+
+    def split_segment(self, split_time=None):
+        """End the segment in progress at split_time (default: now) and continue the same window in a
+        new segment from there; called before the session changes, so each part is logged with its own session"""
+        if not self.monitoring_active:
+            return
+        split_time = split_time or self.clock.now()
+        with self._segment_update():
+            if not self.current_window_start_time or split_time <= self.current_window_start_time:
+                return
+            if self.current_window_title and \
+               self.current_window_title not in ["Unknown Window", "Error getting active window."] and \
+               self.data_logger_ref and self.state_manager_ref:
+                if (split_time - self.current_window_start_time).total_seconds() > 0.1: # Minimum duration to log
+                    tag = self.state_manager_ref.get_current_tag() or "No Tag"
+                    self.data_logger_ref.log_window_activity(
+                        self.current_window_start_time,
+                        split_time,
+                        self.current_window_title,
+                        self.state_manager_ref.get_session_id(),
+                        self.current_window_info
+                    )
+                    self._notify_segment_closed(self.current_window_start_time, split_time, self.current_window_title, tag)
+            self.current_window_start_time = split_time
+            self._notify_segment_opened(self.current_window_title, split_time)
+
+    def close(self):
+        """Stop monitoring and, if the monitor created its own event bus, deliver its pending events"""
+        if self.monitoring_active:
+            self.stop_monitoring()
+        if self._owns_event_bus:
+            self.event_bus.close()
@@ -0,0 +1,54 @@
+import csv
+import os
+import tempfile
+import unittest
+
+from src.constants import LOG_COLUMNS, SESSION_COLUMNS
+from src.search_index import SearchIndex
+
+
+class SearchIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.log_file = os.path.join(self.dir.name, "window_logs.csv")
+        self.sessions_file = os.path.join(self.dir.name, "sessions.csv")
+        with open(self.log_file, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(LOG_COLUMNS)
+            for start, end, title, session_id in [
+                ("2026-10-19 09:00:00", "2026-10-19 09:20:00", "invoice.pdf - Reader", "1"),
+                ("2026-10-19 09:20:00", "2026-10-19 09:30:00", "Inbox - Mail", "2"),
+                ("2026-10-19 09:30:00", "2026-10-19 09:40:00", "Calendar - Mail", "2"),
+                ("2026-10-19 09:40:00", "2026-10-19 09:50:00", "invoicing rules - Wiki", "3"),
+            ]:
+                writer.writerow([start, end, "600", title, session_id])
+        with open(self.sessions_file, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(SESSION_COLUMNS)
+            writer.writerow(["1", "2026-10-19 09:00:00", "2026-10-19 09:20:00", "Work", "Billing", "tracking", ""])
+            writer.writerow(["2", "2026-10-19 09:20:00", "2026-10-19 09:40:00", "Work", "Mail", "break", "lunch"])
+            writer.writerow(["3", "2026-10-19 09:40:00", "2026-10-19 09:50:00", "Work", "Docs", "tracking", ""])
+        self.index = SearchIndex(os.path.join(self.dir.name, "search_index.db"))
+        self.index.catch_up(self.log_file, self.sessions_file)
+
+    def tearDown(self):
+        self.index.close()
+        self.dir.cleanup()
+
+    def test_fuzzy_search_finds_a_single_letter_typo(self):
+        titles = [result["title"] for result in self.index.search("invoce", fuzzy=True)]
+        self.assertIn("invoice.pdf - Reader", titles)
+        self.assertEqual(self.index.search("invoce"), [])
+
+    def test_better_matches_come_before_newer_ones(self):
+        results = self.index.search("invoice", fuzzy=True)
+        # 'invoicing' shares fewer trigrams with 'invoice' but is the newer segment
+        self.assertEqual([r["title"] for r in results], ["invoice.pdf - Reader", "invoicing rules - Wiki"])
+
+    def test_break_reason_matches_only_the_segment_the_break_began_at(self):
+        results = self.index.search("lunch")
+        self.assertEqual([(r["start"], r["matched"]) for r in results], [("2026-10-19 09:30:00", ["break_reason"])])
+
+
+if __name__ == "__main__":
+    unittest.main()